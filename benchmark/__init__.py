@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+"""
+性能基准测试脚本, 在仓库根目录下以 python -m benchmark.<脚本名> 的方式运行
+"""
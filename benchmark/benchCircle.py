@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+担保圈识别的基准测试: 在含有大规模强连通核心的担保图上运行markRiskOfGuaranteeG
+原递归回溯实现使用列表判重且只从剩余图的第一个节点出发, 核心较大时会超出递归深度
+用法: python -m benchmark.benchCircle --sizes 1000 10000 100000
+"""
+import sys
+import time
+import random
+import argparse
+import networkx as nx
+
+import guarantee
+
+
+def makeCoreG(size, chords=0.2, tails=0.5, seed=0):
+    """
+    生成一个含有强连通核心的担保子图: 一个大环加随机弦, 再挂上若干条担保链
+    Params:
+        size: 强连通核心的节点数
+        chords: 随机弦的数量与核心节点数之比
+        tails: 担保链节点数与核心节点数之比
+        seed: 随机种子
+    Returns:
+        subG: 只含一个子图的列表, 节点属性与guarantee.getInitGuaranteeG的输出一致
+    """
+    rng = random.Random(seed)
+    G = nx.DiGraph()
+    core = ["G%d" % i for i in range(size)]
+    nx.add_cycle(G, core)
+    for _ in range(int(size * chords)):
+        G.add_edge(rng.choice(core), rng.choice(core))
+    for i in range(int(size * tails)):
+        G.add_edge(rng.choice(core), "T%d" % i)
+    nx.set_node_attributes(G, {n: {"guarType": [], "m": 0.0, "std": 0.0} for n in G})
+    nx.set_edge_attributes(G, 1.0, "amount")
+    return [G]
+
+
+def legacyCircleNodes(tmpG):
+    """
+    原递归回溯找环的实现, 仅用于对比
+    """
+    visited, trace, circle = list(), list(), set()
+
+    def dfs2FindCircle(node):
+        if node in visited:
+            if node in trace:
+                i = trace.index(node)
+                if len(trace) - i > 2:
+                    circle.update(trace[i:])
+            return
+        visited.append(node)
+        trace.append(node)
+        for child in list(tmpG.neighbors(node)):
+            dfs2FindCircle(child)
+        trace.pop()
+
+    dfs2FindCircle(list(tmpG.nodes())[0])
+    return circle
+
+
+# 两个三角形之间只由互保关系相连, 中间的D不在任何长度不少于3的简单环上
+bridgeEdges = [
+    ("A", "B"), ("B", "C"), ("C", "A"), ("C", "D"), ("D", "C"),
+    ("D", "E"), ("E", "D"), ("E", "F"), ("F", "G"), ("G", "E"),
+]
+
+
+def exactCircleNodes(G):
+    """
+    枚举全部简单环得到的担保圈节点, 只适用于小图
+    """
+    return {n for cycle in nx.simple_cycles(G) if len(cycle) >= 3 for n in cycle}
+
+
+def checkCircleNodes(trials=2000, maxNodes=10, seed=0):
+    """
+    在bridgeEdges和随机小图上核对findCircleNodes与简单环枚举的结果, 随机图含大量互保关系
+    Returns:
+        mismatch: 结果不一致的图的边列表, 为空表示全部一致
+    """
+    rng = random.Random(seed)
+    graphs = [nx.DiGraph(bridgeEdges)]
+    for _ in range(trials):
+        G = nx.DiGraph()
+        G.add_nodes_from(range(rng.randint(1, maxNodes)))
+        p = rng.random() * 0.5
+        for u in G.nodes:
+            for v in G.nodes:
+                if rng.random() < p:
+                    G.add_edge(u, v)
+                    if rng.random() < 0.6:
+                        G.add_edge(v, u)
+        graphs.append(G)
+    mismatch = list()
+    for G in graphs:
+        if set().union(*guarantee.findCircleNodes(G)) != exactCircleNodes(G):
+            mismatch.append(list(G.edges))
+    return mismatch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="担保圈识别基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="强连通核心的节点数")
+    parser.add_argument("--cycles", type=int, default=5, help="枚举担保圈时的最大环长")
+    parser.add_argument(
+        "--legacy-max", type=int, default=20000,
+        help="核心不超过该规模时, 调高递归深度上限运行原实现作对比"
+    )
+    args = parser.parse_args()
+    mismatch = checkCircleNodes()
+    print("担保圈判定与简单环枚举核对: %s" % ("一致" if not mismatch else "不一致 %s" % mismatch[0]))
+    for size in args.sizes:
+        GList = makeCoreG(size)
+        legacy, legacyTime = "-", "未运行"
+        if size <= args.legacy_max:
+            limit = sys.getrecursionlimit()
+            sys.setrecursionlimit(max(limit, 3 * size))
+            start = time.perf_counter()
+            legacy = len(legacyCircleNodes(GList[0]))
+            legacyTime = "%.3f s" % (time.perf_counter() - start)
+            sys.setrecursionlimit(limit)
+        start = time.perf_counter()
+        guarantee.markRiskOfGuaranteeG(GList)
+        markTime = time.perf_counter() - start
+        marked = sum("Circle" in d["guarType"] for _, d in GList[0].nodes(data=True))
+        start = time.perf_counter()
+        circles = guarantee.enumerateCircles(GList, maxLength=args.cycles, limit=10000)
+        enumTime = time.perf_counter() - start
+        print("核心 %7d: 原实现 %s (担保圈节点 %s), 新实现标记 %.3f s (担保圈节点 %d), 枚举 %d 个环 %.3f s" % (
+            size, legacyTime, legacy, markTime, marked, len(circles), enumTime))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+控制人根节点与交叉持股识别的基准测试, 对比逐轮剥离入度为0节点的原实现与强连通分量实现
+测试数据为链状持股结构: 顶端为交叉持股的环, 下挂一条很长的持股链, 原实现的耗时随链长平方增长
+用法: python -m benchmark.benchControlRoot --depths 500 1000 2000 4000
+"""
+import time
+import argparse
+import networkx as nx
+
+import control
+
+
+def makeChainG(depth, cycle=3, components=1):
+    """
+    生成若干个链状持股子图
+    Params:
+        depth: 每条持股链的长度
+        cycle: 链顶端交叉持股环的节点数
+        components: 子图个数
+    Returns:
+        subG: 子图列表, 节点属性与control.getInitControlG的输出一致
+    """
+    G = nx.DiGraph()
+    for c in range(components):
+        head = ["C%d_%d" % (c, i) for i in range(cycle)]
+        chain = ["N%d_%d" % (c, i) for i in range(depth)]
+        nx.add_cycle(G, head)
+        nx.add_path(G, [head[0]] + chain)
+    nx.set_node_attributes(G, {n: {"isRoot": 0, "isCross": 0, "isControl": 0, "crossId": -1} for n in G})
+    nx.set_edge_attributes(G, 50, "rate")
+    return [G.subgraph(c) for c in nx.weakly_connected_components(G)]
+
+
+def legacyRootOfControlG(subG):
+    """
+    原逐轮剥离的实现, 仅用于对比
+    """
+    for G in subG:
+        flag = False
+        for n in G.nodes:
+            if G.in_degree(n) == 0:
+                G.nodes[n]["isRoot"] = 1
+                flag = True
+                break
+        tmpG = nx.reverse(G) if not flag else nx.DiGraph(G)
+        flag = True
+        while flag:
+            flag = False
+            s = list()
+            for n in tmpG.nodes:
+                if tmpG.in_degree(n) == 0:
+                    s.append(n)
+                    flag = True
+            tmpG.remove_nodes_from(s)
+        if not any(G.nodes[n]["isRoot"] for n in G.nodes):
+            for n in tmpG.nodes:
+                G.nodes[n]["isCross"] = 1
+    return subG
+
+
+def main():
+    parser = argparse.ArgumentParser(description="控制人关系识别基准测试")
+    parser.add_argument("--depths", type=int, nargs="+", default=[500, 1000, 2000, 4000], help="持股链长度")
+    parser.add_argument("--components", type=int, default=1, help="每组测试的子图个数")
+    args = parser.parse_args()
+    for depth in args.depths:
+        legacyG = makeChainG(depth, components=args.components)
+        start = time.perf_counter()
+        legacyRootOfControlG(legacyG)
+        legacyTime = time.perf_counter() - start
+        currentG = makeChainG(depth, components=args.components)
+        start = time.perf_counter()
+        control.getRootOfControlG(currentG)
+        currentTime = time.perf_counter() - start
+        same = all(
+            a.nodes[n]["isCross"] == b.nodes[n]["isCross"] and a.nodes[n]["isRoot"] == b.nodes[n]["isRoot"]
+            for a, b in zip(legacyG, currentG) for n in a.nodes
+        )
+        print("链长 %6d: 逐轮剥离 %.3f s, 强连通分量 %.3f s, 加速比 %.1f, 结果一致: %s" % (
+            depth, legacyTime, currentTime, legacyTime / max(currentTime, 1e-9), same))
+
+
+if __name__ == "__main__":
+    main()
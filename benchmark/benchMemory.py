@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+内存报告: 对比紧凑图(CompactGraph)与networkx图保存同一份数据时的内存占用
+用法: python -m benchmark.benchMemory --preset medium --nodes 1000000
+"""
+import gc
+import argparse
+import tempfile
+import tracemalloc
+
+import control
+import guarantee
+import moneyCollection
+from benchmark import generators
+
+
+def retained(func, *args, **kwargs):
+    """
+    统计函数返回值常驻的内存和调用过程中的内存峰值
+    Returns:
+        (常驻字节数, 峰值字节数, 函数返回值)
+    """
+    gc.collect()
+    tracemalloc.start()
+    ret = func(*args, **kwargs)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, peak, ret
+
+
+def main():
+    parser = argparse.ArgumentParser(description="紧凑图与networkx图的内存对比")
+    generators.addArguments(parser, preset="medium")
+    parser.add_argument("--dir", default=None, help="合成csv的存放目录, 默认为临时目录")
+    args = parser.parse_args()
+
+    workDir = args.dir or tempfile.mkdtemp(prefix="benchMemory_")
+    paths = generators.makeDataset(workDir, generators.paramsFromArgs(args))
+    cases = [
+        ("control", control.getInitControlG),
+        ("guarantee", guarantee.getInitGuaranteeG),
+        ("moneyCollection", moneyCollection.getInitmoneyCollectionG),
+    ]
+    MB = 1024 * 1024
+    for name, load in cases:
+        path = paths[name]
+        compactMem, compactPeak, core = retained(load, path, compact=True)
+        print("[%s] 节点 %d, 边 %d" % (name, core.numberOfNodes(), core.numberOfEdges()))
+        print("[%s] CompactGraph: 常驻 %.1f MB, 峰值 %.1f MB, 估算 %.1f MB" % (
+            name, compactMem / MB, compactPeak / MB, core.nbytes() / MB))
+        del core
+        nxMem, nxPeak, subG = retained(load, path)
+        print("[%s] networkx:     常驻 %.1f MB, 峰值 %.1f MB" % (name, nxMem / MB, nxPeak / MB))
+        print("[%s] 常驻内存之比 networkx / CompactGraph = %.1f" % (name, nxMem / max(compactMem, 1)))
+        del subG
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+按子图并行处理的扩展性测试, 对各阶段分别以1到N个进程运行并核对结果与串行一致
+用法: python -m benchmark.benchParallel --preset medium --workers 1 2 4 8
+"""
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+
+import control
+import moneyCollection
+from benchmark import generators
+
+
+def nodeState(GList, attrs):
+    """
+    收集各子图节点属性, 用于核对并行结果
+    """
+    return [[(n, tuple(str(d[a]) for a in attrs)) for n, d in G.nodes(data=True)] for G in GList]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按子图并行处理的扩展性测试")
+    generators.addArguments(parser, preset="medium")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count()], help="进程数")
+    parser.add_argument("--dir", default=None, help="合成csv的存放目录, 默认为临时目录")
+    args = parser.parse_args()
+
+    workDir = args.dir or tempfile.mkdtemp(prefix="benchParallel_")
+    paths = generators.makeDataset(workDir, generators.paramsFromArgs(args))
+
+    # (阶段名, 读取函数, 阶段函数, 用于核对的节点属性), 其余阶段已向量化, 不再按子图并行
+    stages = [
+        ("control.getRootOfControlG", control.getInitControlG, paths["control"],
+         control.getRootOfControlG, ("isRoot", "isCross", "crossId")),
+        ("moneyCollection.findShellEnterprise", moneyCollection.getInitmoneyCollectionG, paths["moneyCollection"],
+         moneyCollection.findShellEnterprise, ()),
+    ]
+    for name, load, path, stage, attrs in stages:
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            GList = load(path)
+        baseline, baseTime = None, None
+        for workers in args.workers:
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                GList = load(path)
+                start = time.perf_counter()
+                ret = stage(GList, workers=workers)
+                cost = time.perf_counter() - start
+            state = (nodeState(GList, attrs), ret[1] if isinstance(ret, tuple) else None)
+            if baseline is None:
+                baseline, baseTime = state, cost
+            print("%-38s 进程数 %3d: %.2f s, 加速比 %.2f, 结果一致: %s" % (
+                name, workers, cost, baseTime / cost, state == baseline))
+
+
+if __name__ == "__main__":
+    main()
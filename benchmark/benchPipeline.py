@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+流水线基准测试: 用generators按固定参数和种子合成三张表, 运行完整流水线, 由instrument记录每个阶段的耗时、CPU时间和峰值内存,
+结果保存为json, 可与之前保存的结果逐阶段对比以发现性能回退
+同一组参数的合成表保存在--dir下以参数命名的子目录中, 重复运行时直接复用
+用法:
+    python -m benchmark.benchPipeline --preset medium --out ./benchmark/results/medium.json
+    python -m benchmark.benchPipeline --preset medium --compare ./benchmark/results/medium.json
+    python -m benchmark.benchPipeline --preset cycles --nodes 500000 --hub-skew 3 --repeat 3
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+import control
+import guarantee
+import moneyCollection
+import instrument
+from benchmark import generators
+
+tables = ["control", "guarantee", "moneyCollection"]
+answerDirs = ["./answers/control", "./answers/guarantee", "./answers/moneyCollection"]
+
+
+def runPipeline(paths, workers=1, only=tables):
+    """
+    在当前目录下运行与main.py相同的全量流程, 不使用建图缓存
+    Params:
+        paths: 表名 -> csv路径
+        workers: 控制人根节点标记和资金归集路径匹配的并行进程数
+        only: 需要运行的表
+    """
+    if "control" in only:
+        controlG = control.getInitControlG(paths["control"])
+        controlRootG = control.getRootOfControlG(controlG, workers=workers)
+        control.graphs2json(controlRootG)
+        control.ansJson(controlRootG)
+        del controlG, controlRootG
+    if "guarantee" in only:
+        guaranteeG = guarantee.getInitGuaranteeG(paths["guarantee"])
+        guaranteeRiskG = guarantee.markRiskOfGuaranteeG(guaranteeG)
+        guarantee.riskQuantification(guaranteeRiskG)
+        guarantee.graphs2json(guaranteeRiskG)
+        guarantee.ansJson(guaranteeRiskG)
+        del guaranteeG, guaranteeRiskG
+    if "moneyCollection" in only:
+        cut = moneyCollection.getInitmoneyCollectionG(paths["moneyCollection"])
+        se, seNodes = moneyCollection.findShellEnterprise(cut, workers=workers)
+        moneyCollection.getNetIncome(cut)
+        moneyCollection.graphs2json(cut, se, seNodes)
+        moneyCollection.ansJson(seNodes)
+
+
+@contextlib.contextmanager
+def workingDir(path):
+    """
+    临时切换工作目录, 流水线的前端json和答案json均写到该目录下
+    """
+    cwd = os.getcwd()
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    try:
+        for d in answerDirs:
+            os.makedirs(d, exist_ok=True)
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def collect(runs):
+    """
+    汇总多次运行的阶段记录, 墙钟时间和CPU时间取最小值, 峰值内存取最大值
+    Params:
+        runs: 每次运行的instrument.records()
+    Returns:
+        stages: 阶段名 -> 统计, 按首次运行中阶段结束的先后排列
+    """
+    stages = dict()
+    for records in runs:
+        seen = dict()
+        for record in records:
+            # 同一次运行中重名的阶段累加
+            s = seen.setdefault(record["stage"], {"parent": record["parent"], "wall": 0.0, "cpu": 0.0, "peakRss": None})
+            s["wall"] += record["wall"]
+            s["cpu"] += record["cpu"] + record["cpuChildren"]
+            if record["peakRss"] is not None:
+                s["peakRss"] = max(s["peakRss"] or 0, record["peakRss"])
+            for k in ("nodes", "edges", "components"):
+                if k in record:
+                    s[k] = record[k]
+        for name, s in seen.items():
+            total = stages.setdefault(name, dict(s, walls=[]))
+            total["walls"].append(s["wall"])
+            total["wall"] = min(total["wall"], s["wall"])
+            total["cpu"] = min(total["cpu"], s["cpu"])
+            if s["peakRss"] is not None:
+                total["peakRss"] = max(total["peakRss"] or 0, s["peakRss"])
+    return stages
+
+
+def environment():
+    """
+    运行环境信息, 对比不同环境下的结果时作参考
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "networkx": nx.__version__,
+    }
+
+
+def compare(result, baseline, threshold=0.2, minWall=0.05):
+    """
+    逐阶段对比墙钟时间和峰值内存
+    Params:
+        result, baseline: 本次和基线的结果
+        threshold: 墙钟时间或峰值内存超过基线的比例大于该值时视为回退
+        minWall: 基线墙钟时间小于该值(秒)的阶段只显示不判断, 避免计时噪声
+    Returns:
+        regressions: 回退的阶段名列表
+    """
+    if result["params"] != baseline["params"]:
+        print("注意: 生成参数与基线不同, 对比结果仅供参考")
+    MB = 1024 * 1024
+    regressions = list()
+    print("%-36s %10s %10s %8s %10s %10s %8s" % ("阶段", "基线(s)", "本次(s)", "比例", "基线(MB)", "本次(MB)", "比例"))
+    for name, s in result["stages"].items():
+        b = baseline["stages"].get(name)
+        if b is None:
+            print("%-36s %10s %10.3f" % (name, "-", s["wall"]))
+            continue
+        wallRate = s["wall"] / b["wall"] if b["wall"] else float("nan")
+        memRate = s["peakRss"] / b["peakRss"] if s["peakRss"] and b["peakRss"] else float("nan")
+        flag = ""
+        if b["wall"] >= minWall and wallRate > 1 + threshold:
+            flag += " 耗时回退"
+        if memRate > 1 + threshold:
+            flag += " 内存回退"
+        if flag:
+            regressions.append(name)
+        print("%-36s %10.3f %10.3f %8.2f %10s %10s %8.2f%s" % (
+            name, b["wall"], s["wall"], wallRate,
+            "-" if b["peakRss"] is None else "%.1f" % (b["peakRss"] / MB),
+            "-" if s["peakRss"] is None else "%.1f" % (s["peakRss"] / MB),
+            memRate, flag))
+    for name in baseline["stages"]:
+        if name not in result["stages"]:
+            print("%-36s 本次未运行" % name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成数据上的流水线分阶段基准测试")
+    generators.addArguments(parser)
+    parser.add_argument("--tables", nargs="*", choices=tables, default=tables, help="需要运行的表")
+    parser.add_argument("--workers", type=int, default=1, help="控制人根节点标记和资金归集路径匹配的并行进程数")
+    parser.add_argument("--repeat", type=int, default=1, help="重复运行次数, 墙钟时间取最小值")
+    parser.add_argument("--dir", default=None, help="合成表和运行输出的存放目录, 默认为临时目录")
+    parser.add_argument("--out", default=None, help="保存结果的json路径")
+    parser.add_argument("--compare", default=None, help="作为基线的结果json路径")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定回退的比例")
+    args = parser.parse_args()
+
+    params = generators.paramsFromArgs(args)
+
+    workDir = os.path.abspath(args.dir or tempfile.mkdtemp(prefix="benchPipeline_"))
+    paths = generators.makeDataset(workDir, params)
+    runs = list()
+    for i in range(args.repeat):
+        instrument.enable()
+        with workingDir(os.path.join(workDir, "run")):
+            runPipeline(paths, args.workers, args.tables)
+        instrument.disable()
+        runs.append(instrument.records())
+        print("第%d次运行:" % (i + 1))
+        instrument.summary()
+
+    result = {"params": params, "tables": args.tables, "repeat": args.repeat, "env": environment(),
+              "stages": collect(runs)}
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print("结果已保存: %s" % args.out)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print("%d个阶段回退: %s" % (len(regressions), ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+资金归集三元组匹配的基准测试: 生成带有枢纽账户的交易图, 每个枢纽有大量贷款入边和转账出边
+对比原贷款×转账嵌套循环与按日期排序后二分查找的实现
+用法: python -m benchmark.benchShell --hub-edges 2000 10000 20000 --legacy-max 2000
+"""
+import time
+import random
+import argparse
+import networkx as nx
+
+import moneyCollection
+from moneyCollection import txn, loan
+
+
+def makeHubG(hubs, hubEdges, seed=0):
+    """
+    生成枢纽账户交易图
+    Params:
+        hubs: 枢纽账户数
+        hubEdges: 每个枢纽的贷款入边数和转账出边数
+        seed: 随机种子
+    Returns:
+        GList: 每个枢纽一个子图
+    """
+    rng = random.Random(seed)
+    GList = list()
+    for h in range(hubs):
+        G = nx.MultiDiGraph()
+        hub = "H%d" % h
+        for i in range(hubEdges):
+            amount = rng.uniform(1e5, 1e7)
+            date = 20200901 + rng.randrange(30)
+            G.add_edge("L%d_%d" % (h, rng.randrange(hubEdges // 4 + 1)), hub, txnAmount=amount,
+                       txnDateTime=date, isLoan=1, txnCode="6101", width=amount ** 0.5 / 1800)
+            amount = amount * rng.uniform(0.85, 1.02)
+            date = date + rng.randrange(-2, 8)
+            G.add_edge(hub, "T%d_%d" % (h, rng.randrange(hubEdges // 4 + 1)), txnAmount=amount,
+                       txnDateTime=date, isLoan=0, txnCode="EK95", width=amount ** 0.5 / 1800)
+        nx.set_node_attributes(G, 0, "netIncome")
+        nx.set_node_attributes(G, 0, "std")
+        GList.append(G)
+    return GList
+
+
+def legacyMatch(subG):
+    """
+    原嵌套循环的匹配实现, 仅用于对比
+    """
+    matches = list()
+    for n in subG.nodes():
+        children = list(subG.neighbors(n))
+        father = list(subG.predecessors(n))
+        if not father or not children:
+            continue
+        for f in father:
+            for k1 in subG[f][n]:
+                if subG[f][n][k1]["isLoan"] == txn["isLoan"]:
+                    continue
+                bestC, bestK2, bestRate = "", None, 0.9
+                for c in children:
+                    for k2 in subG[n][c]:
+                        if subG[n][c][k2]["isLoan"] == loan["isLoan"]:
+                            continue
+                        rate = subG[n][c][k2]["txnAmount"] / subG[f][n][k1]["txnAmount"]
+                        if (
+                            subG[n][c][k2]["txnDateTime"] - subG[f][n][k1]["txnDateTime"] <= 5
+                            and subG[n][c][k2]["txnDateTime"] >= subG[f][n][k1]["txnDateTime"]
+                            and rate >= bestRate
+                            and rate <= 1
+                        ):
+                            bestC, bestK2, bestRate = c, k2, rate
+                if bestC:
+                    matches.append(((f, n, bestC), (dict(subG[f][n][k1]), dict(subG[n][bestC][bestK2])), bestRate))
+    return matches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="资金归集三元组匹配基准测试")
+    parser.add_argument("--hubs", type=int, default=2, help="枢纽账户数")
+    parser.add_argument("--hub-edges", type=int, nargs="+", default=[2000, 10000, 20000], help="每个枢纽的边数")
+    parser.add_argument("--legacy-max", type=int, default=2000, help="枢纽边数不超过该值时运行原实现作对比")
+    args = parser.parse_args()
+    for hubEdges in args.hub_edges:
+        GList = makeHubG(args.hubs, hubEdges)
+        start = time.perf_counter()
+        matches = [m for G in GList for m in moneyCollection.matchShellOfComponent(G)]
+        currentTime = time.perf_counter() - start
+        legacyInfo = "未运行"
+        if hubEdges <= args.legacy_max:
+            start = time.perf_counter()
+            legacy = [m for G in GList for m in legacyMatch(G)]
+            legacyTime = time.perf_counter() - start
+            legacyInfo = "%.2f s, 结果一致: %s" % (legacyTime, legacy == matches)
+        print("枢纽边数 %6d: 二分查找 %.2f s (三元组 %d), 嵌套循环 %s" % (
+            hubEdges, currentTime, len(matches), legacyInfo))
+
+
+if __name__ == "__main__":
+    main()
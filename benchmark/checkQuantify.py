@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+核对向量化的guarantee.quantifyComponents与原逐子图构建无向图的riskQuantification结果逐位相同
+固定的手工子图含互保(互为反向的两条边)、自环和小数金额, 节点和边按固定顺序加入, 结果不依赖PYTHONHASHSEED
+用法: python -m benchmark.checkQuantify
+"""
+import sys
+import networkx as nx
+
+import graphCore
+import guarantee
+
+
+# (子图的边列表), 每条边为(担保人, 被担保人, 担保金额)
+fixtureEdges = [
+    # 互保金额不同, 无向图保留邻接表中靠后的一条
+    [("A", "B", 100.0), ("B", "A", 300.0), ("B", "C", 50.0), ("C", "A", 70.0)],
+    # 只有一条边, 两端m相同, std取15
+    [("D", "E", 10.0)],
+    # 自环与互保
+    [("F", "F", 5.0), ("F", "G", 20.0), ("H", "F", 30.0), ("G", "H", 25.0), ("H", "G", 40.0)],
+    # 小数金额, 累加顺序不同时结果会有舍入差异
+    [("I", "J", 0.1), ("J", "K", 0.2), ("K", "I", 0.3), ("I", "K", 0.7), ("L", "I", 1e-3), ("J", "L", 1e16)],
+]
+
+
+def makeFixture():
+    """
+    Returns:
+        G: 由fixtureEdges构成的担保关系图, 节点属性与guarantee.getInitGuaranteeG的输出一致
+    """
+    G = nx.DiGraph()
+    for edges in fixtureEdges:
+        for u, v, amount in edges:
+            G.add_edge(u, v, amount=amount)
+    nx.set_node_attributes(G, {n: {"guarType": [], "m": 0.0, "std": 0.0} for n in G})
+    return G
+
+
+def splitFixture(G, views):
+    """
+    按fixtureEdges切分子图
+    Params:
+        views: 为True时得到与graphCache.splitComponents相同的ComponentList, 否则为互相独立的子图副本
+    """
+    parts = [list(dict.fromkeys(n for u, v, _ in edges for n in (u, v))) for edges in fixtureEdges]
+    if views:
+        return graphCore.ComponentList([G.subgraph(part) for part in parts], G)
+    return [G.subgraph(part).copy() for part in parts]
+
+
+def legacyQuantification(subG):
+    """
+    原逐子图构建无向图的实现, 仅用于对比
+    """
+    for G in subG:
+        de = dict()
+        tmpG = nx.Graph(G)
+        txnAllSum = sum(nx.get_edge_attributes(tmpG, "amount").values())
+        for n in tmpG.nodes():
+            neighbors = tmpG.adj[n].keys()
+            de[n] = sum(tmpG[n][neighbor]["amount"] / txnAllSum for neighbor in neighbors)
+            G.nodes[n]["m"] = de[n]
+        maxM, minM = max(de.values()), min(de.values())
+        if maxM == minM:
+            for n in G.nodes():
+                G.nodes[n]["std"] = 15
+        else:
+            k = 20 / (maxM - minM)
+            for n in G.nodes():
+                G.nodes[n]["std"] = 5 + k * (G.nodes[n]["m"] - minM)
+
+
+def scores(GList):
+    return {n: (d["m"], d["std"]) for G in GList for n, d in G.nodes(data=True)}
+
+
+def checkQuantify():
+    """
+    Returns:
+        mismatch: (切分方式, 节点, 原实现结果, 新实现结果)的列表, 为空表示全部逐位相同
+    """
+    legacy = splitFixture(makeFixture(), views=False)
+    legacyQuantification(legacy)
+    expected = scores(legacy)
+    mismatch = list()
+    for views in (False, True):
+        GList = splitFixture(makeFixture(), views)
+        guarantee.quantifyComponents(GList)
+        for n, got in scores(GList).items():
+            if got != expected[n]:
+                mismatch.append(("ComponentList" if views else "list", n, expected[n], got))
+    return mismatch
+
+
+def main():
+    mismatch = checkQuantify()
+    for item in mismatch:
+        print("%s 节点%s: 原实现 %r, 新实现 %r" % item)
+    print("quantifyComponents与原实现核对: %s" % ("逐位相同" if not mismatch else "%d处不一致" % len(mismatch)))
+    sys.exit(1 if mismatch else 0)
+
+
+if __name__ == "__main__":
+    main()
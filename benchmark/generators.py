@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+合成企业关联图生成器, 输出与三个读取函数的csv列布局完全一致的表格
+图按子图逐个生成, 可调节:
+    规模: 节点数nodes, 额外边与节点数之比extraEdges
+    子图规模分布: sizeDist为fixed/uniform/powerlaw, 配合minSize、maxSize、alpha
+    枢纽程度: hubSkew, 为1时边的端点均匀分布, 越大则边越集中于少数枢纽节点
+    环密度: cycleDensity为额外边中回边的比例, 每条回边指向其终点的第1至maxCycle-1级祖先, 形成长度不超过maxCycle的环
+同一组参数和种子总是生成相同的表格, 各基准测试均由addArguments和makeDataset取得合成数据
+"""
+import os
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+from moneyCollection import txn, loan
+
+# 默认参数, 见makeGraph
+defaults = {
+    "nodes": 100000,
+    "extraEdges": 0.3,
+    "sizeDist": "powerlaw",
+    "alpha": 2.5,
+    "minSize": 2,
+    "maxSize": 2000,
+    "hubSkew": 2.0,
+    "cycleDensity": 0.1,
+    "maxCycle": 6,
+    "seed": 0,
+}
+
+# 常用的参数组合
+presets = {
+    "small": {"nodes": 20000},
+    "medium": {"nodes": 200000},
+    "large": {"nodes": 2000000},
+    # 少数大子图, 枢纽明显
+    "hubs": {"nodes": 200000, "alpha": 1.8, "maxSize": 5000, "hubSkew": 4.0},
+    # 大量担保圈、互保和交叉持股
+    "cycles": {"nodes": 200000, "extraEdges": 0.8, "cycleDensity": 0.5},
+    # 大量双节点的小子图
+    "pairs": {"nodes": 200000, "sizeDist": "fixed", "minSize": 2, "extraEdges": 0.05},
+}
+
+
+def componentSizes(nodes, rng, sizeDist="powerlaw", alpha=2.5, minSize=2, maxSize=None):
+    """
+    生成各子图的节点数, 总和恰为nodes
+    Params:
+        nodes: 总节点数
+        rng: numpy随机数生成器
+        sizeDist: fixed为全部取minSize, uniform为[minSize, maxSize]上的均匀分布, powerlaw为指数alpha的幂律分布
+        alpha: 幂律分布的指数, 需大于1
+        minSize, maxSize: 子图节点数的上下限, maxSize为None时不限
+    Returns:
+        sizes: int64数组
+    """
+    maxSize = nodes if maxSize is None else min(maxSize, nodes)
+    minSize = min(minSize, maxSize)
+    chunks, total = list(), 0
+    while total < nodes:
+        count = max(16, (nodes - total) // minSize + 1)
+        if sizeDist == "fixed":
+            sizes = np.full(count, minSize, dtype=np.int64)
+        elif sizeDist == "uniform":
+            sizes = rng.integers(minSize, maxSize + 1, count)
+        elif sizeDist == "powerlaw":
+            u = rng.random(count)
+            sizes = np.floor(minSize * (1 - u) ** (-1 / (alpha - 1))).astype(np.int64)
+        else:
+            raise ValueError("未知的子图规模分布: %s" % sizeDist)
+        sizes = np.clip(sizes, minSize, maxSize)
+        chunks.append(sizes)
+        total += sizes.sum()
+    sizes = np.concatenate(chunks)
+    cut = np.searchsorted(np.cumsum(sizes), nodes)
+    sizes = sizes[:cut + 1]
+    # 最后一个子图截断到恰好凑满nodes
+    sizes[-1] -= sizes.sum() - nodes
+    return sizes[sizes > 0]
+
+
+def makeGraph(nodes=None, extraEdges=None, sizeDist=None, alpha=None, minSize=None, maxSize=None,
+              hubSkew=None, cycleDensity=None, maxCycle=None, seed=None):
+    """
+    生成由若干弱连通子图组成的有向图, 未指定的参数取defaults
+    每个子图先生成一棵以局部编号0为根的随机递归树(树边由父节点指向子节点), 保证子图连通且只有一个根;
+    再加入额外边: 前向边从编号小的节点指向编号大的节点, 不产生环; 回边从节点指向其祖先, 产生环
+    Returns:
+        src, dst: 边的端点编号
+        comp: 每个节点所属子图的编号
+    """
+    params = dict(defaults)
+    params.update({k: v for k, v in locals().items() if k in defaults and v is not None})
+    rng = np.random.default_rng(params["seed"])
+    sizes = componentSizes(
+        params["nodes"], rng, params["sizeDist"], params["alpha"], params["minSize"], params["maxSize"]
+    )
+    skew = params["hubSkew"]
+    n = int(sizes.sum())
+    offsets = np.cumsum(sizes) - sizes
+    comp = np.repeat(np.arange(len(sizes)), sizes)
+    local = np.arange(n) - offsets[comp]
+    # 随机递归树: 局部编号为j的节点的父节点在[0, j)中选取, hubSkew越大越偏向编号小的节点
+    parent = np.arange(n)
+    child = np.flatnonzero(local > 0)
+    parent[child] = offsets[comp[child]] + np.floor(local[child] * rng.random(len(child)) ** skew).astype(np.int64)
+    src, dst = [parent[child]], [child]
+    # 额外边的终点为随机的非根节点
+    k = int(params["extraEdges"] * n)
+    if k and len(child):
+        b = child[rng.integers(0, len(child), k)]
+        back = rng.random(k) < params["cycleDensity"]
+        # 前向边: 起点偏向子图前部的枢纽, 终点偏向子图后部, 保持局部编号从小到大
+        fb = b[~back]
+        size = sizes[comp[fb]]
+        a = offsets[comp[fb]] + np.floor(size * rng.random(len(fb)) ** skew).astype(np.int64)
+        c = offsets[comp[fb]] + size - 1 - np.floor(size * rng.random(len(fb)) ** skew).astype(np.int64)
+        lo, hi = np.minimum(a, c), np.maximum(a, c)
+        keep = lo < hi
+        src.append(lo[keep])
+        dst.append(hi[keep])
+        # 回边: 指向第depth级祖先, 环长为depth+1
+        bb = b[back]
+        depth = rng.integers(1, max(2, params["maxCycle"]), len(bb))
+        ancestor = bb.copy()
+        for d in range(int(depth.max()) if len(depth) else 0):
+            step = depth > d
+            ancestor[step] = parent[ancestor[step]]
+        keep = ancestor != bb
+        src.append(bb[keep])
+        dst.append(ancestor[keep])
+    return np.concatenate(src), np.concatenate(dst), comp
+
+
+def _shuffle(rng, *columns):
+    """
+    打乱行的顺序, 使同一子图的边不再相邻
+    """
+    order = rng.permutation(len(columns[0]))
+    return [col[order] for col in columns]
+
+
+def writeControlCsv(path, src, dst, seed=0, controlRate=0.05):
+    """
+    写出控制人表: relTag, src, destn, relType, rate
+    Params:
+        src, dst: makeGraph生成的边
+        controlRate: relType为Control的边的比例
+    """
+    rng = np.random.default_rng(seed)
+    src, dst = _shuffle(rng, src, dst)
+    names = np.char.add("C", np.arange(max(src.max(), dst.max()) + 1 if len(src) else 0).astype(str))
+    pd.DataFrame({
+        "relTag": np.char.add("R", src.astype(str)),
+        "src": names[src],
+        "destn": names[dst],
+        "relType": np.where(rng.random(len(src)) < controlRate, "Control", "Invest"),
+        # 少量大于100的异常比例
+        "rate": rng.integers(1, 105, len(src)),
+    }).to_csv(path, index=False, encoding="gb2312")
+
+
+def writeGuaranteeCsv(path, src, dst, seed=0, zeroRate=0.01):
+    """
+    写出担保关系表: src, destn, time, guarType, amount
+    Params:
+        src, dst: makeGraph生成的边
+        zeroRate: 担保金额为0(视为无效)的边的比例
+    """
+    rng = np.random.default_rng(seed)
+    src, dst = _shuffle(rng, src, dst)
+    names = np.char.add("G", np.arange(max(src.max(), dst.max()) + 1 if len(src) else 0).astype(str))
+    amount = np.round(rng.lognormal(15, 1.5, len(src)), 2)
+    amount[rng.random(len(src)) < zeroRate] = 0
+    pd.DataFrame({
+        "src": names[src],
+        "destn": names[dst],
+        "time": 20150101 + rng.integers(0, 6, len(src)) * 10000 + rng.integers(0, 12, len(src)) * 100
+        + rng.integers(1, 29, len(src)),
+        "guarType": rng.choice(["Normal", "Chain", "Cross", "Focus", "Mutual", "Circle"], len(src)),
+        "amount": amount,
+    }).to_csv(path, index=False, encoding="gb2312")
+
+
+def writeMoneyCollectionCsv(path, src, dst, comp, seed=0, triadRate=0.5, noiseRate=0.1):
+    """
+    写出34列的资金归集表, 只填充读取时用到的第0,1,4,6,7,21,29,33列
+    每条边记为一笔贷款(src放款给dst)或一笔转账, 部分贷款的借款方在数日内把相近金额转给同一子图内的另一账户,
+    构成资金归集三元组; 另有部分行不满足筛选条件
+    Params:
+        src, dst: makeGraph生成的边
+        comp: makeGraph返回的节点所属子图编号
+        triadRate: 贷款之后跟随一笔匹配转账的比例
+        noiseRate: 不满足筛选条件的行的比例
+    """
+    rng = np.random.default_rng(seed)
+    m = len(src)
+    isLoan = rng.random(m) < 0.5
+    date = 20200901 + rng.integers(0, 25, m)
+    amount = np.round(rng.uniform(loan["txnAmountLimit"], 1e7, m), 2)
+    # 匹配的转账: 借款方转给同一子图内的随机账户
+    follow = np.flatnonzero(isLoan & (rng.random(m) < triadRate))
+    starts = np.searchsorted(comp, comp[dst[follow]])
+    sizes = np.searchsorted(comp, comp[dst[follow]], side="right") - starts
+    target = starts + np.floor(rng.random(len(follow)) * sizes).astype(np.int64)
+    src = np.concatenate([src, dst[follow]])
+    dst = np.concatenate([dst, target])
+    isLoan = np.concatenate([isLoan, np.zeros(len(follow), dtype=bool)])
+    date = np.concatenate([date, date[follow] + rng.integers(0, 6, len(follow))])
+    amount = np.concatenate([amount, np.round(amount[follow] * rng.uniform(0.9, 1.0, len(follow)), 2)])
+    m = len(src)
+    noise = rng.random(m) < noiseRate
+    src, dst, isLoan, date, amount, noise = _shuffle(rng, src, dst, isLoan, date, amount, noise)
+    # 账户号不少于15位时末两位会被统一改写为00, 因此生成的账户号末两位均为00
+    accounts = np.char.add("62", (10 ** 14 + np.arange(comp.shape[0]) * 100).astype(str))
+    df = pd.DataFrame({"c%d" % i: "" for i in range(34)}, index=range(m))
+    # 边的方向为本人账户指向对方账户
+    df["c0"] = accounts[src]
+    df["c1"] = date
+    df["c4"] = np.where(isLoan, rng.choice(sorted(set(loan["code"])), m), rng.choice(txn["code"], m))
+    df["c6"] = isLoan.astype(int)
+    df["c7"] = amount
+    df["c21"] = np.where(isLoan & noise, loan["abstract"][0], rng.choice(["", "往来款"], m))
+    df["c29"] = accounts[dst]
+    df["c33"] = np.where(~isLoan & noise, "R", "0")
+    # 转账的噪声行金额低于下限
+    df.loc[~isLoan & noise, "c7"] = np.round(txn["txnAmountLimit"] / 2, 2)
+    df.to_csv(path, index=False, encoding="utf-8")
+
+
+def makeTables(paths, **params):
+    """
+    按同一组参数生成三张表
+    Params:
+        paths: {"control": 路径, "guarantee": 路径, "moneyCollection": 路径}, 可只含其中几项
+        params: makeGraph的参数
+    """
+    src, dst, comp = makeGraph(**params)
+    seed = params.get("seed", defaults["seed"])
+    if "control" in paths:
+        writeControlCsv(paths["control"], src, dst, seed)
+    if "guarantee" in paths:
+        writeGuaranteeCsv(paths["guarantee"], src, dst, seed)
+    if "moneyCollection" in paths:
+        writeMoneyCollectionCsv(paths["moneyCollection"], src, dst, comp, seed)
+
+
+def addArguments(parser, preset="small"):
+    """
+    为基准测试的命令行加入生成参数, 未指定的参数取预设, 预设中没有的取defaults
+    Params:
+        parser: argparse.ArgumentParser
+        preset: 默认的预设名
+    """
+    parser.add_argument("--preset", choices=sorted(presets), default=preset, help="生成参数的预设")
+    parser.add_argument("--nodes", type=int, default=None, help="节点数")
+    parser.add_argument("--extra-edges", type=float, default=None, help="额外边与节点数之比")
+    parser.add_argument("--size-dist", choices=["fixed", "uniform", "powerlaw"], default=None, help="子图规模分布")
+    parser.add_argument("--alpha", type=float, default=None, help="幂律分布的指数")
+    parser.add_argument("--min-size", type=int, default=None, help="子图节点数下限")
+    parser.add_argument("--max-size", type=int, default=None, help="子图节点数上限")
+    parser.add_argument("--hub-skew", type=float, default=None, help="枢纽程度, 1为均匀")
+    parser.add_argument("--cycle-density", type=float, default=None, help="额外边中回边(成环)的比例")
+    parser.add_argument("--max-cycle", type=int, default=None, help="环长上限")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def paramsFromArgs(args):
+    """
+    由addArguments加入的命令行参数得到makeGraph的完整参数
+    """
+    params = dict(defaults)
+    params.update(presets[args.preset])
+    given = {
+        "nodes": args.nodes, "extraEdges": args.extra_edges, "sizeDist": args.size_dist, "alpha": args.alpha,
+        "minSize": args.min_size, "maxSize": args.max_size, "hubSkew": args.hub_skew,
+        "cycleDensity": args.cycle_density, "maxCycle": args.max_cycle, "seed": args.seed,
+    }
+    params.update({k: v for k, v in given.items() if v is not None})
+    return params
+
+
+def datasetDir(root, params):
+    """
+    一组生成参数对应的合成表目录
+    """
+    key = json.dumps(params, sort_keys=True)
+    return os.path.join(root, "data_" + hashlib.blake2b(key.encode(), digest_size=6).hexdigest())
+
+
+def makeDataset(root, params):
+    """
+    生成或复用一组参数对应的三张合成表, 同一组参数的表保存在root下以参数命名的子目录中
+    Returns:
+        paths: 表名 -> csv路径
+    """
+    dataDir = datasetDir(root, params)
+    paths = {
+        t: os.path.abspath(os.path.join(dataDir, t + ".csv")) for t in ("control", "guarantee", "moneyCollection")
+    }
+    if all(os.path.exists(p) for p in paths.values()):
+        return paths
+    os.makedirs(dataDir, exist_ok=True)
+    print("生成合成表: %s" % dataDir)
+    makeTables(paths, **params)
+    with open(os.path.join(dataDir, "params.json"), "w", encoding="utf-8") as f:
+        json.dump(params, f, indent=2)
+    return paths
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+前端图数据的紧凑列式格式及预压缩文件
+
+.bin文件布局(小端序):
+    0   4字节  魔数b"GCOL"
+    4   uint32 版本号
+    8   uint32 头部json的字节数(已补齐到8的倍数)
+    12  uint32 保留
+    16  头部json, 描述nodes和links两张表的各列
+    之后为各列的数据区, 每列起始位置按8字节对齐, offset相对于数据区起点
+每列为以下之一:
+    数值列: {"name", "dtype", "offset", "length"}, dtype为uint8/int16/int32/float64等, 可直接构造JS的TypedArray
+    字符串列: 在数值列基础上增加"dict", 值为dict[code]
+    引用列: 在数值列基础上增加"ref", 值为nodes表中ref列的第code行, 用于links的source/target
+    其他列: {"name", "values"}, 值直接存放在头部json中
+用法: python columnar.py --formats columnar gzip ./frontend/public/res/json/control/*.json
+"""
+import os
+import json
+import gzip
+import struct
+import argparse
+import numpy as np
+
+# 可选的brotli压缩
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MAGIC = b"GCOL"
+VERSION = 1
+FORMATS = ("columnar", "gzip", "brotli")
+# 按从小到大的顺序尝试的整数类型, 均有对应的JS TypedArray
+_intTypes = [np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32]
+
+
+def checkFormats(formats):
+    """
+    检查输出格式是否可用
+    Params:
+        formats: 输出格式列表, 取值见FORMATS
+    """
+    for f in formats:
+        if f not in FORMATS:
+            raise ValueError("未知的输出格式: %s" % f)
+    if "brotli" in formats and brotli is None:
+        raise ImportError("brotli未安装")
+
+
+def _numericArray(values):
+    """
+    将一列数值转为占用最小的numpy数组, 无法用TypedArray精确表示时返回None
+    """
+    if all(type(v) in (int, bool) for v in values):
+        lo, hi = (min(values), max(values)) if values else (0, 0)
+        for t in _intTypes:
+            info = np.iinfo(t)
+            if info.min <= lo and hi <= info.max:
+                return np.asarray(values, dtype=t)
+        if -2 ** 53 <= lo and hi <= 2 ** 53:
+            return np.asarray(values, dtype=np.float64)
+        return None
+    if all(type(v) in (int, float, bool) for v in values):
+        return np.asarray(values, dtype=np.float64)
+    return None
+
+
+def _codesArray(codes):
+    """
+    字典编码或引用的编号数组, 按最大编号选择uint8/uint16/uint32
+    """
+    hi = max(codes) if codes else 0
+    for t in (np.uint8, np.uint16, np.uint32):
+        if hi <= np.iinfo(t).max:
+            return np.asarray(codes, dtype=t)
+    return np.asarray(codes, dtype=np.int64)
+
+
+def _encodeTable(rows, refs=None):
+    """
+    将字典列表按列编码
+    Params:
+        rows: 字典列表, 如nodes或links
+        refs: 列名 -> (nodes表的列名, 该列的值到行号的映射), 这些列编码为引用列
+    Returns:
+        columns: 列描述的列表, 数值数据暂存在"data"中
+    """
+    names = list()
+    for row in rows:
+        for name in row:
+            if name not in names:
+                names.append(name)
+    columns = list()
+    for name in names:
+        values = [row.get(name) for row in rows]
+        ref = (refs or {}).get(name)
+        if ref is not None and all(v in ref[1] for v in values):
+            columns.append({"name": name, "ref": ref[0], "data": _codesArray([ref[1][v] for v in values])})
+            continue
+        if all(type(v) is str for v in values):
+            index = dict()
+            codes = [index.setdefault(v, len(index)) for v in values]
+            columns.append({"name": name, "dict": list(index), "data": _codesArray(codes)})
+            continue
+        data = _numericArray(values)
+        if data is None:
+            columns.append({"name": name, "values": values})
+        else:
+            columns.append({"name": name, "data": data})
+    return columns
+
+
+def encode(graph):
+    """
+    将{"nodes": [...], "links": [...]}形式的图数据编码为列式二进制格式
+    Params:
+        graph: 图数据, 键的先后顺序会被保留
+    Returns:
+        bytes
+    """
+    tables = list(graph)
+    encoded = dict()
+    idIndex = dict()
+    for i, row in enumerate(graph.get("nodes", [])):
+        idIndex.setdefault(row.get("id"), i)
+    for table in tables:
+        refs = {"source": ("id", idIndex), "target": ("id", idIndex)} if table == "links" else None
+        encoded[table] = _encodeTable(graph[table], refs)
+    # 依次排布各列的数据区
+    buffers, offset = list(), 0
+    header = {"tables": tables}
+    for table in tables:
+        columns = list()
+        for col in encoded[table]:
+            data = col.pop("data", None)
+            if data is not None:
+                data = data.astype(data.dtype.newbyteorder("<"), copy=False)
+                col.update({"dtype": data.dtype.name, "offset": offset, "length": len(data)})
+                raw = data.tobytes()
+                pad = -len(raw) % 8
+                buffers.append(raw + b"\0" * pad)
+                offset += len(raw) + pad
+            columns.append(col)
+        header[table] = {"length": len(graph[table]), "columns": columns}
+    headerBytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    headerBytes += b" " * (-len(headerBytes) % 8)
+    return b"".join([MAGIC, struct.pack("<III", VERSION, len(headerBytes), 0), headerBytes] + buffers)
+
+
+def decode(data):
+    """
+    将列式二进制格式还原为图数据, 与前端graphLoader.js的解码逻辑一致, 用于校验
+    Params:
+        data: encode的返回值
+    Returns:
+        graph: {"nodes": [...], "links": [...]}
+    """
+    if data[:4] != MAGIC:
+        raise ValueError("不是列式图数据文件")
+    version, headerLen, _ = struct.unpack_from("<III", data, 4)
+    if version != VERSION:
+        raise ValueError("不支持的版本号: %d" % version)
+    header = json.loads(data[16:16 + headerLen].decode("utf-8"))
+    body = 16 + headerLen
+    graph, resolved = dict(), dict()
+    # 引用列依赖nodes表, 先解码nodes
+    for table in sorted(header["tables"], key=lambda t: t != "nodes"):
+        length = header[table]["length"]
+        rows = [dict() for _ in range(length)]
+        for col in header[table]["columns"]:
+            if "values" in col:
+                values = col["values"]
+            else:
+                dtype = np.dtype(col["dtype"]).newbyteorder("<")
+                values = np.frombuffer(data, dtype, col["length"], body + col["offset"]).tolist()
+                if "dict" in col:
+                    values = [col["dict"][v] for v in values]
+                elif "ref" in col:
+                    target = resolved[col["ref"]]
+                    values = [target[v] for v in values]
+            if table == "nodes":
+                resolved[col["name"]] = values
+            for row, v in zip(rows, values):
+                row[col["name"]] = v
+        graph[table] = rows
+    return {table: graph[table] for table in header["tables"]}
+
+
+def writeColumnar(path):
+    """
+    将已写完的json文件转为同名的.bin列式文件
+    Params:
+        path: json文件路径
+    Returns:
+        .bin文件路径
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        graph = json.load(f)
+    binPath = path[:-5] + ".bin" if path.endswith(".json") else path + ".bin"
+    with open(binPath, "wb") as f:
+        f.write(encode(graph))
+    return binPath
+
+
+def compressFile(path, method):
+    """
+    生成预压缩文件, 供静态服务器按Accept-Encoding直接返回(如nginx的gzip_static/brotli_static)
+    Params:
+        path: 原文件路径
+        method: "gzip"或"brotli"
+    Returns:
+        压缩文件路径
+    """
+    with open(path, "rb") as f:
+        raw = f.read()
+    if method == "gzip":
+        outPath, data = path + ".gz", gzip.compress(raw, 9, mtime=0)
+    elif method == "brotli":
+        if brotli is None:
+            raise ImportError("brotli未安装")
+        outPath, data = path + ".br", brotli.compress(raw)
+    else:
+        raise ValueError("未知的压缩方式: %s" % method)
+    with open(outPath, "wb") as f:
+        f.write(data)
+    return outPath
+
+
+def payloadPaths(path, formats=FORMATS):
+    """
+    json文件在给定输出格式下的全部附加文件路径
+    Params:
+        path: json文件路径
+        formats: 输出格式列表
+    Returns:
+        附加文件路径列表
+    """
+    paths = [path]
+    if "columnar" in formats:
+        paths.append(path[:-5] + ".bin" if path.endswith(".json") else path + ".bin")
+    suffixes = [s for f, s in (("gzip", ".gz"), ("brotli", ".br")) if f in formats]
+    return paths[1:] + [p + s for p in paths for s in suffixes]
+
+
+def writePayloads(path, formats):
+    """
+    为写完的json文件生成附加的输出格式, 并删除不在formats中的旧附加文件,
+    以免前端优先读取的.bin或静态服务器直接返回的预压缩文件仍是上次的内容
+    Params:
+        path: json文件路径
+        formats: 输出格式列表, columnar生成.bin, gzip/brotli对json及.bin生成预压缩文件
+    Returns:
+        生成的文件路径列表
+    """
+    keep = set(payloadPaths(path, formats))
+    for p in payloadPaths(path):
+        if p not in keep and os.path.exists(p):
+            os.remove(p)
+    outputs = list()
+    if not formats:
+        return outputs
+    paths = [path]
+    if "columnar" in formats:
+        paths.append(writeColumnar(path))
+        outputs.append(paths[-1])
+    for method in ("gzip", "brotli"):
+        if method in formats:
+            outputs += [compressFile(p, method) for p in paths]
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为已有的前端json文件生成列式格式和预压缩文件")
+    parser.add_argument("paths", nargs="+", help="json文件路径")
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=["columnar", "gzip"], help="输出格式")
+    args = parser.parse_args()
+    checkFormats(args.formats)
+    for path in args.paths:
+        for out in writePayloads(path, args.formats):
+            print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,217 +3,320 @@ import os
 import json
 import pandas as pd
 import numpy as np
-import networkx as nx
 
+import graphCore
+import graphCache
+import instrument
+import parallel
+import jsonWriter
 
-def getInitControlG(path):
+
+def cleanControlTable(control):
     """
-    读取控制人关系的excel表格到DataFrame, 并切分子图
+    规范控制人表: 修改列名, 修正持股比例
     Params:
-        path: 含有控制人数据的excel表格
-    Returns: 
-        subG: 根据表格数据切分得到的子图集合, 每个元素都是一副子图
+        control: 原始控制人表
+    Returns:
+        control: 列为relTag, src, destn, relType, rate的表
     """
-    control = pd.read_csv(path, encoding="gb2312")
     # 将列名索引修改为英文
     control.columns = ["relTag", "src", "destn", "relType", "rate"]
-    # 将比例大于100的异常值修正为100，并将数字变为带百分号的字符串
-    control.rate[control.rate >= 100] = 100
-    control["rate"] = [str(x) + "%" for x in control["rate"]]
+    # 将比例大于100的异常值修正为100, 比例保持为数值, 导出时再转为带百分号的字符串
+    control.loc[control["rate"] >= 100, "rate"] = 100
+    return control
 
+
+def buildControlCore(control):
+    """
+    由控制人表按列批量构建紧凑图
+    Params:
+        control: cleanControlTable处理后的表
+    Returns:
+        core: CompactGraph
+    """
     # Control关系中，relTag和src一一对应
-    G = nx.DiGraph()
-    # 构建初始图G
-    for _, row in control.iterrows():
-        # 默认每个节点非根且不存在交叉持股, 具体情况后续判定
-        if row["src"] not in G.nodes():
-            if row["relType"] == "Control":
-                G.add_node(row["src"], isRoot=0, isCross=0, isControl=1)
-            else:
-                G.add_node(row["src"], isRoot=0, isCross=0, isControl=0)
-        elif row["relType"] == "Control":
-            G.nodes[row["src"]]["isControl"] = 1
-        if row["destn"] not in G.nodes():
-            G.add_node(row["destn"], isRoot=0, isCross=0, isControl=0)
-        G.add_edge(
-            row["src"],
-            row["destn"],
-            rate=row["rate"],
-        )
+    # 默认每个节点非根且不存在交叉持股, 具体情况后续判定
+    core = graphCore.CompactGraph.fromColumns(
+        control["src"],
+        control["destn"],
+        nodeAttrs={
+            "isRoot": lambda n: np.zeros(n, dtype=np.uint8),
+            "isCross": lambda n: np.zeros(n, dtype=np.uint8),
+            "isControl": lambda n: np.zeros(n, dtype=np.uint8),
+            "crossId": lambda n: np.full(n, -1, dtype=np.int32),
+        },
+        edgeAttrs={"rate": control["rate"].to_numpy()},
+    )
+    # 只要某个src存在一条Control关系, 该节点即标记为isControl
+    controlSrc = control.loc[control["relType"] == "Control", "src"].unique()
+    core.nodeAttrs["isControl"][core.ids.internMany(controlSrc)] = 1
+    return core
+
+
+@instrument.timed("control.ingest", counts=instrument.ofResult)
+def getInitControlG(path, compact=False, cacheDir=None):
+    """
+    读取控制人关系的excel表格到DataFrame, 并切分子图
+    Params:
+        path: 含有控制人数据的excel表格
+        compact: 为True时直接返回整数编号的紧凑图, 不构建networkx图
+        cacheDir: 建图缓存目录, 为None时不使用缓存, 见graphCache
+    Returns: 
+        subG: 根据表格数据切分得到的子图集合, 每个元素都是一副子图; compact为True时为CompactGraph
+    """
+    cache = graphCache.GraphCache(None if compact else cacheDir, "control", path, {"encoding": "gb2312"})
+    cached = cache.load()
+    if cached is None:
+        control = cleanControlTable(pd.read_csv(path, encoding="gb2312"))
+        core = buildControlCore(control)
+        if compact:
+            return core
+        # Control关系对应的边, 增量更新删除边时据此判断src是否仍为isControl
+        pairs = control.loc[control["relType"] == "Control", ["src", "destn"]]
+        extras = {
+            "controlSrc": core.ids.internMany(pairs["src"]),
+            "controlDst": core.ids.internMany(pairs["destn"]),
+        }
+    else:
+        core, labels, extras = cached
+    G = core.toNx()
+    ids = core.ids
+    G.graph["controlEdges"] = set(zip(ids.lookup(extras["controlSrc"]), ids.lookup(extras["controlDst"])))
     print("----------控制人表数据读取完成----------")
     # 切分子图
-    tmp = nx.to_undirected(G)
-    subG = list()
-    for c in nx.connected_components(tmp):
-        subG.append(G.subgraph(c))
+    with instrument.stage("control.split"):
+        if cached is None:
+            labels = core.componentLabels()
+        subG = graphCache.splitComponents(G, core, labels)
+    if cached is None:
+        cache.save(core, labels, extras)
     print("----------控制人子图切分完成----------")
     return subG
 
 
-def getRootOfControlG(subG):
+def markRootOfComponent(G):
     """
-    找到各个节点的实际控制人
-    经检验, 每个子图要么无根, 要么有且仅有一个根, 因此可以简化计算
-    经检验, 有根的子图均不存在交叉持股现象
+    标记单个子图的根、交叉持股和交叉持股集群
+    对子图做一次强连通分量分解, 在O(V+E)内完成标记, 不复制子图
     Params:
-        subG: 原子图的列表
+        G: 控制人关系子图
     Returns:
-        rootG: 含有交叉持股关系的子图
+        子图内交叉持股集群的数量, 节点的crossId为子图内从0开始的集群编号
     """
-    rootG = list()
-    # 标记各个子图的根节点
-    for G in subG:
-        flag = False  # 是否有根标记
-        for n in G.nodes:
-            if G.in_degree(n) == 0:
-                G.nodes[n]["isRoot"] = 1
-                flag = True
-                break  # 仅有一个根, 找到即可退出
-        # 若图无根, 则将图逆置后仍无法拓扑排序的公司均为交叉持股, 交叉持股的公司风险绑定
-        if not flag:
-            tmpG = nx.reverse(G)
+    # 标记子图的根节点, 即没有股东的公司, 可能有多个
+    flag = False  # 是否有根标记
+    for n in G.nodes:
+        if not G.pred[n]:
+            G.nodes[n]["isRoot"] = 1
             flag = True
-            while flag:
-                flag = False
-                s = list()
-                for n in tmpG.nodes:
-                    if tmpG.in_degree(n) == 0:
-                        s.append(n)
-                        flag = True
-                tmpG.remove_nodes_from(s)
-            # 拓扑排序后仍有节点, 则这些节点构成交叉持股
-            for n in tmpG.nodes:
+    # 强连通分量按逆拓扑序给出, 即每个分量的下游分量都已先处理
+    sccs = graphCore.stronglyConnectedComponents(G.nodes, G.adj)
+    sccOf = dict()
+    reachCross = list()  # 各分量能否到达交叉持股集群
+    crossId = 0
+    for i, scc in enumerate(sccs):
+        for n in scc:
+            sccOf[n] = i
+        # 节点数大于1或含自环的分量构成交叉持股集群
+        isCluster = len(scc) > 1 or scc[0] in G.adj[scc[0]]
+        if isCluster:
+            for n in scc:
+                G.nodes[n]["crossId"] = crossId
+            crossId += 1
+        reachCross.append(
+            isCluster or any(reachCross[sccOf[w]] for n in scc for w in G.adj[n] if sccOf[w] != i)
+        )
+    # 若图无根, 则能到达交叉持股集群的公司均为交叉持股, 交叉持股的公司风险绑定
+    # 等价于将图逆置后仍无法拓扑排序的节点
+    if not flag:
+        for n in G.nodes:
+            if reachCross[sccOf[n]]:
                 G.nodes[n]["isCross"] = 1
-            rootG.append(G)
-            continue
-        # 仅有一个根, 则该节点必为所有公司的实际控制人
-        # 用拓扑排序判断是否存在局部的交叉持股
-        tmpG = nx.DiGraph(G)
-        flag = True
-        while flag:
-            flag = False
-            s = list()
-            for n in tmpG.nodes:
-                if tmpG.in_degree(n) == 0:
-                    s.append(n)
-                    flag = True
-            tmpG.remove_nodes_from(s)
-        # 拓扑排序后仍有节点则这些节点构成交叉持股
-        if nx.number_of_nodes(tmpG):
-            # 一张子图内可能存在多个交叉持股的公司集群
-            rootG.append(G)
-        else:
-            # 无交叉持股的子图拓扑排序后为空
-            rootG.append(G)
+    # 有根时各公司的实际控制人由resolveOwnership按穿透持股比例确定, 局部的交叉持股集群已由crossId标记
+    return crossId
+
+
+@instrument.timed("control.markRoot", counts=instrument.ofInput)
+def getRootOfControlG(subG, workers=1):
+    """
+    找到各个节点的实际控制人
+    先逐个子图标记根和交叉持股, 再对全部子图一起计算穿透持股比例, 见resolveOwnership
+    Params:
+        subG: 原子图的列表
+        workers: 并行处理子图的进程数
+    Returns:
+        rootG: 含有交叉持股关系的子图, 节点的crossId为其所在交叉持股集群的编号, 不在集群中为-1
+    """
+    counts = parallel.mapComponents(
+        markRootOfComponent, subG, workers, attrs=("isRoot", "isCross", "crossId")
+    )
+    # 将子图内的集群编号按Gid顺序换算为全局编号
+    offset = 0
+    for G, count in zip(subG, counts):
+        if offset and count:
+            for n in G.nodes:
+                if G.nodes[n]["crossId"] >= 0:
+                    G.nodes[n]["crossId"] += offset
+        offset += count
+    resolveOwnership(subG)
     print("----------控制人关系识别完成----------")
-    return rootG
+    return subG
 
 
-def graphs2json(GList):
+@instrument.timed("control.ownership", counts=instrument.ofInput)
+def resolveOwnership(GList, maxIter=200):
+    """
+    计算各个根到各公司的穿透持股比例(沿持股链相乘, 多条路径相加), 并确定各公司的实际控制人
+    所有子图的边合并为数组一起计算, 见graphCore.effectiveShares; 一家公司的股东比例之和超过100%时按比例缩小到100%,
+    交叉持股的环上比例之积为1时不动点迭代不收敛, 迭代maxIter轮后停止, 结果截断到不超过1
+    Params:
+        GList: 已标记根的控制人关系子图列表
+        maxIter: 交叉持股部分不动点迭代的最多轮数
+    Outputs:
+        节点属性owners: 根 -> 穿透持股比例, 按比例从大到小排列, 根自身和没有根的公司为空
+        节点属性controller: 穿透持股比例最大的根, 比例相同时取ID最小的根, 没有时为None
+    子图视图的遍历顺序依赖字符串的哈希值, 因此节点在子图内按ID排序, 边按两端编号排序, 结果与PYTHONHASHSEED无关
+    """
+    nodes, index, roots = list(), dict(), list()
+    for G in GList:
+        for n in sorted(G.nodes):
+            if G.nodes[n]["isRoot"]:
+                roots.append(len(nodes))
+            index[n] = len(nodes)
+            nodes.append(n)
+    src, dst, rate = list(), list(), list()
+    for G in GList:
+        for u, v, r in G.edges(data="rate"):
+            src.append(index[u])
+            dst.append(index[v])
+            rate.append(r)
+    n = len(nodes)
+    src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+    order = np.lexsort((dst, src))
+    src, dst = src[order], dst[order]
+    weight = np.clip(np.asarray(rate, dtype=float)[order] / 100, 0, 1)
+    total = np.bincount(dst, weights=weight, minlength=n)
+    weight = weight / np.maximum(total[dst], 1)
+    owner, node, share, _ = graphCore.effectiveShares(src, dst, weight, n, roots, maxIter=maxIter)
+    share = np.minimum(share, 1)
+    # 按节点分组, 组内按比例从大到小、根的ID排列
+    order = np.lexsort((owner, -share, node))
+    owner, node, share = owner[order].tolist(), node[order].tolist(), share[order].tolist()
+    owners = [dict() for _ in range(n)]
+    for o, v, x in zip(owner, node, share):
+        owners[v][nodes[o]] = x
+    for G in GList:
+        for v in G.nodes:
+            d = owners[index[v]]
+            G.nodes[v]["owners"] = d
+            G.nodes[v]["controller"] = next(iter(d), None)
+
+
+def formatRate(rate):
+    """
+    将持股比例转为前端显示用的带百分号的字符串
+    """
+    return str(rate) + "%"
+
+
+def componentJson(item, Gid):
+    """
+    将一个子图转化为前端可视化用的点和边
+    Params:
+        item: 控制人关系子图
+        Gid: 子图编号
+    Returns:
+        nodes, links: 点和边的字典列表
+        inControl: 子图是否含有Control关系
+        inCross: 子图是否含有交叉持股
+    """
+    nodes, links = list(), list()
+    inControl, inCross = False, False
+    for n in item.nodes:
+        if item.nodes[n]["isControl"]:
+            group, c, size = 0, "control", 5
+            inControl = True
+        elif item.nodes[n]["isCross"]:
+            group, c, size = 1, "cross", 3
+            inCross = True
+        elif item.nodes[n]["isRoot"]:
+            group, c, size = 2, "root", 3
+        else:
+            group, c, size = 3, "normal", 1
+        nodes.append({
+            "group": group, 
+            "class": c, 
+            "size": size, 
+            "Gid": Gid, 
+            "id": n
+        })
+    for u, v in item.edges:
+        links.append({
+            "source": u, 
+            "target": v, 
+            "rate": formatRate(item[u][v]["rate"])
+        })
+    return nodes, links, inControl, inCross
+
+
+# 前端json文件: 类别 -> 文件名模板, 各类别均按jsonWriter.shardBudget分片
+jsonPath = "./frontend/public/res/json/control/"
+jsonKeys = ("nodes", "links")
+jsonFiles = {
+    "control": "control_%d.json",
+    "cross": "cross_%d.json",
+    # 其他双节点子图
+    "double": "double_%d.json",
+    # 其他多节点子图
+    "multi": "multi_%d.json",
+}
+
+
+def jsonCategories(item, Gid):
+    """
+    将一个子图转化为点和边, 并确定其所属的前端json类别
+    Params:
+        item: 控制人关系子图
+        Gid: 子图编号
+    Returns:
+        nodes, links: 点和边的字典列表
+        categories: jsonFiles中的类别列表
+    """
+    nodes, links, inControl, inCross = componentJson(item, Gid)
+    categories = list()
+    # Control关系json
+    if inControl:
+        categories.append("control")
+    # 交叉持股关系json
+    if inCross:
+        categories.append("cross")
+    if not inControl and not inCross:
+        categories.append("double" if len(nodes) == 2 else "multi")
+    return nodes, links, categories
+
+
+@instrument.timed("control.export", counts=instrument.ofInput)
+def graphs2json(GList, backend="auto", formats=()):
     """
     将图数据输出为前端可视化用的json文件
+    每个子图处理完后直接写入打开的文件, 内存占用与输出文件的大小无关
     Params:
         GList: 图数据
+        backend: json序列化后端, 见jsonWriter.dumps
+        formats: 额外生成的列式或预压缩格式, 见columnar.writePayloads
     Outputs:
         输出转化后的json文件
+    Returns:
+        layout: 各json文件包含的子图编号, 见jsonWriter.LayoutWriter
     """
-    controlList = {"nodes": [], "links": []}
-    crossList = {"nodes": [], "links": []}
-    doubleCurList = {"nodes": [], "links": []}
-    multiCurList = {"nodes": [], "links": []}
-    tmp = {"nodes": [], "links": []}
-    i, j = 0, 0
-    Gid = 0  # 子图编号
-    doubleCount, multiCount = 0, 0
-    for item in GList:
-        tmp["nodes"], tmp["links"] = [], []
-        # 初始化子图数据, 先后加点和边
-        inControl, inCross, isIn = False, False, False
-        for n in item.nodes:
-            if item.nodes[n]["isControl"]:
-                group, c, size = 0, "control", 5
-                inControl, isIn = True, True
-            elif item.nodes[n]["isCross"]:
-                group, c, size = 1, "cross", 3
-                inCross, isIn = True, True
-            elif item.nodes[n]["isRoot"]:
-                group, c, size = 2, "root", 3
-            else:
-                group, c, size = 3, "normal", 1
-            tmp["nodes"].append({
-                "group": group, 
-                "class": c, 
-                "size": size, 
-                "Gid": Gid, 
-                "id": n
-            })
-        for u, v in item.edges:
-            tmp["links"].append({
-                "source": u, 
-                "target": v, 
-                "rate": item[u][v]["rate"]
-            })
-        # Control关系json
-        if inControl:
-            controlList["nodes"] += tmp["nodes"]
-            controlList["links"] += tmp["links"]
-        # 交叉持股关系json
-        if inCross:
-            crossList["nodes"] += tmp["nodes"]
-            crossList["links"] += tmp["links"]
-        if not isIn:
-            # 其他双节点json
-            if len(tmp["nodes"]) == 2:
-                doubleCount += 2
-                # 每个json存储的点不超过3000个
-                if doubleCount >= 3000:
-                    path = "./frontend/public/res/json/control/" + "double_" + str(i) + ".json"
-                    with open(path, "w") as f:
-                        json.dump(doubleCurList, f)
-                    i += 1
-                    doubleCount = 0
-                    doubleCurList["nodes"], doubleCurList["links"] = [], []
-                else:
-                    doubleCurList["nodes"] += tmp["nodes"]
-                    doubleCurList["links"] += tmp["links"]
-            # 其他多节点json
-            else:
-                multiCount += len(tmp["nodes"])
-                # 每个json存储的点以2950个为阈值
-                if multiCount >= 2950:
-                    path = "./frontend/public/res/json/control/" + "multi_" + str(j) + ".json"
-                    with open(path, "w") as f:
-                        json.dump(multiCurList, f)
-                    j += 1
-                    multiCount = 0
-                    multiCurList["nodes"], multiCurList["links"] = [], []
-                else:
-                    multiCurList["nodes"] += tmp["nodes"]
-                    multiCurList["links"] += tmp["links"]
-        Gid += 1
-    # 剩余子图信息存到下一个json中
-    if len(tmp["nodes"]) == 2:
-        doubleCurList["nodes"] += tmp["nodes"]
-        doubleCurList["links"] += tmp["links"]
-    else:
-        multiCurList["nodes"] += tmp["nodes"]
-        multiCurList["links"] += tmp["links"]
-    if doubleCurList:
-        path = "./frontend/public/res/json/control/" + "double_" + str(i) + ".json"
-        with open(path, "w") as f:
-            json.dump(doubleCurList, f)
-    if multiCurList:
-        path = "./frontend/public/res/json/control/" + "multi_" + str(j) + ".json"
-        with open(path, "w") as f:
-            json.dump(multiCurList, f)
-    # 将上述数据写入文件
-    with open(r"./frontend/public/res/json/control/control.json", "w") as f:
-        json.dump(controlList, f)
-    with open(r"./frontend/public/res/json/control/cross.json", "w") as f:
-        json.dump(crossList, f)
+    with jsonWriter.LayoutWriter(jsonPath, jsonFiles, jsonKeys, backend, formats) as writer:
+        for Gid, item in enumerate(GList):
+            writer.write(Gid, *jsonCategories(item, Gid))
     print("----------控制人json导出完成----------")
+    return writer.layout
 
 
+@instrument.timed("control.answer", counts=instrument.ofInput)
 def ansJson(GList):
     """
     将图数据输出为答案的json文件
@@ -225,10 +328,13 @@ def ansJson(GList):
     controlList = {"links": []}
     crossList = {"links": []}
     normalList = {"links": []}
+    # 各根对公司的穿透持股比例
+    ownershipList = {"links": []}
 
     for item in GList:
-        root = ""
         controlNodes = list()
+        # 判断成员用的集合, 输出时仍为列表
+        controlSet = set()
         # 找根、交叉持股和control关系
         inControl, inCross = False, False
         for n in item.nodes:
@@ -238,8 +344,7 @@ def ansJson(GList):
             elif item.nodes[n]["isControl"]:
                 inControl = True
                 controlNodes.append(n)
-            elif item.nodes[n]["isRoot"]:
-                root = n
+                controlSet.add(n)
             else:
                 continue
         # 存交叉持股关系
@@ -253,7 +358,7 @@ def ansJson(GList):
         # 存Control关系
         if inControl:
             for n in item.nodes():
-                if not n in controlNodes:
+                if not n in controlSet:
                     controlList["links"].append({
                         "from": controlNodes,
                         "to": n
@@ -264,11 +369,11 @@ def ansJson(GList):
                         "to": n
                     })
             continue
-        # 存实际控制人root关系
+        # 存实际控制人root关系, 有多个根时取穿透持股比例最大的根
         for n in item.nodes():
-            if not n == root:
+            if not item.nodes[n]["isRoot"]:
                 normalList["links"].append({
-                    "from": root,
+                    "from": item.nodes[n]["controller"] or "null",
                     "to": n
                 })
             else:
@@ -283,4 +388,14 @@ def ansJson(GList):
         json.dump(crossList, f)
     with open(r"./answers/control/normal.json", "w") as f:
         json.dump(normalList, f)
+    for item in GList:
+        for n, owners in item.nodes(data="owners"):
+            for root, share in owners.items():
+                ownershipList["links"].append({
+                    "from": root,
+                    "to": n,
+                    "share": share
+                })
+    with open(r"./answers/control/ownership.json", "w") as f:
+        json.dump(ownershipList, f)
     print("----------控制人表的答案json导出完成----------")
\ No newline at end of file
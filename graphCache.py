@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+读取csv建图结果的磁盘缓存: 保存紧凑图的全部数组和子图划分, 下次读取同一输入文件时跳过csv解析和建图
+每张表对应缓存目录下的一个子目录:
+    meta.json       输入文件指纹、读取参数和各列的描述, 最后写入, 不存在即视为无缓存
+    *.npy           ID表、边数组、CSR数组、属性列和子图编号, 以内存映射方式读取
+输入文件的大小和修改时间均未变化时直接使用缓存; 否则重新计算文件内容的哈希, 内容未变化时仍可使用缓存
+读取参数(编码、筛选条件等)或VERSION变化时缓存失效, 修改建图逻辑后需要增加VERSION
+"""
+import os
+import gc
+import json
+import hashlib
+import numpy as np
+import pandas as pd
+
+import graphCore
+
+# 缓存格式及建图逻辑的版本号
+VERSION = 2
+defaultDir = "./backend/cache/"
+
+
+def fileHash(path, blockSize=1 << 20):
+    """
+    分块计算文件内容的哈希
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(blockSize), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def idArray(ids):
+    """
+    将ID列表转为numpy数组, 全为字符串或全为整数时为定长数组, 否则为object数组
+    """
+    types = set(map(type, ids))
+    if types == {str}:
+        return np.asarray(ids, dtype=str)
+    if types == {int}:
+        arr = np.asarray(ids)
+        if arr.dtype != object:
+            return arr
+    return np.asarray(ids, dtype=object)
+
+
+def splitComponents(G, core, labels, codes=False):
+    """
+    按子图编号切分networkx图, 子图顺序与缓存时一致
+    Params:
+        G: core.toNx()得到的图
+        core: CompactGraph
+        labels: 每个节点所属子图的编号, 见CompactGraph.componentLabels
+        codes: G是否以整数编号为节点
+    Returns:
+        GList: 子图列表, 为graphCore.ComponentList, 可由graphCore.baseGraph取得G, 并保留core和labels
+    """
+    nodePtr, nodeOrder, _, _ = core.componentSlices(labels)
+    parts = [nodeOrder[nodePtr[k]:nodePtr[k + 1]].tolist() for k in range(len(nodePtr) - 1)]
+    if not codes:
+        ids = core.ids.ids
+        parts = [[ids[i] for i in part] for part in parts]
+    # 每个子图视图都会新建若干容器对象, 频繁触发的分代回收每次都要遍历整个图, 切分期间暂停回收
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return graphCore.ComponentList([G.subgraph(part) for part in parts], G, core, labels)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class GraphCache:
+    """
+    单个输入文件的建图缓存
+    """
+
+    def __init__(self, cacheDir, name, path, params=None):
+        """
+        Params:
+            cacheDir: 缓存目录, 为None时不使用缓存, load总是返回None, save不做任何事
+            name: 缓存名, 如"control"
+            path: 输入文件路径
+            params: 影响建图结果的读取参数, 需可序列化为json
+        """
+        self.dir = None if cacheDir is None else os.path.join(cacheDir, name)
+        self.path = path
+        self.params = json.loads(json.dumps({"version": VERSION, "params": params or {}}))
+        self._hash = None
+
+    def _stat(self):
+        st = os.stat(self.path)
+        return {"size": st.st_size, "mtime": st.st_mtime_ns}
+
+    def _contentHash(self):
+        if self._hash is None:
+            self._hash = fileHash(self.path)
+        return self._hash
+
+    def _metaPath(self):
+        return os.path.join(self.dir, "meta.json")
+
+    def _arrayPath(self, key):
+        return os.path.join(self.dir, key + ".npy")
+
+    def _readMeta(self):
+        try:
+            with open(self._metaPath(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _writeMeta(self, meta):
+        tmp = self._metaPath() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, self._metaPath())
+
+    def _valid(self, meta):
+        """
+        判断缓存是否与当前输入文件和读取参数对应, 文件只被touch或复制时刷新记录的大小和修改时间
+        """
+        if meta is None or meta["key"] != self.params:
+            return False
+        stat = self._stat()
+        if meta["stat"] == stat:
+            return True
+        if meta["stat"]["size"] != stat["size"] or meta["hash"] != self._contentHash():
+            return False
+        meta["stat"] = stat
+        self._writeMeta(meta)
+        return True
+
+    def _load(self, key, meta):
+        if key in meta["pickled"]:
+            return np.load(self._arrayPath(key), allow_pickle=True)
+        # 写时复制的内存映射, 分析过程中修改属性列不会写回缓存
+        return np.load(self._arrayPath(key), mmap_mode="c")
+
+    def load(self):
+        """
+        读取缓存
+        Returns:
+            (core, labels, extras), 缓存不存在或已失效时返回None
+            core: CompactGraph
+            labels: 每个节点所属子图的编号
+            extras: save时传入的附加数据
+        """
+        if self.dir is None:
+            return None
+        meta = self._readMeta()
+        try:
+            if not self._valid(meta):
+                return None
+            ids = graphCore.IdIndex(self._load("ids", meta).tolist())
+            arrays = {name: self._load(name, meta) for name in graphCore.CompactGraph.arrayNames}
+            attrs = dict()
+            for kind in ("node", "edge"):
+                attrs[kind] = dict()
+                for name in meta[kind]:
+                    col = self._load("%s.%s" % (kind, name), meta)
+                    if name in meta["categories"][kind]:
+                        col = pd.Categorical.from_codes(col, meta["categories"][kind][name])
+                    attrs[kind][name] = col
+            extras = dict(meta["extras"])
+            for name in meta["extraArrays"]:
+                extras[name] = self._load("extra." + name, meta)
+            labels = self._load("labels", meta)
+        except (OSError, ValueError, KeyError):
+            return None
+        core = graphCore.CompactGraph.fromArrays(ids, arrays, attrs["node"], attrs["edge"])
+        return core, labels, extras
+
+    def save(self, core, labels, extras=None):
+        """
+        写入缓存, 覆盖该缓存名下的旧缓存
+        Params:
+            core: CompactGraph
+            labels: 每个节点所属子图的编号, 见CompactGraph.componentLabels
+            extras: 附加数据, 名称 -> numpy数组或可序列化为json的值
+        """
+        if self.dir is None:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        # 先删除meta.json使旧缓存失效, 写完全部数组后再写入新的meta.json
+        if os.path.exists(self._metaPath()):
+            os.remove(self._metaPath())
+        meta = {
+            "key": self.params,
+            "stat": self._stat(),
+            "hash": self._contentHash(),
+            "node": list(core.nodeAttrs),
+            "edge": list(core.edgeAttrs),
+            "categories": {"node": {}, "edge": {}},
+            "extras": {},
+            "extraArrays": [],
+            "pickled": [],
+        }
+        arrays = {"ids": idArray(core.ids.ids), "labels": np.asarray(labels, dtype=np.int32)}
+        for name in graphCore.CompactGraph.arrayNames:
+            arrays[name] = getattr(core, name)
+        for kind, columns in (("node", core.nodeAttrs), ("edge", core.edgeAttrs)):
+            for name, col in columns.items():
+                if isinstance(col, pd.Categorical):
+                    meta["categories"][kind][name] = col.categories.tolist()
+                    col = col.codes
+                arrays["%s.%s" % (kind, name)] = np.asarray(col)
+        for name, value in (extras or {}).items():
+            if isinstance(value, np.ndarray):
+                meta["extraArrays"].append(name)
+                arrays["extra." + name] = value
+            else:
+                meta["extras"][name] = value
+        for key, arr in arrays.items():
+            # ID等混合类型的列无法内存映射, 以pickle方式保存
+            if arr.dtype == object:
+                meta["pickled"].append(key)
+            np.save(self._arrayPath(key), arr, allow_pickle=arr.dtype == object)
+        self._writeMeta(meta)
@@ -0,0 +1,580 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+# 担保关系类型的位掩码, 节点的guarType列以uint8位掩码存储, 顺序即导出时的先后顺序, 与逐步判定时的追加顺序一致
+guarTypeBits = {"Normal": 1, "Cross": 2, "Focus": 4, "Mutual": 8, "Circle": 16, "Chain": 32}
+
+
+def guarTypeNames(mask):
+    """
+    将担保类型位掩码还原为类型名列表
+    Params:
+        mask: 位掩码
+    Returns:
+        按guarTypeBits顺序排列的类型名列表
+    """
+    return [name for name, bit in guarTypeBits.items() if mask & bit]
+
+
+class IdIndex:
+    """
+    公司ID与连续整数编号的双向驻留表, 编号按首次出现的顺序分配
+    """
+
+    def __init__(self, ids=None):
+        self.ids = list()  # 编号 -> ID
+        self.index = dict()  # ID -> 编号
+        if ids is not None:
+            self.internMany(ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, i):
+        return self.ids[i]
+
+    def intern(self, key):
+        """
+        返回ID的编号, ID首次出现时为其分配新编号
+        """
+        i = self.index.get(key)
+        if i is None:
+            i = len(self.ids)
+            self.index[key] = i
+            self.ids.append(key)
+        return i
+
+    def internMany(self, keys):
+        """
+        批量驻留一列ID
+        Params:
+            keys: ID数组
+        Returns:
+            与keys等长的int64编号数组
+        """
+        if not self.ids:
+            codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+            self.ids = uniques.tolist()
+            self.index = {k: i for i, k in enumerate(self.ids)}
+            return codes.astype(np.int64)
+        keys = pd.Series(np.asarray(keys, dtype=object))
+        for k in pd.unique(keys).tolist():
+            self.intern(k)
+        return keys.map(self.index).to_numpy(np.int64)
+
+    def lookup(self, codes):
+        """
+        将编号数组还原为ID列表
+        """
+        ids = self.ids
+        return [ids[i] for i in np.asarray(codes).tolist()]
+
+
+def buildCsr(keys, n):
+    """
+    按keys对边编号做稳定的计数排序, 得到CSR结构
+    Params:
+        keys: 每条边的端点编号
+        n: 节点总数
+    Returns:
+        ptr: 长度为n+1的偏移数组, 节点i的边位于order[ptr[i]:ptr[i+1]]
+        order: 排序后的边编号
+    """
+    ptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n), out=ptr[1:])
+    order = np.argsort(keys, kind="stable")
+    return ptr, order
+
+
+def unionFind(src, dst, n):
+    """
+    基于数组的并查集, 不区分边的方向求连通分量, 代表元为分量内编号最小的节点
+    每轮先做指针跳跃把每个节点直接指向其根, 再把每条边两端中较大的根挂到较小的根下;
+    两端已同根的边此后不会再分开, 直接丢弃, 因此每轮处理的边越来越少, 总代价近似线性
+    Params:
+        src, dst: 每条边两个端点的编号
+        n: 节点总数
+    Returns:
+        roots: 长度为n的数组, 每个节点所在分量的代表元
+    """
+    parent = np.arange(n, dtype=np.int64)
+    u, v = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+    while True:
+        while True:
+            grand = parent[parent]
+            if np.array_equal(grand, parent):
+                break
+            parent = grand
+        ru, rv = parent[u], parent[v]
+        keep = ru != rv
+        if not keep.any():
+            return parent
+        u, v, ru, rv = u[keep], v[keep], ru[keep], rv[keep]
+        # 根总是挂到编号更小的根下, 不会形成环
+        np.minimum.at(parent, np.maximum(ru, rv), np.minimum(ru, rv))
+
+
+def componentLabels(src, dst, n):
+    """
+    每个节点所属连通分量的编号, 分量按其最小节点编号的先后编号,
+    与networkx.connected_components按节点顺序逐个发现分量的顺序一致
+    Params:
+        src, dst, n: 同unionFind
+    Returns:
+        labels: 长度为n的int32数组
+    """
+    _, labels = np.unique(unionFind(src, dst, n), return_inverse=True)
+    return labels.astype(np.int32)
+
+
+class CompactGraph:
+    """
+    基于整数编号和CSR数组的紧凑有向(多重)图
+    节点属性和边属性均按列存储: 数值属性为numpy数组, 字符串属性为pd.Categorical
+    边编号即其在src/dst中的下标, 重复的(src, dst)视为多重边
+    """
+
+    # 描述图结构的全部数组
+    arrayNames = ("src", "dst", "outPtr", "outEdge", "inPtr", "inEdge")
+
+    def __init__(self, ids, src, dst, nodeAttrs=None, edgeAttrs=None):
+        """
+        Params:
+            ids: IdIndex, 节点编号与公司ID的对应表
+            src, dst: 每条边起点和终点的编号
+            nodeAttrs: 节点属性列, 名称 -> 长度为节点数的数组
+            edgeAttrs: 边属性列, 名称 -> 长度为边数的数组
+        """
+        self.ids = ids
+        n = len(ids)
+        dtype = np.int32 if n < 2 ** 31 else np.int64
+        self.src = np.asarray(src).astype(dtype, copy=False)
+        self.dst = np.asarray(dst).astype(dtype, copy=False)
+        self.outPtr, self.outEdge = buildCsr(self.src, n)
+        self.inPtr, self.inEdge = buildCsr(self.dst, n)
+        self.nodeAttrs = dict(nodeAttrs or {})
+        self.edgeAttrs = dict(edgeAttrs or {})
+
+    @classmethod
+    def fromArrays(cls, ids, arrays, nodeAttrs=None, edgeAttrs=None):
+        """
+        由已构建好的边数组和CSR数组直接构造紧凑图, 不重新排序, 用于从缓存中恢复
+        Params:
+            ids: IdIndex
+            arrays: arrayNames中各数组, 名称 -> 数组
+            nodeAttrs, edgeAttrs: 同__init__
+        Returns:
+            CompactGraph
+        """
+        core = cls.__new__(cls)
+        core.ids = ids
+        for name in cls.arrayNames:
+            setattr(core, name, arrays[name])
+        core.nodeAttrs = dict(nodeAttrs or {})
+        core.edgeAttrs = dict(edgeAttrs or {})
+        return core
+
+    @classmethod
+    def fromColumns(cls, src, dst, ids=None, nodeAttrs=None, edgeAttrs=None, multi=False):
+        """
+        由边表的两列ID构建紧凑图, 节点按(src, dst)逐行交错的首次出现顺序编号
+        Params:
+            src, dst: 起点和终点ID数组
+            ids: 已有的IdIndex, 为空时新建
+            nodeAttrs: 节点属性列, 名称 -> 函数(节点数 -> 数组)
+            edgeAttrs: 边属性列, 名称 -> 与src等长的数组
+            multi: 为False时按DiGraph语义合并重复边, 保留首次出现的位置和最后一次出现的属性
+        Returns:
+            CompactGraph
+        """
+        ids = IdIndex() if ids is None else ids
+        pair = np.column_stack([np.asarray(src, dtype=object), np.asarray(dst, dtype=object)])
+        codes = ids.internMany(pair.ravel())
+        n = len(ids)
+        src, dst = codes[0::2], codes[1::2]
+        edgeAttrs = dict(edgeAttrs or {})
+        if not multi and len(src):
+            key = src * n + dst
+            _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+            if len(first) < len(key):
+                last = np.zeros(len(first), dtype=np.int64)
+                np.maximum.at(last, inverse, np.arange(len(key)))
+                order = np.argsort(first)
+                first, last = first[order], last[order]
+                src, dst = src[first], dst[first]
+                edgeAttrs = {name: col[last] for name, col in edgeAttrs.items()}
+        nodeColumns = {name: make(n) for name, make in (nodeAttrs or {}).items()}
+        return cls(ids, src, dst, nodeAttrs=nodeColumns, edgeAttrs=edgeAttrs)
+
+    def numberOfNodes(self):
+        return len(self.ids)
+
+    def numberOfEdges(self):
+        return len(self.src)
+
+    def outDegree(self):
+        return np.diff(self.outPtr)
+
+    def inDegree(self):
+        return np.diff(self.inPtr)
+
+    def outEdges(self, i):
+        """
+        节点i的出边编号
+        """
+        return self.outEdge[self.outPtr[i]:self.outPtr[i + 1]]
+
+    def inEdges(self, i):
+        """
+        节点i的入边编号
+        """
+        return self.inEdge[self.inPtr[i]:self.inPtr[i + 1]]
+
+    def successors(self, i):
+        return self.dst[self.outEdges(i)]
+
+    def predecessors(self, i):
+        return self.src[self.inEdges(i)]
+
+    def componentLabels(self):
+        """
+        每个节点所属弱连通分量的编号, 见componentLabels
+        """
+        return componentLabels(self.src, self.dst, self.numberOfNodes())
+
+    def componentSlices(self, labels):
+        """
+        按分量编号分组的节点和边
+        Params:
+            labels: componentLabels的返回值
+        Returns:
+            nodePtr, nodeOrder: 分量k的节点为nodeOrder[nodePtr[k]:nodePtr[k+1]], 按编号从小到大
+            edgePtr, edgeOrder: 分量k的边编号为edgeOrder[edgePtr[k]:edgePtr[k+1]], 按边编号从小到大
+        """
+        labels = np.asarray(labels)
+        k = int(labels.max()) + 1 if len(labels) else 0
+        nodePtr, nodeOrder = buildCsr(labels, k)
+        edgePtr, edgeOrder = buildCsr(labels[self.src], k)
+        return nodePtr, nodeOrder, edgePtr, edgeOrder
+
+    def nbytes(self):
+        """
+        估算紧凑图占用的字节数, 包括数组、属性列和ID驻留表
+        """
+        total = sum(getattr(self, name).nbytes for name in self.arrayNames)
+        for col in list(self.nodeAttrs.values()) + list(self.edgeAttrs.values()):
+            total += col.nbytes if hasattr(col, "nbytes") else np.asarray(col).nbytes
+        # ID字符串本身, 以及列表指针和字典表项的开销
+        total += sum(len(k) for k in self.ids.ids) + 8 * len(self.ids) + 64 * len(self.ids)
+        return total
+
+    def toNx(self, multi=False, decoders=None, codes=False):
+        """
+        还原为networkx图, 供现有的按子图处理流程使用
+        Params:
+            multi: 为True时返回MultiDiGraph
+            decoders: 节点属性名 -> 将列中单个值转换为图属性的函数, 如guarTypeNames
+            codes: 为True时以整数编号为节点, ID表存于G.graph["ids"], 输出时再还原为公司ID; 否则以公司ID为节点
+        Returns:
+            G: 节点和边属性均为字典形式的networkx图
+        """
+        decoders = decoders or {}
+        G = nx.MultiDiGraph() if multi else nx.DiGraph()
+        if codes:
+            G.graph["ids"] = self.ids
+        # 各条边引用同一批节点对象, 整数编号不会为每条边重复创建
+        ids = list(range(len(self.ids))) if codes else self.ids.ids
+        names = list(self.nodeAttrs)
+        columns = list()
+        for name in names:
+            values = np.asarray(self.nodeAttrs[name]).tolist()
+            if name in decoders:
+                values = [decoders[name](v) for v in values]
+            columns.append(values)
+        if names:
+            G.add_nodes_from(
+                (n, dict(zip(names, row))) for n, row in zip(ids, zip(*columns))
+            )
+        else:
+            G.add_nodes_from(ids)
+        edgeNames = list(self.edgeAttrs)
+        edgeColumns = [np.asarray(self.edgeAttrs[name]).tolist() for name in edgeNames]
+        if edgeNames:
+            G.add_edges_from(
+                (ids[u], ids[v], dict(zip(edgeNames, row)))
+                for u, v, row in zip(self.src.tolist(), self.dst.tolist(), zip(*edgeColumns))
+            )
+        else:
+            G.add_edges_from((ids[u], ids[v]) for u, v in zip(self.src.tolist(), self.dst.tolist()))
+        return G
+
+
+def idOf(G):
+    """
+    将图中节点还原为公司ID的函数, 图以整数编号为节点时编号与ID的对应存于G.graph["ids"], 见CompactGraph.toNx
+    """
+    ids = G.graph.get("ids")
+    return (lambda n: n) if ids is None else ids.ids.__getitem__
+
+
+def csrRanges(ptr, nodes):
+    """
+    一组节点在CSR结构中的全部位置
+    Params:
+        ptr: buildCsr返回的偏移数组
+        nodes: 节点编号数组
+    Returns:
+        位置数组, 按nodes的顺序依次排列各节点的边
+    """
+    starts = ptr[nodes]
+    lengths = ptr[nodes + 1] - starts
+    if not len(lengths):
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+def peelZeroDegree(deg, ptr, order, heads, alive, levels=None):
+    """
+    反复删除度为0的节点直至不存在这样的节点, 与逐轮扫描全图删除的结果相同
+    按层推进: 每层删除当前度为0的节点, 只扣减其邻居的度, 总代价O(V+E)
+    Params:
+        deg: 各节点的入度(或出度), 会被修改
+        ptr, order: 被删除节点所指向的边的CSR结构, 见buildCsr
+        heads: 每条边另一端的节点编号
+        alive: 存活节点的布尔数组, 会被修改
+        levels: 可选的int数组, 记录每个节点在第几层被删除, 即按入度删除时的拓扑层次
+    """
+    frontier = np.flatnonzero(alive & (deg == 0))
+    level = 0
+    while len(frontier):
+        alive[frontier] = False
+        if levels is not None:
+            levels[frontier] = level
+            level += 1
+        nbr = heads[order[csrRanges(ptr, frontier)]]
+        np.subtract.at(deg, nbr, 1)
+        nbr = np.unique(nbr)
+        frontier = nbr[alive[nbr] & (deg[nbr] == 0)]
+
+
+def _sumByKey(keys, values):
+    """
+    按键合并求和
+    Returns:
+        按升序排列的不重复键, 及各键的值之和
+    """
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    return uniq, np.bincount(inverse, weights=values, minlength=len(uniq))
+
+
+def effectiveShares(src, dst, weight, n, roots=None, maxIter=200, tol=1e-12):
+    """
+    沿所有路径相乘再求和的穿透持股比例: share[r, v] = sum(路径上各边比例之积, r到v的全部路径)
+    即share[r, r] = 1, share[r, v] = sum(share[r, u] * weight[u -> v])
+    先按入度逐层删除节点得到无环部分的拓扑层次, 按层把各根的比例推给后继, 每条边只处理一次;
+    剩下的节点位于交叉持股的环上或其下游, 以无环部分推入的比例为常数项做不动点迭代,
+    各公司的股东比例之和不超过1且环上比例之积小于1时收敛
+    结果以稀疏的(根, 节点, 比例)三元组表示, 代价与三元组个数成正比, 每个节点通常只被少数根穿透
+    Params:
+        src, dst: 持股边的起点(股东)和终点(被持股公司)编号
+        weight: 持股比例, 取值[0, 1]
+        n: 节点总数
+        roots: 根节点编号, 为None时取全部入度为0的节点
+        maxIter: 不动点迭代的最多轮数
+        tol: 相邻两轮比例的最大变化量不超过tol时停止
+    Returns:
+        owner, node, share: 三元组, 不含根自身的1, 按(owner, node)升序排列
+        iterations: 不动点迭代的轮数, 无环时为0
+    """
+    src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+    weight = np.asarray(weight, dtype=float)
+    ptr, order = buildCsr(src, n)
+    outDst, outWeight = dst[order], weight[order]
+    deg = np.bincount(dst, minlength=n)
+    if roots is None:
+        roots = np.flatnonzero(deg == 0)
+    alive = np.ones(n, dtype=bool)
+    levels = np.full(n, -1, dtype=np.int64)
+    peelZeroDegree(deg, ptr, order, dst, alive, levels)
+
+    def emit(owner, node, share):
+        # 沿出边把(owner, node, share)推给node的各个后继
+        pos = csrRanges(ptr, node)
+        counts = ptr[node + 1] - ptr[node]
+        return np.repeat(owner, counts), outDst[pos], np.repeat(share, counts) * outWeight[pos]
+
+    # 各层收到的三元组, 键为owner * n + node; 最后一项为环上及其下游的节点
+    depth = int(levels.max()) + 1 if n else 0
+    buckets = [([], []) for _ in range(depth + 1)]
+    roots = np.asarray(roots, dtype=np.int64)
+    keys, shares = [roots * n + roots], [np.ones(len(roots))]
+    for level in range(depth):
+        if level:
+            keys, shares = buckets[level]
+        if not keys:
+            continue
+        key, share = _sumByKey(np.concatenate(keys), np.concatenate(shares))
+        buckets[level] = ([key], [share])
+        owner, node, share = emit(key // n, key % n, share)
+        target = levels[node]
+        for lv in np.unique(target).tolist():
+            mask = target == lv
+            bucket = buckets[lv]
+            bucket[0].append(owner[mask] * n + node[mask])
+            bucket[1].append(share[mask])
+    # 不动点迭代: x = b + x W, b为无环部分推入的比例
+    baseKeys, baseShares = buckets[-1]
+    iterations = 0
+    if baseKeys:
+        baseKey, baseShare = _sumByKey(np.concatenate(baseKeys), np.concatenate(baseShares))
+        key, share = baseKey, baseShare
+        for iterations in range(1, maxIter + 1):
+            owner, node, pushed = emit(key // n, key % n, share)
+            nextKey, nextShare = _sumByKey(np.r_[baseKey, owner * n + node], np.r_[baseShare, pushed])
+            # 比例只增不减, 上一轮的键都在本轮中
+            delta = nextShare.copy()
+            delta[np.searchsorted(nextKey, key)] -= share
+            key, share = nextKey, nextShare
+            if np.abs(delta).max(initial=0.0) <= tol:
+                break
+        buckets[-1] = ([key], [share])
+    else:
+        buckets[-1] = ([], [])
+    keys = [k for bucket in buckets for k in bucket[0]]
+    shares = [s for bucket in buckets for s in bucket[1]]
+    if not keys:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), iterations
+    key, share = _sumByKey(np.concatenate(keys), np.concatenate(shares))
+    owner, node = key // n, key % n
+    notSelf = owner != node
+    return owner[notSelf], node[notSelf], share[notSelf], iterations
+
+
+class ComponentList(list):
+    """
+    graphCache.splitComponents切分出的子图列表, 子图均为graph的subgraph视图, 即graph的各个弱连通分量
+    同时保留建图所用的紧凑图和子图编号, 可直接在数组上计算, 不必遍历networkx的邻接表
+    """
+
+    def __init__(self, components, graph, core=None, labels=None):
+        """
+        Params:
+            components: 子图列表
+            graph: 子图所基于的完整图
+            core: graph由其toNx得到的CompactGraph
+            labels: core中每个节点所属子图的编号, 第k个子图即labels为k的节点
+        """
+        super().__init__(components)
+        self.graph = graph
+        self.core = core
+        self.labels = labels
+
+    def nodeDatas(self):
+        """
+        core中各编号对应节点的属性字典, 按编号排列
+        """
+        nodes = self.graph.nodes
+        keys = range(self.core.numberOfNodes()) if "ids" in self.graph.graph else self.core.ids.ids
+        return [nodes[k] for k in keys]
+
+
+def baseGraph(GList):
+    """
+    子图列表所基于的完整图, GList不是splitComponents的返回值时为None
+    子图是完整图的弱连通分量, 节点的邻居都在同一子图中, 直接读取完整图的邻接字典比逐个过滤邻居的视图快得多,
+    邻居的顺序与视图一致
+    """
+    return getattr(GList, "graph", None)
+
+
+def stronglyConnectedComponents(nodes, adj):
+    """
+    迭代版Tarjan算法求强连通分量, 不受递归深度限制, 时间复杂度O(V+E)
+    Params:
+        nodes: 节点集合
+        adj: 邻接表, adj[n]可迭代得到n的后继, 如networkx图的G.adj
+    Returns:
+        sccs: 强连通分量的列表, 按逆拓扑序排列, 即分量的后继分量总是先于它出现
+    """
+    index, low = dict(), dict()
+    onStack = set()
+    stack = list()
+    sccs = list()
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        onStack.add(root)
+        work = [(root, iter(adj[root]))]
+        while work:
+            v, children = work[-1]
+            for w in children:
+                if w not in index:
+                    # 深入搜索w, 处理完w后再继续遍历v剩余的后继
+                    index[w] = low[w] = len(index)
+                    stack.append(w)
+                    onStack.add(w)
+                    work.append((w, iter(adj[w])))
+                    break
+                elif w in onStack and index[w] < low[v]:
+                    low[v] = index[w]
+            else:
+                work.pop()
+                if work and low[v] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[v]
+                if low[v] == index[v]:
+                    scc = list()
+                    while True:
+                        w = stack.pop()
+                        onStack.discard(w)
+                        scc.append(w)
+                        if w == v:
+                            break
+                    sccs.append(scc)
+    return sccs
+
+
+def boundedSimpleCycles(nodes, adj, maxLength, minLength=1, limit=None):
+    """
+    枚举长度在[minLength, maxLength]内的简单环, 每个环只以其中序号最小的节点为起点输出一次
+    迭代实现, 搜索深度受maxLength限制
+    Params:
+        nodes: 节点集合, 通常为同一个强连通分量内的节点
+        adj: 邻接表, adj[n]可迭代得到n的后继
+        maxLength: 环的最大节点数
+        minLength: 环的最小节点数
+        limit: 最多输出的环数, 为空时不限制
+    Returns:
+        cycles: 环的列表, 每个环为按方向排列的节点列表
+    """
+    order = {n: i for i, n in enumerate(nodes)}
+    cycles = list()
+    for start in order:
+        rank = order[start]
+        path = [start]
+        onPath = {start}
+        work = [iter(adj[start])]
+        while work:
+            for w in work[-1]:
+                if w == start:
+                    if len(path) >= minLength:
+                        cycles.append(list(path))
+                        if limit is not None and len(cycles) >= limit:
+                            return cycles
+                elif w in order and order[w] > rank and w not in onPath and len(path) < maxLength:
+                    path.append(w)
+                    onPath.add(w)
+                    work.append(iter(adj[w]))
+                    break
+            else:
+                work.pop()
+                onPath.discard(path.pop())
+    return cycles
@@ -4,39 +4,80 @@ import numpy as np
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
-from collections import defaultdict
+from collections import defaultdict, deque
 
+import graphCore
+import graphCache
+import instrument
+import jsonWriter
 
-def getInitGuaranteeG(path):
+
+def cleanGuaranteeTable(guarantee):
+    """
+    规范担保关系表: 修改列名, 删去无效的担保
+    Params:
+        guarantee: 原始担保关系表
+    Returns:
+        guarantee: 列为src, destn, time, guarType, amount的表
+    """
+    guarantee.columns = ["src", "destn", "time", "guarType", "amount"]
+    # 担保金额为0的样本视为无效的担保, 直接删去, 可减少870条边
+    return guarantee[~guarantee["amount"].isin([0])]
+
+
+def buildGuaranteeCore(guarantee):
+    """
+    由担保关系表按列批量构建紧凑图, 节点的担保类型以位掩码存储
+    Params:
+        guarantee: cleanGuaranteeTable处理后的表
+    Returns:
+        core: CompactGraph
+    """
+    return graphCore.CompactGraph.fromColumns(
+        guarantee["src"],
+        guarantee["destn"],
+        nodeAttrs={
+            "guarType": lambda n: np.zeros(n, dtype=np.uint8),
+            "m": lambda n: np.zeros(n),
+            "std": lambda n: np.zeros(n),
+        },
+        edgeAttrs={
+            "guarType": pd.Categorical(guarantee["guarType"]),
+            "amount": guarantee["amount"].to_numpy(),
+            "mij": np.zeros(len(guarantee), dtype=np.uint8),
+        },
+    )
+
+
+@instrument.timed("guarantee.ingest", counts=instrument.ofResult)
+def getInitGuaranteeG(path, compact=False, cacheDir=None):
     """
     读取担保关系的excel表格到DataFrame, 并切分子图
     Params:
         path: 含有担保关系数据的excel表格
+        compact: 为True时直接返回整数编号的紧凑图, 不构建networkx图
+        cacheDir: 建图缓存目录, 为None时不使用缓存, 见graphCache
     Returns: 
-        subG: 根据表格数据切分得到的子图集合, 每个元素都是一副子图
+        subG: 根据表格数据切分得到的子图集合, 每个元素都是一副子图; compact为True时为CompactGraph
     """
-    guarantee = pd.read_csv(path, encoding="gb2312")
-    guarantee.columns = ["src", "destn", "time", "guarType", "amount"]
-    # 担保金额为0的样本视为无效的担保, 直接删去, 可减少870条边
-    guarantee = guarantee[~guarantee["amount"].isin([0])]
-
-    # 构建初始图G
-    G = nx.DiGraph()
-    for _, row in guarantee.iterrows():
-        G.add_node(row["src"], guarType=[], m=0.0, std=0.0)
-        G.add_node(row["destn"], guarType=[], m=0.0, std=0.0)
-        G.add_edge(
-            row["src"],
-            row["destn"],
-            guarType=row["guarType"],
-            amount=row["amount"],
-            mij=0,
-        )
+    cache = graphCache.GraphCache(None if compact else cacheDir, "guarantee", path, {"encoding": "gb2312"})
+    cached = cache.load()
+    if cached is None:
+        guarantee = cleanGuaranteeTable(pd.read_csv(path, encoding="gb2312"))
+        core = buildGuaranteeCore(guarantee)
+        if compact:
+            return core
+    else:
+        core, labels, _ = cached
+    # 构建初始图G, 担保类型位掩码还原为类型名列表
+    G = core.toNx(decoders={"guarType": graphCore.guarTypeNames})
     # 切分子图
-    tmp = nx.to_undirected(G)
-    subG = list()
-    for c in nx.connected_components(tmp):
-        subG.append(G.subgraph(c))
+    with instrument.stage("guarantee.split"):
+        if cached is None:
+            labels = core.componentLabels()
+        subG = graphCache.splitComponents(G, core, labels)
+    if cached is None:
+        cache.save(core, labels)
     print("----------初始化子图信息完成----------")
     print("有效担保关系节点总数：", nx.number_of_nodes(G))
     print("有效担保关系边总数：", nx.number_of_edges(G))
@@ -44,6 +85,252 @@ def getInitGuaranteeG(path):
     return subG
 
 
+def circleLabels(src, dst, n):
+    """
+    在数组表示的担保关系图上找出担保圈上的节点, 判定方式同findCircleNodes
+    节点v在长度不少于3的简单有向环上, 当且仅当v在同一强连通分量内有后继w和前驱u, u != w,
+    且去掉v后w仍能到达u. 分量内没有反向边的边v->w, 由w沿最短路径回到v即成环, 两端直接标记;
+    只有分量内的边全部为互保的节点才需要搜索, 见_closesCircle
+    Params:
+        src, dst: 每条边起点和终点的编号
+        n: 节点数
+    Returns:
+        labels: 担保圈节点所在强连通分量的编号, 按分量的求出顺序递增, 不在担保圈上为-1
+    """
+    labels = np.full(n, -1, dtype=np.int64)
+    if not len(src):
+        return labels
+    ptr, order = graphCore.buildCsr(src, n)
+    heads, ptr = dst[order].tolist(), ptr.tolist()
+    nodes = np.unique(np.concatenate([src, dst])).tolist()
+    adj = {v: heads[ptr[v]:ptr[v + 1]] for v in nodes}
+    sccs = [scc for scc in graphCore.stronglyConnectedComponents(nodes, adj) if len(scc) >= 3]
+    if not sccs:
+        return labels
+    comp = np.full(n, -1, dtype=np.int64)
+    for k, scc in enumerate(sccs):
+        comp[scc] = k
+    # 分量内部的边, 忽略自环和重复的边
+    inside = (comp[src] >= 0) & (comp[src] == comp[dst]) & (src != dst)
+    key = np.unique(src[inside] * n + dst[inside])
+    head, tail = key // n, key % n
+    single = ~np.isin(tail * n + head, key)
+    onCircle = np.zeros(n, dtype=bool)
+    onCircle[head[single]] = True
+    onCircle[tail[single]] = True
+    # 其余节点的分量内邻居均为互保, 逐个搜索
+    rest = np.flatnonzero((comp >= 0) & ~onCircle).tolist()
+    if rest:
+        ptr, order = graphCore.buildCsr(head, n)
+        tails, ptr = tail[order].tolist(), ptr.tolist()
+        succ = {v: tails[ptr[v]:ptr[v + 1]] for v in np.unique(head).tolist()}
+        for v in rest:
+            if _closesCircle(v, succ):
+                onCircle[v] = True
+    labels[onCircle] = comp[onCircle]
+    return labels
+
+
+def _closesCircle(v, succ):
+    """
+    判断分量内邻居均为互保的节点v是否在长度不少于3的担保圈上
+    去掉v后从v的各个邻居同时出发搜索, 每个节点至多记录两个不同的出发点,
+    某个邻居被另一个邻居到达即成环; 每次搜索O(V+E)
+    Params:
+        v: 节点编号
+        succ: 强连通分量内部的后继列表
+    """
+    nbrs = succ.get(v, ())
+    if len(nbrs) < 2:
+        return False
+    targets = set(nbrs)
+    origins = {w: [w] for w in nbrs}
+    queue = deque((w, w) for w in nbrs)
+    while queue:
+        x, o = queue.popleft()
+        for y in succ[x]:
+            if y == v:
+                continue
+            seen = origins.setdefault(y, [])
+            if o in seen or len(seen) >= 2:
+                continue
+            if y in targets and y != o:
+                return True
+            seen.append(o)
+            queue.append((y, o))
+    return False
+
+
+def findCircleNodes(G):
+    """
+    找出担保圈上的节点, 即位于长度不少于3的简单有向环上的节点, 双节点的互保不作为担保圈
+    基于强连通分量, 只有分量内的边全部为互保的节点需要额外搜索, 见circleLabels
+    Params:
+        G: 担保关系图
+    Returns:
+        circles: 担保圈节点集合的列表, 每个强连通分量至多对应一个集合
+    """
+    nodes = list(G.nodes)
+    index = {v: i for i, v in enumerate(nodes)}
+    src, dst = list(), list()
+    for u, nbrs in G.adj.items():
+        for v in nbrs:
+            src.append(index[u])
+            dst.append(index[v])
+    labels = circleLabels(np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64), len(nodes))
+    circles = dict()
+    for v, k in zip(nodes, labels.tolist()):
+        if k >= 0:
+            circles.setdefault(k, set()).add(v)
+    return [circles[k] for k in sorted(circles)]
+
+
+def coreCircles(core):
+    """
+    在担保关系的紧凑图上找出担保圈, 判定方式同findCircleNodes, 不构建networkx图
+    Params:
+        core: getInitGuaranteeG在compact为True时返回的CompactGraph
+    Returns:
+        circles: 担保圈上公司ID集合的列表, 每个强连通分量至多对应一个集合
+    """
+    n = core.numberOfNodes()
+    labels = circleLabels(core.src.astype(np.int64), core.dst.astype(np.int64), n)
+    nodes = np.flatnonzero(labels >= 0)
+    order = np.argsort(labels[nodes], kind="stable")
+    nodes, labels = nodes[order], labels[nodes][order]
+    starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) if len(nodes) else np.zeros(0, dtype=np.int64)
+    ids = core.ids.lookup(nodes)
+    return [set(ids[a:b]) for a, b in zip(starts.tolist(), starts[1:].tolist() + [len(ids)])]
+
+
+def enumerateCircles(GList, maxLength=6, limit=None):
+    """
+    枚举担保圈, 用于报告具体的担保路径, 需在markRiskOfGuaranteeG之后调用
+    Params:
+        GList: 已标记担保类型的子图列表
+        maxLength: 担保圈的最大节点数
+        limit: 每个担保圈最多输出的环数, 为空时不限制
+    Returns:
+        circles: (子图编号, 环上节点列表)的列表, 环长不小于3
+    """
+    circles = list()
+    for Gid, subG in enumerate(GList):
+        nodes = [n for n in subG.nodes if "Circle" in subG.nodes[n]["guarType"]]
+        if not nodes:
+            continue
+        circleG = subG.subgraph(nodes)
+        for members in findCircleNodes(circleG):
+            for cycle in graphCore.boundedSimpleCycles(
+                members, circleG.adj, maxLength, minLength=3, limit=limit
+            ):
+                circles.append((Gid, cycle))
+    print("长度不超过%d的担保圈数量：" % maxLength, len(circles))
+    return circles
+
+
+def _flattenComponents(GList):
+    """
+    将各子图的节点和边展开为数组, 节点按邻接表的遍历顺序编号, 同一子图的节点编号连续
+    子图来自splitComponents时直接读取完整图的后继字典, 子图是弱连通分量, 后继都在同一子图中
+    Params:
+        GList: 担保关系子图列表
+    Returns:
+        datas: 节点属性字典的列表
+        gids: 各节点所属子图的编号
+        src, dst, amount: 每条边起点和终点的编号及担保金额, 按邻接表的遍历顺序排列
+    """
+    datas, index, gids = list(), dict(), list()
+    for Gid, G in enumerate(GList):
+        for n in G.adj:
+            index[n] = len(datas)
+            datas.append(G.nodes[n])
+            gids.append(Gid)
+    base = graphCore.baseGraph(GList)
+    src, dst, amount = list(), list(), list()
+    for G in GList:
+        succ = (G if base is None else base).succ
+        for u in G.adj:
+            i = index[u]
+            for v, d in succ[u].items():
+                src.append(i)
+                dst.append(index[v])
+                amount.append(d["amount"])
+    return (
+        datas,
+        np.asarray(gids, dtype=np.int64),
+        np.asarray(src, dtype=np.int64),
+        np.asarray(dst, dtype=np.int64),
+        np.asarray(amount, dtype=float),
+    )
+
+
+def markRiskOfComponents(GList):
+    """
+    标记各担保关系子图中节点的担保类型
+    所有子图的边合并为数组, 由出入度一次性以位掩码标记各类型, 拓扑剥离按层推进,
+    只对剥离后剩余的含环部分求担保圈, 全程不构建图
+    子图来自splitComponents时直接使用建图时的边数组、CSR结构和子图编号, 只在最后把结果写回节点属性
+    Params:
+        GList: 担保关系子图列表
+    """
+    bits = graphCore.guarTypeBits
+    compact = getattr(GList, "core", None)
+    if compact is not None:
+        datas = None
+        n = compact.numberOfNodes()
+        gids = np.asarray(GList.labels, dtype=np.int64)
+        src, dst = compact.src.astype(np.int64), compact.dst.astype(np.int64)
+        outPtr, outEdge, inPtr, inEdge = compact.outPtr, compact.outEdge, compact.inPtr, compact.inEdge
+    else:
+        datas, gids, src, dst, _ = _flattenComponents(GList)
+        n = len(datas)
+        outPtr, outEdge = graphCore.buildCsr(src, n)
+        inPtr, inEdge = graphCore.buildCsr(dst, n)
+    if not n:
+        return
+    outDeg, inDeg = np.bincount(src, minlength=n), np.bincount(dst, minlength=n)
+    mask = np.zeros(n, dtype=np.uint8)
+    # 双节点的子图, 仅可能为普通担保(只有一条边, 即为树)或互保
+    size = np.bincount(gids)[gids]
+    edgeCount = np.bincount(gids[src], minlength=len(GList))[gids]
+    mask[(size == 2) & (edgeCount == 1)] |= bits["Normal"]
+    mask[(size == 2) & (edgeCount != 1)] |= bits["Mutual"]
+    # 一保多(星型担保 or 担保公司)和多保一(联合担保)
+    mask[outDeg >= 3] |= bits["Cross"]
+    mask[inDeg >= 3] |= bits["Focus"]
+    # 分别进行正向和逆向的拓扑剥离, 剩余的节点处于担保圈或互保关系之中或之间
+    alive = np.ones(n, dtype=bool)
+    graphCore.peelZeroDegree(inDeg.copy(), outPtr, outEdge, dst, alive)
+    inner = alive[src] & alive[dst]
+    graphCore.peelZeroDegree(np.bincount(src[inner], minlength=n), inPtr, inEdge, src, alive)
+    inner = alive[src] & alive[dst]
+    if inner.any():
+        # 互保判定, 自环视为与自身互保
+        key = src * n + dst
+        mutual = inner & np.isin(dst * n + src, key[inner])
+        mask[src[mutual]] |= bits["Mutual"]
+        mask[dst[mutual]] |= bits["Mutual"]
+        # 担保圈判定, 对剩余的边统一处理
+        mask[circleLabels(src[inner], dst[inner], n) >= 0] |= bits["Circle"]
+    # 担保链: 若节点均不属于上述情况则该节点为担保链上的点
+    mask[(mask == 0) & (outDeg + inDeg > 0)] = bits["Chain"]
+    names = {m: graphCore.guarTypeNames(m) for m in np.unique(mask).tolist()}
+    if datas is None:
+        datas = GList.nodeDatas()
+    for d, m in zip(datas, mask.tolist()):
+        d["guarType"] = list(names[m])
+
+
+def markRiskOfComponent(subG):
+    """
+    标记单个担保关系子图中各节点的担保类型
+    Params:
+        subG: 担保关系子图
+    """
+    markRiskOfComponents([subG])
+
+
+@instrument.timed("guarantee.markRisk", counts=instrument.ofInput)
 def markRiskOfGuaranteeG(GList):
     """
     标记担保关系图的风险
@@ -52,96 +339,99 @@ def markRiskOfGuaranteeG(GList):
     Output:
         GList: 更新担保关系的列表
     """
-    for subG in GList:
-        # 双节点的子图, 仅可能为普通担保或互保
-        if subG.number_of_nodes() == 2:
-            # 普通担保判定
-            if nx.is_tree(subG):
-                for n in subG.nodes():
-                    subG.nodes[n]["guarType"].append("Normal")
-            # 互保判定
-            else:
-                for n in subG.nodes():
-                    subG.nodes[n]["guarType"].append("Mutual")
-        # 多于2个节点的情形, 标记节点所属的担保关系类型
-        for u, v in subG.edges:
-            # 贪心策略: u为源点，则认为u更有可能为Cross; v为终点，则认为v更有可能成为Focus
-            # 原图中标记为Cross的边, 形如u为交通枢纽, 即u的度较大
-            # 一保多(星型担保 or 担保公司)
-            if subG.out_degree(u) >= 3 and "Cross" not in subG.nodes[u]["guarType"]:
-                subG.nodes[u]["guarType"].append("Cross")
-            # 原图中标记为Focus的边, 形如多个节点指向一个节点
-            # 多保一(联合担保)
-            if subG.in_degree(v) >= 3 and "Focus" not in subG.nodes[v]["guarType"]:
-                subG.nodes[v]["guarType"].append("Focus")
-        # 担保圈, 直接通过边属性检查, 经检验只有两个子图含有Circle标记, 但元数据的标记不准确
-        # 分别进行正向和逆向的拓扑排序检查, 可以找到遗漏的担保圈和互保关系
-        tmpG = nx.DiGraph(subG)
-        flag = True
-        while flag:
-            flag = False
-            l = list()
-            for n in tmpG.nodes():
-                if tmpG.in_degree(n) == 0:
-                    l.append(n)
-                    flag = True
-            tmpG.remove_nodes_from(l)
-        # 将边逆向, 再次拓扑排序
-        tmpG = nx.reverse(tmpG)
-        flag = True
-        while flag:
-            flag = False
-            l = list()
-            for n in tmpG.nodes():
-                if tmpG.in_degree(n) == 0:
-                    l.append(n)
-                    flag = True
-            tmpG.remove_nodes_from(l)
-        # 拓扑排序后图非空说明含有担保圈或互保关系
-        if nx.number_of_nodes(tmpG):
-            # 互保判定
-            for u, v in tmpG.edges():
-                if tmpG.has_edge(v, u):
-                    if "Mutual" not in subG.nodes[u]["guarType"]:
-                        subG.nodes[u]["guarType"].append("Mutual")
-                    if "Mutual" not in subG.nodes[v]["guarType"]:
-                        subG.nodes[v]["guarType"].append("Mutual")
-            # 担保圈判定
-            visited = list()
-            trace = list()
-
-            def dfs2FindCircle(node):
-                """
-                用回溯法找环
-                Params:
-                    node: 子图的起始搜索节点
-                """
-                if node in visited:
-                    if node in trace:
-                        trace_index = trace.index(node)
-                        # 双节点的互保不作为担保圈进行标记
-                        if len(trace) - trace_index > 2:
-                            for i in range(trace_index, len(trace)):
-                                if "Circle" not in subG.nodes[trace[i]]["guarType"]:
-                                    subG.nodes[trace[i]]["guarType"].append("Circle")
-                    return
-                visited.append(node)
-                trace.append(node)
-                for child in list(tmpG.neighbors(node)):
-                    dfs2FindCircle(child)
-                trace.pop()
-
-            dfs2FindCircle(list(tmpG.nodes())[0])
-        # 担保链: 若节点均不属于上述情况则该节点为担保链上的点
-        for u, v in subG.edges():
-            if not subG.nodes[u]["guarType"] and "Chain" not in subG.nodes[u]["guarType"]:
-                subG.nodes[u]["guarType"].append("Chain")
-            if not subG.nodes[v]["guarType"] and "Chain" not in subG.nodes[v]["guarType"]:
-                    subG.nodes[v]["guarType"].append("Chain")
+    markRiskOfComponents(GList)
     print("----------担保关系识别完成----------")
     return GList
 
 
+def quantifyComponents(GList):
+    """
+    计算各子图中节点的风险值m及其用于可视化的标准化值std
+    所有子图的边合并为数组, 按子图和节点用bincount分段求和, 不复制子图
+    与按子图构建无向图的计算方式一致: 互为反向的两条边视为一条无向边, 金额取邻接表中靠后的一条,
+    每个节点的各项按无向图邻接表的顺序累加, 因此结果逐位相同
+    Params:
+        GList: 担保关系子图列表
+    """
+    datas, gids, src, dst, amount = _flattenComponents(GList)
+    if not datas:
+        return
+    _writeScores(datas, gids, _riskValues(gids, src, dst, amount, len(GList)))
+
+
+def quantifyCore(core, labels):
+    """
+    在担保关系的紧凑图上计算各节点的风险值m, 不构建networkx图
+    边按起点编号、同一起点按表中的先后排列, 即与以编号为节点的完整图的邻接表顺序相同, 其余同quantifyComponents
+    Params:
+        core: getInitGuaranteeG在compact为True时返回的CompactGraph
+        labels: 每个节点所属子图的编号, 见CompactGraph.componentLabels
+    Returns:
+        m: 各节点的风险值, 按编号排列
+    """
+    order = core.outEdge
+    gids = np.asarray(labels, dtype=np.int64)
+    src, dst = core.src[order].astype(np.int64), core.dst[order].astype(np.int64)
+    amount = np.asarray(core.edgeAttrs["amount"], dtype=float)[order]
+    return _riskValues(gids, src, dst, amount, int(gids.max()) + 1 if len(gids) else 0)
+
+
+def _riskValues(gids, src, dst, amount, k):
+    """
+    由边数组计算各节点的风险值m, 见quantifyComponents
+    Params:
+        gids: 各节点所属子图的编号
+        src, dst, amount: 每条边起点和终点的编号及担保金额, 按邻接表的遍历顺序排列
+        k: 子图个数
+    Returns:
+        m: 各节点的风险值
+    """
+    n = len(gids)
+    lo, hi = np.minimum(src, dst), np.maximum(src, dst)
+    # 无向边: 位置取首次出现, 金额取最后一次出现
+    _, first, inverse = np.unique(lo * n + hi, return_index=True, return_inverse=True)
+    last = np.zeros(len(first), dtype=np.int64)
+    np.maximum.at(last, inverse, np.arange(len(src)))
+    lo, hi, amount = lo[first], hi[first], amount[last]
+    # 子图的边金额总和, 每条边在编号较小的端点处按邻接顺序计入
+    order = np.lexsort((first, lo))
+    txnAllSum = np.bincount(gids[lo[order]], weights=amount[order], minlength=k)
+    # 每条边对两个端点各贡献一次, 自环只贡献一次
+    loop = lo == hi
+    node = np.concatenate([lo, hi[~loop]])
+    pos = np.concatenate([first, first[~loop]])
+    term = np.concatenate([amount, amount[~loop]]) / txnAllSum[gids[node]]
+    order = np.lexsort((pos, node))
+    return np.bincount(node[order], weights=term[order], minlength=n)
+
+
+def _writeScores(datas, gids, m):
+    """
+    写入节点的风险值m, 并按子图做min-max标准化得到可视化用的std, 范围为[5, 25], 子图内m全部相同时为15
+    Params:
+        datas: 节点属性字典的列表
+        gids: 各节点所属子图的编号, 同一子图的节点相邻
+        m: 各节点的风险值
+    """
+    starts = np.flatnonzero(np.r_[True, gids[1:] != gids[:-1]])
+    maxM, minM = np.maximum.reduceat(m, starts)[gids], np.minimum.reduceat(m, starts)[gids]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = 5 + 20 / (maxM - minM) * (m - minM)
+    for d, mi, si, same in zip(datas, m.tolist(), std.tolist(), (maxM == minM).tolist()):
+        d["m"] = mi
+        d["std"] = 15 if same else si
+
+
+def quantifyComponent(G):
+    """
+    计算单个子图中各节点的风险值m及其用于可视化的标准化值std
+    Params:
+        G: 担保关系子图
+    """
+    quantifyComponents([G])
+
+
+@instrument.timed("guarantee.quantify", counts=instrument.ofInput)
 def riskQuantification(subG):
     """
     标记节点的风险值m
@@ -150,143 +440,184 @@ def riskQuantification(subG):
     Outputs:
         G: 标记各个节点风险值m后的子图列表
     """
-    for G in subG:
-        de = dict()
-        tmpG = nx.Graph(G)
-        txnAllSum = sum(nx.get_edge_attributes(tmpG, "amount").values())
-        for n in tmpG.nodes():
-            neighbors = tmpG.adj[n].keys()
-            de[n] = sum(tmpG[n][neighbor]["amount"] / txnAllSum for neighbor in neighbors)
-            G.nodes[n]["m"] = de[n]
-        maxM, minM = max(de.values()), min(de.values())
-        if maxM == minM:
-            for n in G.nodes():
-                G.nodes[n]["std"] = 15
-        else:
-            k = 20/(maxM - minM)
-            for n in G.nodes():
-                G.nodes[n]["std"] = 5 + k * (G.nodes[n]["m"] - minM)
+    quantifyComponents(subG)
     print("----------m值计算完成----------")
 
 
+def contagionOfComponents(GList, decay=0.5, maxIter=200, tol=1e-9):
+    """
+    计算各子图中节点的违约传染风险值, 写入m和std, 可代替quantifyComponents
+    被担保人违约时由担保人承担担保金额; 担保人自身承担的敞口无法兑付时, 又按担保金额的比例转嫁给它的各担保人,
+    沿担保链层层传递, 每经过一层乘以decay:
+        x = e + decay * M x
+    其中e_i为i担保的总金额, M_ij = a_ij / S_j, a_ij为i为j担保的金额, S_j为j获得的担保总额
+    M每列之和为1或0, 因此decay < 1时迭代收敛, 每轮的变化量至少缩小为decay倍, 担保圈上的放大不超过1 / (1 - decay)
+    所有子图的边合并为数组一起迭代, m为x除以所在子图的担保总额, decay为0时即各节点担保的金额占子图总额的比例
+    Params:
+        GList: 担保关系子图列表
+        decay: 每多经过一层担保的衰减系数, 需在[0, 1)内
+        maxIter: 最多迭代的轮数
+        tol: 相邻两轮的最大变化量不超过tol乘以e的最大值时停止
+    Returns:
+        iterations: 实际迭代的轮数
+    """
+    if not 0 <= decay < 1:
+        raise ValueError("decay需在[0, 1)内")
+    datas, gids, src, dst, amount = _flattenComponents(GList)
+    if not datas:
+        return 0
+    n = len(datas)
+    e = np.bincount(src, weights=amount, minlength=n)
+    total = np.bincount(gids[src], weights=amount, minlength=len(GList))
+    # 自己为自己担保不会转嫁
+    keep = src != dst
+    src, dst, amount = src[keep], dst[keep], amount[keep]
+    received = np.bincount(dst, weights=amount, minlength=n)
+    weight = decay * amount / received[dst]
+    x, iterations = e, 0
+    for iterations in range(1, maxIter + 1):
+        nextX = e + np.bincount(src, weights=weight * x[dst], minlength=n)
+        delta = np.abs(nextX - x).max()
+        x = nextX
+        if delta <= tol * e.max():
+            break
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m = np.where(total[gids] > 0, x / total[gids], 0.0)
+    _writeScores(datas, gids, m)
+    return iterations
+
 
-def graphs2json(GList):
+def contagionOfComponent(G, decay=0.5):
     """
-    将图数据输出为前端可视化用的json文件
+    计算单个子图中各节点的违约传染风险值
     Params:
-        GList: 图数据
+        G: 担保关系子图
+        decay: 同contagionOfComponents
+    """
+    contagionOfComponents([G], decay)
+
+
+@instrument.timed("guarantee.contagion", counts=instrument.ofInput)
+def contagionQuantification(subG, decay=0.5):
+    """
+    以违约传染风险值作为节点的风险值m, 见contagionOfComponents
+    Params:
+        subG: 子图列表
+        decay: 每多经过一层担保的衰减系数
     Outputs:
-        输出转化后的json文件到filePath1和filepath2下
+        subG: 标记各个节点风险值m后的子图列表
+    """
+    iterations = contagionOfComponents(subG, decay)
+    print("----------传染风险值计算完成, 迭代%d轮----------" % iterations)
+
+
+def componentJson(item, Gid):
+    """
+    将一个子图转化为前端可视化用的点和边
+    Params:
+        item: 担保关系子图
+        Gid: 子图编号
+    Returns:
+        nodes, links: 点和边的字典列表
+        types: 子图所含的风险类型集合, 取值为Mutual、Focus、Cross、Circle
     """
-    circleList = {"links": [], "nodes": []}
-    mutualList = {"links": [], "nodes": []}
-    crossList = {"links": [], "nodes": []}
-    focusList = {"links": [], "nodes": []}
-    doubleNormalList = {"links": [], "nodes": []}
-    multiNormalList = {"links": [], "nodes": []}
-    Gid = 0  # 子图编号
-    doubleCount = 0
-    i = 0
     c = ["doubleRisk", "tripleRisk", "quadraRisk"]
     offsetDict = {"Chain": 0, "Mutual": 1, "Focus": 2, "Cross": 3,"Circle": 4, "Normal": 5}
-    for item in GList:
-        # 初始化子图数据, 先后加点和边
-        isMutual, isCircle, isCross, isFocus, isUnusual = False, False, False, False, False
-        tmp = {"links": [], "nodes": []}
-        for n in item.nodes:
-            riskCount = len(item.nodes[n]["guarType"]) - 1
-            if "Mutual" in item.nodes[n]["guarType"]:
-                isMutual, isUnusual = True, True
-            if "Focus" in item.nodes[n]["guarType"]:
-                isFocus, isUnusual = True, True
-            if "Cross" in item.nodes[n]["guarType"]:
-                isCross, isUnusual = True, True
-            if "Circle" in item.nodes[n]["guarType"]:
-                isCircle, isUnusual = True, True
-            if riskCount > 0:
-                tmp["nodes"].append({
-                    "group": riskCount + 5, 
-                    "class": c[riskCount-1], 
-                    "size": item.nodes[n]["std"], 
-                    "ctx": ', '.join(item.nodes[n]["guarType"]), 
-                    "Gid": Gid, 
-                    "id": n, 
-                    "m": item.nodes[n]["m"]
-                })
-            else:
-                tmp["nodes"].append({
-                    "group": offsetDict[item.nodes[n]["guarType"][0]], 
-                    "class": item.nodes[n]["guarType"][0], 
-                    "size": item.nodes[n]["std"], 
-                    "ctx": ', '.join(item.nodes[n]["guarType"]), 
-                    "Gid": Gid, 
-                    "id": n, 
-                    "m": item.nodes[n]["m"]
-                })
-        # 加边
-        for u, v in item.edges:
-            tmp["links"].append({
-                "source": u, 
-                "target": v, 
-                "amount": item[u][v]["amount"]
+    nodes, links = list(), list()
+    types = set()
+    for n in item.nodes:
+        riskCount = len(item.nodes[n]["guarType"]) - 1
+        types.update(t for t in item.nodes[n]["guarType"] if t in ("Mutual", "Focus", "Cross", "Circle"))
+        if riskCount > 0:
+            nodes.append({
+                "group": riskCount + 5, 
+                "class": c[riskCount-1], 
+                "size": item.nodes[n]["std"], 
+                "ctx": ', '.join(item.nodes[n]["guarType"]), 
+                "Gid": Gid, 
+                "id": n, 
+                "m": item.nodes[n]["m"]
             })
-        # 存到对应类型的json中
-        if isUnusual:
-            if isCircle:
-                circleList["nodes"] += (tmp["nodes"])
-                circleList["links"] += (tmp["links"])
-            if isMutual:
-                mutualList["nodes"] += (tmp["nodes"])
-                mutualList["links"] += (tmp["links"])
-            if isCross:
-                crossList["nodes"] += (tmp["nodes"])
-                crossList["links"] += (tmp["links"])
-            if isFocus:
-                focusList["nodes"] += (tmp["nodes"])
-                focusList["links"] += (tmp["links"])
-        else:  # "Chain"
-            if nx.number_of_nodes(item) == 2:
-                doubleCount += 2
-                if doubleCount < 2950:
-                    doubleNormalList["nodes"] += (tmp["nodes"])
-                    doubleNormalList["links"] += (tmp["links"])
-                else:
-                    print("doubleNormalList", len(doubleNormalList["nodes"]))
-                    with open("./frontend/public/res/json/guarantee/doubleNormal_" + str(i) + ".json", "w") as f:
-                        json.dump(doubleNormalList, f)
-                    i += 1
-                    doubleCount = 2
-                    doubleNormalList = {"links": [], "nodes": []}
-                    doubleNormalList["nodes"] += (tmp["nodes"])
-                    doubleNormalList["links"] += (tmp["links"])
-            else:
-                multiNormalList["nodes"] += (tmp["nodes"])
-                multiNormalList["links"] += (tmp["links"])
-        Gid += 1
-    # 将剩余的双节点子图存到下一个json中
-    if doubleNormalList["nodes"]:
-        print("doubleNormalList", len(doubleNormalList["nodes"]))
-        with open("./frontend/public/res/json/guarantee/doubleNormal_" + str(i) + ".json", "w") as f:
-            json.dump(doubleNormalList, f)
-    print("circleList", len(circleList["nodes"]))
-    print("mutualList", len(mutualList["nodes"]))
-    print("crossList", len(crossList["nodes"]))
-    print("focusList", len(focusList["nodes"]))
-    print("multiNormalList", len(multiNormalList["nodes"]))
-    # 将上述数据写入文件
-    with open(r"./frontend/public/res/json/guarantee/circle.json", "w") as f:
-        json.dump(circleList, f)
-    with open(r"./frontend/public/res/json/guarantee/mutual.json", "w") as f:
-        json.dump(mutualList, f)
-    with open(r"./frontend/republic/res/jsons/guarantee/cross.json", "w") as f:
-        json.dump(crossList, f)
-    with open(r"./frontend/public/res/json/guarantee/focus.json", "w") as f:
-        json.dump(focusList, f)
-    with open(r"./frontend/public/res/json/guarantee/multiNormal.json", "w") as f:
-        json.dump(multiNormalList, f)
+        else:
+            nodes.append({
+                "group": offsetDict[item.nodes[n]["guarType"][0]], 
+                "class": item.nodes[n]["guarType"][0], 
+                "size": item.nodes[n]["std"], 
+                "ctx": ', '.join(item.nodes[n]["guarType"]), 
+                "Gid": Gid, 
+                "id": n, 
+                "m": item.nodes[n]["m"]
+            })
+    # 加边
+    for u, v in item.edges:
+        links.append({
+            "source": u, 
+            "target": v, 
+            "amount": item[u][v]["amount"]
+        })
+    return nodes, links, types
+
+
+# 前端json文件: 类别 -> 文件名模板, 各类别均按jsonWriter.shardBudget分片
+jsonPath = "./frontend/public/res/json/guarantee/"
+jsonKeys = ("links", "nodes")
+jsonFiles = {
+    "doubleNormal": "doubleNormal_%d.json",
+    "circle": "circle_%d.json",
+    "mutual": "mutual_%d.json",
+    "cross": "cross_%d.json",
+    "focus": "focus_%d.json",
+    "multiNormal": "multiNormal_%d.json",
+}
+
+
+def jsonCategories(item, Gid):
+    """
+    将一个子图转化为点和边, 并确定其所属的前端json类别
+    Params:
+        item: 担保关系子图
+        Gid: 子图编号
+    Returns:
+        nodes, links: 点和边的字典列表
+        categories: jsonFiles中的类别列表
+    """
+    nodes, links, types = componentJson(item, Gid)
+    # 存到对应类型的json中
+    if types:
+        categories = [t.lower() for t in ["Circle", "Mutual", "Cross", "Focus"] if t in types]
+    # "Chain"
+    elif nx.number_of_nodes(item) == 2:
+        categories = ["doubleNormal"]
+    else:
+        categories = ["multiNormal"]
+    return nodes, links, categories
+
+
+@instrument.timed("guarantee.export", counts=instrument.ofInput)
+def graphs2json(GList, backend="auto", formats=()):
+    """
+    将图数据输出为前端可视化用的json文件
+    每个子图处理完后直接写入打开的文件, 内存占用与输出文件的大小无关
+    Params:
+        GList: 图数据
+        backend: json序列化后端, 见jsonWriter.dumps
+        formats: 额外生成的列式或预压缩格式, 见columnar.writePayloads
+    Outputs:
+        输出转化后的json文件到jsonPath下
+    Returns:
+        layout: 各json文件包含的子图编号, 见jsonWriter.LayoutWriter
+    """
+    with jsonWriter.LayoutWriter(jsonPath, jsonFiles, jsonKeys, backend, formats) as writer:
+        for Gid, item in enumerate(GList):
+            writer.write(Gid, *jsonCategories(item, Gid))
+    for category, files in writer.layout.items():
+        for _, _, nodeCount, _ in files:
+            print(category + "List", nodeCount)
     print("----------担保关系的json导出完成完成----------")
+    return writer.layout
 
 
+@instrument.timed("guarantee.answer", counts=instrument.ofInput)
 def ansJson(GList):
     """
     将图数据输出为答案的json文件
@@ -307,10 +638,12 @@ def ansJson(GList):
         # 初始化子图数据, 先后加点和边
         isMutual, isCircle, isCross, isFocus, isUnusual = False, False, False, False, False
         tmp = {"links": [], "nodes": []}
+        # 子图视图的节点数需遍历才能得到, 每个子图只计算一次
+        size = nx.number_of_nodes(item)
         for n in item.nodes:
             riskCount = len(item.nodes[n]["guarType"]) - 1
             # Chain补入
-            if nx.number_of_nodes(item) > 2 and "Chain" not in item.nodes[n]["guarType"]:
+            if size > 2 and "Chain" not in item.nodes[n]["guarType"]:
                 ctx = ', '.join(item.nodes[n]["guarType"]) + ', Chain'
             else:
                 ctx = ', '.join(item.nodes[n]["guarType"])
@@ -360,7 +693,7 @@ def ansJson(GList):
                 focusList["nodes"] += (tmp["nodes"])
                 focusList["links"] += (tmp["links"])
         else:  # "Chain"
-            if nx.number_of_nodes(item) == 2:
+            if size == 2:
                 doubleNormalList["nodes"] += (tmp["nodes"])
                 doubleNormalList["links"] += (tmp["links"])
             else:
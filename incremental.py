@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+增量分析: 保存全量运行得到的图、子图划分和前端json文件的布局, 之后只把增量csv中新增/删除的行应用到保存的图上,
+重新计算受影响的子图(包括因新增边而合并、因删除边而分裂的子图), 并只重写包含这些子图的前端json文件及分片清单
+增量csv与原表的列布局相同, 可在最后增加一列op, 取值为add(默认)或del, del行按与原表相同的规则筛选后删除对应的边,
+先删除后新增, 因此同一条边的del和add即为修改
+用法:
+    python main.py --state-dir ./backend/state
+    python main.py --state-dir ./backend/state --delta guarantee ./backend/res/guarantee_delta.csv
+"""
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+import graphCore
+import control
+import guarantee
+import moneyCollection
+import jsonWriter
+import instrument
+
+modules = {"control": control, "guarantee": guarantee, "moneyCollection": moneyCollection}
+
+
+def statePath(stateDir, table):
+    return os.path.join(stateDir, table + ".pkl")
+
+
+def rootGraph(GList):
+    """
+    子图列表所属的完整图, 子图均为同一个图的subgraph视图
+    """
+    if not GList:
+        return nx.DiGraph()
+    G = graphCore.baseGraph(GList)
+    return nx.compose_all(GList) if G is None else G
+
+
+def saveState(stateDir, table, GList, layout, se=None, scoring=None, maxHops=1, formats=()):
+    """
+    保存全量运行的结果, 作为之后增量更新的起点
+    Params:
+        stateDir: 状态目录
+        table: "control"、"guarantee"或"moneyCollection"
+        GList: 已完成分析的子图列表
+        layout: graphs2json返回的json文件布局
+        se: 资金归集表需要传入findShellEnterprise返回的se
+        scoring: 担保关系表风险值m的计算方式, 如{"score": "contagion", "decay": 0.5}, 增量更新时按同样的方式重算
+        maxHops: 资金归集路径的最大转账跳数, 增量更新时按同样的跳数重新搜索
+        formats: graphs2json额外生成的格式, 增量更新时默认按同样的格式重写
+    """
+    G = rootGraph(GList)
+    state = {
+        "G": G,
+        "components": {Gid: list(item.nodes) for Gid, item in enumerate(GList)},
+        "nextGid": len(GList),
+        "layout": layout,
+        "formats": list(formats),
+    }
+    if table == "control":
+        state["nextCrossId"] = max((c for _, c in G.nodes(data="crossId")), default=-1) + 1
+    if table == "guarantee":
+        state["scoring"] = scoring or {"score": "share"}
+    if table == "moneyCollection":
+        state["matches"] = dict(enumerate(se.graph["matches"]))
+        state["maxHops"] = maxHops
+    _dump(state, statePath(stateDir, table))
+
+
+def loadState(stateDir, table):
+    with open(statePath(stateDir, table), "rb") as f:
+        state = pickle.load(f)
+    # 旧版本保存的三元组(上游, 中间, 下游, 贷款边, 转账边, 比例)转为单跳路径
+    for Gid, matches in state.get("matches", {}).items():
+        state["matches"][Gid] = [
+            ((m[0], m[1], m[2]), (m[3], m[4]), m[5]) if len(m) == 6 else m for m in matches
+        ]
+    return state
+
+
+def _dump(state, path):
+    # 先写临时文件再替换, 中途失败不会破坏已有状态
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(path + ".tmp", path)
+
+
+def _popOp(df):
+    """
+    取出增量表的op列, 不存在时全部视为新增
+    """
+    if "op" not in df.columns:
+        return pd.Series("add", index=df.index)
+    return df.pop("op").fillna("add").astype(str).str.strip().str.lower().replace("", "add")
+
+
+def _mergeNodes(G, addG):
+    """
+    将增量图的新节点加入G, 已有节点保留原属性
+    """
+    G.add_nodes_from((n, d) for n, d in addG.nodes(data=True) if n not in G)
+
+
+def applyControlDelta(G, path):
+    """
+    将控制人增量表应用到图上
+    Returns:
+        touched: 边发生变化的节点集合
+        added, removed: 新增和删除的行数
+    """
+    delta = pd.read_csv(path, encoding="gb2312")
+    op = _popOp(delta)
+    delta = control.cleanControlTable(delta)
+    adds, dels = delta[op != "del"], delta[op == "del"]
+    controlEdges = G.graph.setdefault("controlEdges", set())
+    touched = set()
+    for src, dst in dels[["src", "destn"]].itertuples(index=False):
+        if not G.has_edge(src, dst):
+            continue
+        G.remove_edge(src, dst)
+        touched.update((src, dst))
+        # src的Control关系全部删除后才取消isControl标记
+        if (src, dst) in controlEdges:
+            controlEdges.discard((src, dst))
+            if not any((src, w) in controlEdges for w in G.succ[src]):
+                G.nodes[src]["isControl"] = 0
+    if len(adds):
+        addG = control.buildControlCore(adds).toNx()
+        for n, isControl in addG.nodes(data="isControl"):
+            if n in G:
+                G.nodes[n]["isControl"] |= isControl
+        _mergeNodes(G, addG)
+        G.add_edges_from(addG.edges(data=True))
+        touched.update(addG.nodes)
+        controlEdges.update(adds.loc[adds["relType"] == "Control", ["src", "destn"]].itertuples(index=False, name=None))
+    return touched, len(adds), len(dels)
+
+
+def applyGuaranteeDelta(G, path):
+    """
+    将担保关系增量表应用到图上, 返回值同applyControlDelta
+    """
+    delta = pd.read_csv(path, encoding="gb2312")
+    op = _popOp(delta)
+    delta = guarantee.cleanGuaranteeTable(delta)
+    op = op.loc[delta.index]
+    adds, dels = delta[op != "del"], delta[op == "del"]
+    touched = set()
+    for src, dst in dels[["src", "destn"]].itertuples(index=False):
+        if G.has_edge(src, dst):
+            G.remove_edge(src, dst)
+            touched.update((src, dst))
+    if len(adds):
+        addG = guarantee.buildGuaranteeCore(adds).toNx(decoders={"guarType": graphCore.guarTypeNames})
+        _mergeNodes(G, addG)
+        G.add_edges_from(addG.edges(data=True))
+        touched.update(addG.nodes)
+    return touched, len(adds), len(dels)
+
+
+def applyMoneyCollectionDelta(G, path):
+    """
+    将资金归集增量表应用到多重图上, 删除时按账户、日期和金额匹配一笔交易, 返回值同applyControlDelta
+    图以账户号的整数编号为节点, 增量中的账户号经G.graph["ids"]规范化和驻留
+    """
+    ids = G.graph["ids"]
+    header = pd.read_csv(path, nrows=0, encoding="utf-8", encoding_errors="ignore")
+    withOp = len(header.columns) > 34
+    touched, added, removed = set(), 0, 0
+    for chunk in moneyCollection.readChunks(path, withOp=withOp):
+        op = _popOp(chunk)
+        adds, dels = chunk[op != "del"], chunk[op == "del"]
+        src, dst = ids.find(dels["myId"]).tolist(), ids.find(dels["recipId"]).tolist()
+        for u, v, date, amount in zip(src, dst, dels["txnDateTime"], dels["txnAmount"]):
+            removed += 1
+            if u < 0 or v < 0 or not G.has_edge(u, v):
+                continue
+            for k, d in G[u][v].items():
+                if d["txnDateTime"] == int(date) and d["txnAmount"] == float(amount):
+                    G.remove_edge(u, v, k)
+                    touched.update((u, v))
+                    break
+        if len(adds):
+            # 新账户号的编号接在已有编号之后
+            core = moneyCollection.buildMoneyCollectionCore([adds])
+            codes = ids.internMany(core.ids.ids)
+            addG = nx.relabel_nodes(core.toNx(multi=True, codes=True), dict(enumerate(codes.tolist())))
+            _mergeNodes(G, addG)
+            G.add_edges_from(addG.edges(data=True))
+            touched.update(addG.nodes)
+            added += len(adds)
+    return touched, added, removed
+
+
+def splitRegion(G, region):
+    """
+    将受影响区域内的节点按区域内的边划分为弱连通分量, 用并查集求解, 不复制无向图
+    Params:
+        G: 完整图
+        region: 节点列表
+    Returns:
+        分量的列表, 每个分量为节点列表, 分量及其中的节点均按在region中的先后排列
+    """
+    index = {n: i for i, n in enumerate(region)}
+    edges = np.array([(index[u], index[v]) for u, v in G.subgraph(region).edges()], dtype=np.int64).reshape(-1, 2)
+    labels = graphCore.componentLabels(edges[:, 0], edges[:, 1], len(region))
+    ptr, order = graphCore.buildCsr(labels, int(labels.max()) + 1 if len(labels) else 0)
+    return [[region[i] for i in order[ptr[k]:ptr[k + 1]].tolist()] for k in range(len(ptr) - 1)]
+
+
+def _analyze(table, state, Gid, subG):
+    """
+    重置并重新计算一个子图的节点属性, 与全量流程对每个子图的处理一致
+    """
+    G = state["G"]
+    if table == "control":
+        for n in subG.nodes:
+            G.nodes[n].update(isRoot=0, isCross=0, crossId=-1)
+        count = control.markRootOfComponent(subG)
+        control.resolveOwnership([subG])
+        # 新集群的编号接在已有编号之后
+        if count:
+            for n in subG.nodes:
+                if subG.nodes[n]["crossId"] >= 0:
+                    subG.nodes[n]["crossId"] += state["nextCrossId"]
+            state["nextCrossId"] += count
+    elif table == "guarantee":
+        for n in subG.nodes:
+            G.nodes[n].update(guarType=[], m=0.0, std=0.0)
+        guarantee.markRiskOfComponent(subG)
+        scoring = state.get("scoring", {"score": "share"})
+        if scoring["score"] == "contagion":
+            guarantee.contagionOfComponent(subG, scoring["decay"])
+        else:
+            guarantee.quantifyComponent(subG)
+    else:
+        for n in subG.nodes:
+            G.nodes[n].update(netIncome=0, std=0)
+        moneyCollection.netIncomeOfComponent(subG)
+        state["matches"][Gid] = moneyCollection.matchShellOfComponent(subG, maxHops=state.get("maxHops", 1))
+
+
+@instrument.timed("incremental.update")
+def update(table, deltaPath, stateDir, backend="auto", formats=None):
+    """
+    增量更新一张表的分析结果
+    Params:
+        table: "control"、"guarantee"或"moneyCollection"
+        deltaPath: 增量csv路径
+        stateDir: saveState保存状态的目录
+        backend, formats: 同graphs2json, formats为None时沿用saveState保存的格式
+    Outputs:
+        重写受影响的前端json文件和答案json, 并保存新的状态
+    """
+    module = modules[table]
+    appliers = {
+        "control": applyControlDelta,
+        "guarantee": applyGuaranteeDelta,
+        "moneyCollection": applyMoneyCollectionDelta,
+    }
+    state = loadState(stateDir, table)
+    G, components, layout = state["G"], state["components"], state["layout"]
+    if formats is None:
+        formats = state.get("formats", ())
+    state["formats"] = list(formats)
+    touched, added, removed = appliers[table](G, deltaPath)
+
+    # 受影响的子图: 含有边变化节点的原子图, 连同新出现的节点一起重新划分
+    nodeGid = {n: Gid for Gid, nodes in components.items() for n in nodes}
+    dead = {nodeGid[n] for n in touched if n in nodeGid}
+    region = set(touched)
+    for Gid in dead:
+        region.update(components.pop(Gid))
+        if table == "moneyCollection":
+            state["matches"].pop(Gid)
+    # 删除边后不再与其他节点相连的节点
+    G.remove_nodes_from([n for n in region if n in G and G.degree(n) == 0])
+    region = [n for n in region if n in G]
+    born = list()
+    for c in splitRegion(G, region):
+        components[state["nextGid"]] = c
+        born.append(state["nextGid"])
+        state["nextGid"] += 1
+    for Gid in born:
+        _analyze(table, state, Gid, G.subgraph(components[Gid]))
+
+    # 从文件中移除消失的子图, 新子图按全量导出时的规则追加到各类别的文件中
+    dirty = set()
+    for category, files in layout.items():
+        # 资金归集企业图的分片不按子图划分, 在最后整体重写
+        if category not in module.jsonFiles:
+            continue
+        for entry in files:
+            kept = [Gid for Gid in entry[1] if Gid not in dead]
+            if len(kept) < len(entry[1]):
+                entry[1] = kept
+                entry[2] = sum(len(components[Gid]) for Gid in kept)
+                entry[3] = sum(G.subgraph(components[Gid]).number_of_edges() for Gid in kept)
+                dirty.add(entry[0])
+    for Gid in born:
+        nodes, links, categories = module.jsonCategories(G.subgraph(components[Gid]), Gid)
+        for category in categories:
+            # 在该类别的全部文件中选第一个放得下的
+            entry = jsonWriter.placeComponent(
+                layout[category], module.jsonPath + module.jsonFiles[category], len(nodes), len(links)
+            )
+            entry[1].append(Gid)
+            entry[2] += len(nodes)
+            entry[3] += len(links)
+            dirty.add(entry[0])
+    for files in layout.values():
+        for path, gids, _, _ in files:
+            if path not in dirty:
+                continue
+            with jsonWriter.GraphJsonWriter(path, module.jsonKeys, backend, formats) as writer:
+                for Gid in gids:
+                    nodes, links, _ = module.jsonCategories(G.subgraph(components[Gid]), Gid)
+                    writer.write(nodes, links)
+    # 资金归集企业图和答案json覆盖全部子图, 需整体重写
+    if table == "moneyCollection":
+        se, seNodes = moneyCollection.shellFromMatches([state["matches"][Gid] for Gid in sorted(components)])
+        with jsonWriter.LayoutWriter(
+            module.jsonPath, module.collectionFiles, module.jsonKeys, backend, formats, manifest=False
+        ) as writer:
+            moneyCollection.collectionJson(se, state["nextGid"], writer)
+        layout.update(writer.layout)
+    if dirty or table == "moneyCollection":
+        jsonWriter.writeManifest(module.jsonPath, layout, module.jsonKeys)
+    if table == "moneyCollection":
+        moneyCollection.ansJson(seNodes)
+    else:
+        module.ansJson([G.subgraph(components[Gid]) for Gid in sorted(components)])
+    _dump(state, statePath(stateDir, table))
+    print("增量更新%s: 新增%d行, 删除%d行, 重算%d个子图(原%d个), 重写%d个json文件" % (
+        table, added, removed, len(born), len(dead), len(dirty)))
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+流水线各阶段的耗时和内存统计
+每个阶段记录墙钟时间、本进程及已结束子进程的CPU时间、阶段内的峰值常驻内存, 以及节点数、边数、子图数
+未调用enable时所有统计均不生效, 被统计的函数只多一次函数调用
+用法:
+    python main.py --report ./backend/report.json
+    python main.py --report ./backend/report.csv --profile-dir ./backend/profile
+--profile-dir为每个顶层阶段输出cProfile的.prof文件, 可用pstats或snakeviz查看;
+py-spy等外部采样工具可直接包裹运行(py-spy record -o profile.svg -- python main.py), 报告中的pid和起止时间戳用于对齐
+"""
+import os
+import csv
+import json
+import time
+import cProfile
+import functools
+from contextlib import contextmanager
+
+import graphCore
+
+# 资源统计模块在Windows上不可用
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_enabled = False
+_profileDir = None
+_records = list()  # 已结束的阶段
+_stack = list()  # 正在进行的阶段, 用于记录父阶段并向上传递峰值内存
+
+
+def enable(profileDir=None):
+    """
+    开启统计, 清空之前的记录
+    Params:
+        profileDir: 为各阶段输出cProfile结果的目录, 为None时不做profile
+    """
+    global _enabled, _profileDir
+    _enabled = True
+    _profileDir = profileDir
+    _records.clear()
+    if profileDir:
+        os.makedirs(profileDir, exist_ok=True)
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def records():
+    """
+    已结束阶段的统计记录, 按结束的先后排列
+    """
+    return list(_records)
+
+
+def _memory():
+    """
+    当前和峰值常驻内存(字节), 无法获取时为None
+    Linux下读取/proc/self/status, 其他平台只能得到进程启动以来的峰值
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            status = dict(line.split(":", 1) for line in f if ":" in line)
+        return int(status["VmRSS"].split()[0]) * 1024, int(status["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        pass
+    if resource is None:
+        return None, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位, Linux以KB为单位
+    return None, peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def _resetPeak():
+    """
+    将峰值常驻内存重置为当前值, 仅Linux支持, 其他平台峰值为进程启动以来的峰值
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def graphListCounts(GList):
+    """
+    子图列表的节点数、边数和子图数
+    子图为同一个图的subgraph视图时直接取原图的规模, 否则逐个累加
+    """
+    G = graphCore.baseGraph(GList)
+    GList = list(GList)
+    if not GList:
+        return {"components": 0, "nodes": 0, "edges": 0}
+    if G is not None:
+        nodes, edges = G.number_of_nodes(), G.number_of_edges()
+    else:
+        nodes = sum(G.number_of_nodes() for G in GList)
+        edges = sum(G.number_of_edges() for G in GList)
+    return {"components": len(GList), "nodes": nodes, "edges": edges}
+
+
+def ofResult(result, *args, **kwargs):
+    """
+    timed的counts参数: 统计函数返回的子图列表或紧凑图
+    """
+    if isinstance(result, graphCore.CompactGraph):
+        return {"nodes": result.numberOfNodes(), "edges": result.numberOfEdges()}
+    return graphListCounts(result)
+
+
+def ofInput(result, GList, *args, **kwargs):
+    """
+    timed的counts参数: 统计函数第一个参数传入的子图列表
+    """
+    return graphListCounts(GList)
+
+
+class Stage:
+    """
+    一个阶段的统计记录
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.parent = _stack[-1].name if _stack else None
+        self.counts = dict()
+        self._childPeak = 0
+
+    def count(self, **counts):
+        """
+        登记阶段处理的数据规模, 如nodes、edges、components
+        """
+        self.counts.update(counts)
+
+    def start(self):
+        _resetPeak()
+        self._wall = time.perf_counter()
+        self._times = os.times()
+        self.startTime = time.time()
+
+    def stop(self):
+        wall = time.perf_counter() - self._wall
+        times = os.times()
+        rss, peak = _memory()
+        if peak is not None:
+            peak = max(peak, self._childPeak)
+        self.record = {
+            "stage": self.name,
+            "parent": self.parent,
+            "pid": os.getpid(),
+            "start": self.startTime,
+            "end": time.time(),
+            "wall": wall,
+            "cpu": (times.user - self._times.user) + (times.system - self._times.system),
+            "cpuChildren": (times.children_user - self._times.children_user)
+            + (times.children_system - self._times.children_system),
+            "rss": rss,
+            "peakRss": peak,
+        }
+        self.record.update(self.counts)
+        return self.record
+
+
+@contextmanager
+def stage(name):
+    """
+    统计一个代码块, 未开启统计时不做任何事
+    用法:
+        with instrument.stage("control.split") as s:
+            ...
+            s.count(components=len(subG))
+    """
+    s = Stage(name)
+    if not _enabled:
+        yield s
+        return
+    # cProfile不能嵌套, 只对顶层阶段做profile
+    profiler = cProfile.Profile() if _profileDir and not _stack else None
+    _stack.append(s)
+    s.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield s
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(_profileDir, "%d_%s.prof" % (len(_records), name)))
+        _stack.pop()
+        record = s.stop()
+        # 子阶段开始时重置了峰值, 父阶段的峰值取各子阶段峰值的最大值
+        if _stack and record["peakRss"] is not None:
+            _stack[-1]._childPeak = max(_stack[-1]._childPeak, record["peakRss"])
+        _records.append(record)
+
+
+def timed(name, counts=None):
+    """
+    统计函数调用的装饰器
+    Params:
+        name: 阶段名, 如"control.ingest"
+        counts: 函数(返回值, *调用参数) -> 数据规模字典, 如ofResult、ofInput
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with stage(name) as s:
+                result = func(*args, **kwargs)
+            # 统计规模的时间不计入阶段耗时
+            if counts is not None:
+                s.record.update(counts(result, *args, **kwargs))
+            return result
+        return wrapper
+    return decorator
+
+
+def writeReport(path):
+    """
+    输出统计报告, 扩展名为.csv时输出csv, 否则输出json
+    Params:
+        path: 报告路径
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if path.endswith(".csv"):
+        fields = list()
+        for record in _records:
+            fields += [k for k in record if k not in fields]
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(_records)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"pid": os.getpid(), "stages": _records}, f, ensure_ascii=False, indent=2)
+
+
+def summary():
+    """
+    打印顶层阶段的耗时和峰值内存
+    """
+    MB = 1024 * 1024
+    for record in _records:
+        if record["parent"] is None:
+            peak = record["peakRss"]
+            print("%-36s 墙钟 %8.2f s  CPU %8.2f s  峰值内存 %s" % (
+                record["stage"], record["wall"], record["cpu"] + record["cpuChildren"],
+                "-" if peak is None else "%.1f MB" % (peak / MB)))
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import shutil
+import tempfile
+
+import columnar
+
+# 可选的快速序列化后端
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(o):
+    """
+    json序列化numpy标量等对象
+    """
+    if hasattr(o, "item"):
+        return o.item()
+    raise TypeError("Object of type %s is not JSON serializable" % type(o).__name__)
+
+
+def dumps(obj, backend="auto"):
+    """
+    将对象序列化为json字符串
+    Params:
+        obj: 待序列化的对象
+        backend: "orjson"、"json"或"auto", auto时已安装orjson则使用orjson
+    Returns:
+        json字符串
+    """
+    if backend != "json" and orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    if backend == "orjson":
+        raise ImportError("orjson未安装")
+    return json.dumps(obj, default=_default)
+
+
+class GraphJsonWriter:
+    """
+    以流的方式写出形如{"nodes": [...], "links": [...]}的json文件
+    第一个键的元素直接写入目标文件, 第二个键的元素先写入临时文件, 关闭时再拼接到目标文件末尾,
+    因此内存占用只与单个子图的大小有关, 与文件大小无关
+    """
+
+    def __init__(self, path, keys=("nodes", "links"), backend="auto", formats=()):
+        """
+        Params:
+            path: 输出路径
+            keys: 两个数组在json对象中的键名及先后顺序
+            backend: 序列化后端, 见dumps
+            formats: 关闭时额外生成的格式, 见columnar.writePayloads
+        """
+        self.path = path
+        self.keys = keys
+        self.backend = backend
+        self.formats = formats
+        self.nodeCount, self.linkCount = 0, 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._files = [open(path, "w", encoding="utf-8"), tempfile.TemporaryFile("w+", encoding="utf-8")]
+        self._empty = [True, True]
+        self._files[0].write('{"%s": [' % keys[0])
+
+    def _append(self, i, items):
+        if not items:
+            return
+        # 整个子图的数组只调用一次序列化, 再去掉首尾的方括号拼接到已有内容之后
+        text = dumps(items, self.backend)[1:-1]
+        if not self._empty[i]:
+            self._files[i].write(", ")
+        self._files[i].write(text)
+        self._empty[i] = False
+
+    def write(self, nodes, links):
+        """
+        写入一个子图的点和边
+        Params:
+            nodes: 点的字典列表
+            links: 边的字典列表
+        """
+        data = {"nodes": nodes, "links": links}
+        self._append(0, data[self.keys[0]])
+        self._append(1, data[self.keys[1]])
+        self.nodeCount += len(nodes)
+        self.linkCount += len(links)
+
+    def close(self):
+        """
+        拼接临时文件并关闭
+        """
+        if self._files is None:
+            return
+        main, tmp = self._files
+        main.write('], "%s": [' % self.keys[1])
+        tmp.seek(0)
+        shutil.copyfileobj(tmp, main)
+        main.write("]}")
+        main.close()
+        tmp.close()
+        self._files = None
+        columnar.writePayloads(self.path, self.formats)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 每个前端json文件的规模上限(节点数+边数), 超过上限的单个子图独占一个文件
+shardBudget = 6000
+# 流式写出时同时保持打开、可继续放入子图的文件数, 子图只与编号相近的子图放在同一文件中
+shardWindow = 4
+manifestName = "manifest.json"
+
+
+def placeComponent(files, pattern, nodes, links, budget=shardBudget, window=None):
+    """
+    为一个子图选择所在的文件: 在最后window个文件中选第一个放得下的, 都放不下时新开文件, 子图不会被拆分
+    Params:
+        files: 该类别已有的文件列表, 每项为[路径, 子图编号列表, 节点数, 边数]
+        pattern: 含%d的文件路径模板
+        nodes, links: 子图的节点数和边数
+        budget: 每个文件的节点数+边数上限
+        window: 候选文件数, 为None时在全部文件中选择
+    Returns:
+        files中的一项, 调用方负责登记子图编号、节点数和边数
+    """
+    candidates = files if window is None else files[-window:]
+    for entry in candidates:
+        if entry[2] + entry[3] + nodes + links <= budget:
+            return entry
+    files.append([pattern % len(files), [], 0, 0])
+    return files[-1]
+
+
+def writeManifest(path, layout, keys=("nodes", "links"), budget=shardBudget):
+    """
+    写出目录下各类别分片文件的清单, 前端据此按需加载分片
+    Params:
+        path: 输出目录
+        layout: 类别 -> 文件列表, 见placeComponent
+        keys: json中两个数组的键名
+        budget: 分片时使用的规模上限
+    """
+    manifest = {
+        "budget": budget,
+        "keys": list(keys),
+        "categories": {
+            category: [
+                {"file": os.path.basename(p), "nodes": nodes, "links": links, "components": len(gids)}
+                for p, gids, nodes, links in files
+            ]
+            for category, files in layout.items()
+        },
+    }
+    os.makedirs(path, exist_ok=True)
+    tmp = os.path.join(path, manifestName + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, os.path.join(path, manifestName))
+
+
+class LayoutWriter:
+    """
+    按类别把子图装箱写入分片的json文件, 记录每个文件包含哪些子图(layout), 关闭时写出分片清单
+    layout供增量更新时只重写受影响的文件
+    """
+
+    def __init__(self, path, files, keys=("nodes", "links"), backend="auto", formats=(),
+                 budget=shardBudget, window=shardWindow, manifest=True):
+        """
+        Params:
+            path: 输出目录
+            files: 类别 -> 含%d的文件名模板
+            keys, backend, formats: 同GraphJsonWriter
+            budget: 每个文件的节点数+边数上限
+            window: 每个类别同时保持打开的文件数
+            manifest: 关闭时是否写出分片清单, 只重写部分类别时由调用方写出完整的清单
+        """
+        self.path = path
+        self.files = files
+        self.keys = keys
+        self.backend = backend
+        self.formats = formats
+        self.budget = budget
+        self.window = window
+        self.manifest = manifest
+        self.layout = {category: list() for category in files}
+        self._writers = {category: dict() for category in files}  # 类别 -> 路径 -> 正在写入的GraphJsonWriter
+
+    def write(self, Gid, nodes, links, categories):
+        """
+        将一个子图写入其所属的各个类别
+        Params:
+            Gid: 子图编号
+            nodes, links: 点和边的字典列表
+            categories: 类别列表
+        """
+        for category in categories:
+            files = self.layout[category]
+            entry = placeComponent(
+                files, self.path + self.files[category], len(nodes), len(links), self.budget, self.window
+            )
+            writers = self._writers[category]
+            if entry[0] not in writers:
+                writers[entry[0]] = GraphJsonWriter(entry[0], self.keys, self.backend, self.formats)
+                # 新开的文件使最早的候选文件移出窗口, 之后不会再写入
+                if len(files) > self.window:
+                    writers.pop(files[-self.window - 1][0]).close()
+            writers[entry[0]].write(nodes, links)
+            entry[1].append(Gid)
+            entry[2] += len(nodes)
+            entry[3] += len(links)
+
+    def close(self):
+        for writers in self._writers.values():
+            for writer in writers.values():
+                writer.close()
+        self._writers = {category: dict() for category in self.files}
+        if self.manifest:
+            writeManifest(self.path, self.layout, self.keys, self.budget)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
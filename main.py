@@ -1,25 +1,100 @@
+import argparse
+
+import columnar
 import control
+import graphCache
+import incremental
+import instrument
 import guarantee
 import moneyCollection
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="企业关联图谱风险识别")
+    parser.add_argument("--workers", type=int, default=1, help="控制人根节点标记和资金归集路径匹配按子图并行的进程数, 0表示使用全部CPU核, 其余阶段已向量化, 总是单进程计算")
+    parser.add_argument(
+        "--formats", nargs="*", choices=columnar.FORMATS, default=None,
+        help="除json外额外输出的前端数据格式: columnar为列式.bin文件, gzip/brotli为预压缩文件, 增量模式下未指定时沿用全量运行时的格式"
+    )
+    parser.add_argument(
+        "--state-dir", default=None,
+        help="保存图、子图划分和json文件布局的目录, 全量运行结束时写入, 供增量模式和查询服务server.py使用"
+    )
+    parser.add_argument(
+        "--delta", nargs=2, action="append", metavar=("TABLE", "CSV"),
+        help="增量模式: 将CSV中新增/删除的行应用到--state-dir中保存的TABLE(control/guarantee/moneyCollection)上, 可多次指定"
+    )
+    parser.add_argument(
+        "--guarantee-score", choices=["share", "contagion"], default="share",
+        help="担保关系节点风险值m的计算方式: share为相连的担保金额占子图总额的比例, contagion为沿担保链传递的违约传染风险"
+    )
+    parser.add_argument("--contagion-decay", type=float, default=0.5, help="contagion每多经过一层担保的衰减系数, 需在[0, 1)内")
+    parser.add_argument(
+        "--max-hops", type=int, default=1,
+        help="资金归集路径中贷款之后转账的最大跳数, 即中间企业数的上限, 为1时只寻找贷款-转账三元组"
+    )
+    parser.add_argument("--cache-dir", default=graphCache.defaultDir, help="读取csv建图结果的缓存目录")
+    parser.add_argument("--no-cache", action="store_true", help="不读取也不写入建图缓存, 总是重新解析csv")
+    parser.add_argument(
+        "--report", default=None,
+        help="输出各阶段耗时、CPU时间、峰值内存和数据规模的报告, 扩展名为.csv时输出csv, 否则输出json"
+    )
+    parser.add_argument("--profile-dir", default=None, help="为各阶段输出cProfile的.prof文件, 需同时指定--report")
+    args = parser.parse_args()
+    cacheDir = None if args.no_cache else args.cache_dir
+    columnar.checkFormats(args.formats or ())
+    if not 0 <= args.contagion_decay < 1:
+        parser.error("--contagion-decay需在[0, 1)内")
+    if args.max_hops < 1:
+        parser.error("--max-hops需不小于1")
+    if args.profile_dir and not args.report:
+        parser.error("--profile-dir需要同时指定--report")
+    if args.report:
+        instrument.enable(args.profile_dir)
+
+    if args.delta:
+        if args.state_dir is None:
+            parser.error("增量模式需要指定--state-dir")
+        for table, path in args.delta:
+            if table not in incremental.modules:
+                parser.error("未知的表: %s" % table)
+            incremental.update(table, path, args.state_dir, formats=args.formats)
+        if args.report:
+            instrument.writeReport(args.report)
+        parser.exit()
+    formats = args.formats or []
+
     # 控制人表
-    controlG = control.getInitControlG("./backend/res/control.csv")
-    controlRootG = control.getRootOfControlG(controlG)
-    control.graphs2json(controlRootG)
+    controlG = control.getInitControlG("./backend/res/control.csv", cacheDir=cacheDir)
+    controlRootG = control.getRootOfControlG(controlG, workers=args.workers)
+    layout = control.graphs2json(controlRootG, formats=formats)
     control.ansJson(controlRootG)
+    if args.state_dir:
+        incremental.saveState(args.state_dir, "control", controlRootG, layout, formats=formats)
 
     # 担保关系表
-    guaranteeG = guarantee.getInitGuaranteeG("./backend/res/guarantee.csv")
+    guaranteeG = guarantee.getInitGuaranteeG("./backend/res/guarantee.csv", cacheDir=cacheDir)
     guaranteeRiskG = guarantee.markRiskOfGuaranteeG(guaranteeG)
-    guarantee.riskQuantification(guaranteeRiskG)
-    guarantee.graphs2json(guaranteeRiskG)
+    if args.guarantee_score == "contagion":
+        guarantee.contagionQuantification(guaranteeRiskG, decay=args.contagion_decay)
+    else:
+        guarantee.riskQuantification(guaranteeRiskG)
+    layout = guarantee.graphs2json(guaranteeRiskG, formats=formats)
     guarantee.ansJson(guaranteeRiskG)
+    if args.state_dir:
+        scoring = {"score": args.guarantee_score, "decay": args.contagion_decay}
+        incremental.saveState(args.state_dir, "guarantee", guaranteeRiskG, layout, scoring=scoring, formats=formats)
 
     # 资金归集表
-    moneyCollectionCut = moneyCollection.getInitmoneyCollectionG("./backend/res/moneyCollection.csv")
-    se, seNodes = moneyCollection.findShellEnterprise(moneyCollectionCut)
+    moneyCollectionCut = moneyCollection.getInitmoneyCollectionG(
+        "./backend/res/moneyCollection.csv", cacheDir=cacheDir
+    )
+    se, seNodes = moneyCollection.findShellEnterprise(moneyCollectionCut, workers=args.workers, maxHops=args.max_hops)
     moneyCollection.getNetIncome(moneyCollectionCut)
-    moneyCollection.graphs2json(moneyCollectionCut, se, seNodes)
+    layout = moneyCollection.graphs2json(moneyCollectionCut, se, seNodes, formats=formats)
     moneyCollection.ansJson(seNodes)
+    if args.state_dir:
+        incremental.saveState(args.state_dir, "moneyCollection", moneyCollectionCut, layout, se=se, maxHops=args.max_hops, formats=formats)
 
+    if args.report:
+        instrument.summary()
+        instrument.writeReport(args.report)
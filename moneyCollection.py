@@ -1,9 +1,17 @@
 import re
 import json
-import csv
+import functools
+import numpy as np
+import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
 
+import graphCore
+import graphCache
+import instrument
+import parallel
+import jsonWriter
+
 # 资金归集识别条件
 # txn: transaction, recip: reciprocal
 txn = {
@@ -20,102 +28,322 @@ loan = {
     "abstract": ['贷款还款', '委托贷款收回利息', '委托贷款收回本金',
                 '现金管理子账户占用上存金额补足本次扣款', '公积金放款', '贷款并账']
 }
+# 企业在资金归集路径中的角色: 提供贷款、中间企业、接收转账, 同一企业可兼有多个角色, 按位组合
+roleBits = {"start": 1, "mid": 2, "end": 4}
+# 贷款摘要关键词合并为一个预编译的正则, 每行只需匹配一次
+loanAbstractPattern = re.compile("|".join(loan["abstract"]))
+# csv中需要读取的列及其下标
+tag = {
+    "myId": 0,  # 本人账户
+    "recipId": 29,  # 对方账户
+    "txnDateTime": 1,  # 交易日期
+    "txnCode": 4,  # 交易码
+    "txnAmount": 7,  # 交易金额
+    "isLoan": 6,  # 借贷标志
+    "status": 33,  # 状态码
+    "abstract": 21  # 摘要
+}
 
 
-def getInitmoneyCollectionG(path):
+def normalizeId(ids):
     """
-    读取资金归集的excel表格到DataFrame, 并切分子图
+    账户号长度不小于15位时, 将末两位统一改写为'00'
+    Params:
+        ids: 账户号的Series
+    Returns:
+        规范化后的账户号Series
+    """
+    return ids.where(ids.str.len() < 15, ids.str[:-2] + "00")
+
+
+class AccountIndex(graphCore.IdIndex):
+    """
+    账户号驻留表: 原始账户号先规范化再驻留为整数编号, 同时缓存原始账户号 -> 编号,
+    大量重复出现的账户号只在第一次出现时规范化一次, 之后只需一次字典查找
+    """
+
+    def __init__(self, ids=None):
+        super().__init__(ids)
+        self.raw = dict()  # 原始账户号 -> 编号
+
+    def internRaw(self, keys):
+        """
+        批量规范化并驻留原始账户号, 编号按规范化后的账户号首次出现的顺序分配
+        Params:
+            keys: 原始账户号数组
+        Returns:
+            与keys等长的int64编号数组
+        """
+        codes, uniques = pd.factorize(np.asarray(keys, dtype=object))
+        uniques = uniques.tolist()
+        new = [k for k in uniques if k not in self.raw]
+        if new:
+            normalized = normalizeId(pd.Series(new, dtype=object)).to_numpy()
+            self.raw.update(zip(new, self.internMany(normalized).tolist()))
+        lookup = np.fromiter(map(self.raw.__getitem__, uniques), dtype=np.int64, count=len(uniques))
+        return lookup[codes]
+
+    def find(self, keys):
+        """
+        查找原始账户号的编号, 不驻留新账户号
+        Returns:
+            与keys等长的int64编号数组, 不存在的账户号为-1
+        """
+        normalized = normalizeId(pd.Series(np.asarray(keys, dtype=object), dtype=object))
+        return normalized.map(self.index).fillna(-1).to_numpy(np.int64)
+
+
+def filterChunk(chunk):
+    """
+    对一个数据块按列向量化地执行转账和贷款条件筛选
+    Params:
+        chunk: 按tag读取的字符串列DataFrame
+    Returns:
+        txnMask: 符合转账条件的行
+        loanMask: 符合贷款条件的行
+    """
+    isLoan = pd.to_numeric(chunk["isLoan"], errors="coerce")
+    amount = pd.to_numeric(chunk["txnAmount"], errors="coerce")
+    status = pd.to_numeric(chunk["status"], errors="coerce")
+    # 忽略Id为空的行
+    valid = (chunk["myId"] != "") & (chunk["recipId"] != "")
+    # 转账条件筛选
+    txnMask = (
+        valid
+        & (isLoan == txn["isLoan"])
+        & chunk["txnCode"].isin(txn["code"])
+        & (amount >= txn["txnAmountLimit"])
+    )
+    # 贷款条件筛选, 摘要中含有指定关键词的贷款不计入
+    loanMask = (
+        valid
+        & ~txnMask
+        & (chunk["status"] != "R")
+        & (amount >= loan["txnAmountLimit"])
+        & chunk["txnCode"].isin(loan["code"])
+        & (isLoan == loan["isLoan"])
+        & (status == loan["status"])
+        & ~chunk["abstract"].str.contains(loanAbstractPattern)
+    )
+    return txnMask, loanMask
+
+
+def readChunks(path, chunkSize=1000000, codes=None, withOp=False):
+    """
+    分块流式读取资金归集的csv表格, 筛选出符合条件的贷款和转账行, 内存占用只与块大小有关
     Params:
         path: 含有资金归集数据的csv表格
-    Returns: 
-        GList: 根据表格数据切分得到的子图集合, 每个元素都是一副子图
+        chunkSize: 每次读入内存的行数
+        codes: 两个集合, 分别收集符合条件的贷款和转账交易码, 为空时不收集
+        withOp: 是否读取增量文件中紧跟34列原始数据之后的op列
+    Yields:
+        chunk: 筛选后的数据块, 列名为tag中的名称, 账户号未经规范化, 由AccountIndex统一规范化
     """
-    # 由于可能存在两个节点间重复建立交易关系, 故使用MultiDiGraph
-    G = nx.MultiDiGraph()
-    codes = [[], []]
+    columns = dict(tag, op=34) if withOp else tag
+    names = sorted(columns, key=columns.get)
     # 由于原csv中存在非utf-8字符, 需过滤掉非uft-8字符
-    with open("./backend/res/moneyCollection.csv", encoding='utf-8', errors='ignore') as f:
-        # 给定的识别贷款和转账的条件
-        originData = csv.reader(f)
-        tag = {
-            "myId": 0,  # 本人账户
-            "recipId": 29,  # 对方账户
-            "txnDateTime": 1,  # 交易日期
-            "txnCode": 4,  # 交易码
-            "txnAmount": 7,  # 交易金额
-            "isLoan": 6,  # 借贷标志
-            "status": 33,  # 状态码
-            "abstract": 21  # 摘要
-        }
-        i = 0
-        for line in originData:
-            # 是否读入数据的标志
-            canIn = False
-            # 忽略标题行和Id为空的行
-            if line[tag["myId"]] == '' or line[tag["recipId"]] == '' or i == 0:
-                i += 1
-                continue
-            # 贷款和转账条件筛选            
-            # 转账条件筛选
-            if (
-                int(line[tag["isLoan"]]) == txn["isLoan"] 
-                and line[tag["txnCode"]] in txn["code"]
-                and float(line[tag["txnAmount"]]) >= txn["txnAmountLimit"]
-            ):
-                codes[1].append(line[tag["txnCode"]])
-                canIn = True
-            # 贷款条件筛选
-            elif (
-                not line[tag["status"]] == "R" 
-                and float(line[tag["txnAmount"]]) >= loan["txnAmountLimit"] 
-                and line[tag["txnCode"]] in loan["code"] 
-                and int(line[tag["isLoan"]]) == loan["isLoan"] 
-                and int(line[tag["status"]]) == loan["status"]
-            ):
-                flag = False
-                for item in loan["abstract"]:
-                    if re.search(item, line[tag["abstract"]]):
-                        flag = True
-                        break
-                if flag:
-                    continue
-                codes[0].append(line[tag["txnCode"]])
-                canIn = True
-            if canIn:
-                # 构建初始图G, 将符合条件的节点和边加入G
-                if not G.has_node(line[tag["myId"]]):
-                    if len(line[tag["myId"]]) >= 15:
-                        line[tag["myId"]] = line[tag["myId"]][:-2] + '00'
-                    G.add_node(line[tag["myId"]], netIncome=0, std=0)
-                if not G.has_node(line[tag["recipId"]]):
-                    if len(line[tag["recipId"]]) >= 15:
-                        line[tag["recipId"]] = line[tag["recipId"]][:-2] + '00'
-                    G.add_node(line[tag["recipId"]], netIncome=0, std=0)
-                G.add_edge(
-                    line[tag["myId"]],
-                    line[tag["recipId"]],
-                    txnAmount=float(line[tag["txnAmount"]]),
-                    txnDateTime=int(line[tag["txnDateTime"]]),
-                    isLoan=int(line[tag["isLoan"]]),
-                    txnCode=line[tag["txnCode"]],
-                    width=float(line[tag["txnAmount"]])**0.5 / 1800
-                )                         
-            i += 1
+    reader = pd.read_csv(
+        path,
+        header=0,
+        usecols=[columns[k] for k in names],
+        dtype=str,
+        keep_default_na=False,
+        encoding="utf-8",
+        encoding_errors="ignore",
+        chunksize=chunkSize,
+    )
+    for chunk in reader:
+        # usecols按列下标升序返回
+        chunk.columns = names
+        txnMask, loanMask = filterChunk(chunk)
+        if codes is not None:
+            codes[1].update(chunk.loc[txnMask, "txnCode"].unique())
+            codes[0].update(chunk.loc[loanMask, "txnCode"].unique())
+        chunk = chunk[txnMask | loanMask]
+        if chunk.empty:
+            continue
+        yield chunk
+
+
+def buildMoneyCollectionCore(chunks):
+    """
+    由筛选后的数据块按列构建紧凑多重图
+    Params:
+        chunks: readChunks产生的数据块
+    Returns:
+        core: CompactGraph
+    """
+    ids = AccountIndex()
+    columns = {k: [] for k in ["src", "dst", "txnAmount", "txnDateTime", "isLoan", "txnCode"]}
+    for chunk in chunks:
+        # 节点按规范化后的(myId, recipId)逐行交错的首次出现顺序编号
+        pair = np.column_stack([chunk["myId"].to_numpy(), chunk["recipId"].to_numpy()])
+        pair = ids.internRaw(pair.ravel())
+        columns["src"].append(pair[0::2])
+        columns["dst"].append(pair[1::2])
+        columns["txnAmount"].append(chunk["txnAmount"].to_numpy(float))
+        columns["txnDateTime"].append(chunk["txnDateTime"].to_numpy("int64"))
+        columns["isLoan"].append(chunk["isLoan"].to_numpy("int8"))
+        columns["txnCode"].append(pd.Categorical(chunk["txnCode"]))
+    # 合并各数据块, 交易码的类别表在块之间取并集
+    txnCode = columns.pop("txnCode")
+    txnCode = pd.api.types.union_categoricals(txnCode) if txnCode else pd.Categorical([])
+    columns = {k: np.concatenate(v) if v else np.zeros(0, dtype=np.int64) for k, v in columns.items()}
+    # 建图完成后不再需要原始账户号的缓存
+    ids.raw = dict()
+    # 由于可能存在两个节点间重复建立交易关系, 故按多重图保存
+    return graphCore.CompactGraph(
+        ids,
+        columns["src"],
+        columns["dst"],
+        nodeAttrs={
+            "netIncome": np.zeros(len(ids), dtype=np.int64),
+            "std": np.zeros(len(ids), dtype=np.int64),
+        },
+        edgeAttrs={
+            "txnAmount": columns["txnAmount"],
+            "txnDateTime": columns["txnDateTime"],
+            "isLoan": columns["isLoan"],
+            "txnCode": txnCode,
+            "width": columns["txnAmount"] ** 0.5 / 1800,
+        },
+    )
+
+
+@instrument.timed("moneyCollection.ingest", counts=instrument.ofResult)
+def getInitmoneyCollectionG(path, chunkSize=1000000, compact=False, cacheDir=None):
+    """
+    分块流式读取资金归集的csv表格, 并切分子图
+    Params:
+        path: 含有资金归集数据的csv表格
+        chunkSize: 每次读入内存的行数, 内存占用只与块大小有关
+        compact: 为True时直接返回整数编号的紧凑图, 不构建networkx图
+        cacheDir: 建图缓存目录, 为None时不使用缓存, 见graphCache
+    Returns: 
+        GList: 根据表格数据切分得到的子图集合, 每个元素都是一副子图; compact为True时为CompactGraph
+        子图以账户号的整数编号为节点, 各阶段共用G.graph["ids"]中的AccountIndex, 导出json时再还原为账户号
+    """
+    # 筛选条件变化时缓存失效
+    params = {"tag": tag, "txn": txn, "loan": loan}
+    cache = graphCache.GraphCache(None if compact else cacheDir, "moneyCollection", path, params)
+    cached = cache.load()
+    if cached is None:
+        codes = [set(), set()]
+        core = buildMoneyCollectionCore(readChunks(path, chunkSize, codes))
+        if compact:
+            return core
+        codes = [list(codes[i]) for i in range(2)]
+    else:
+        core, labels, extras = cached
+        codes = extras["codes"]
+        core.ids = AccountIndex(core.ids.ids)
+    G = core.toNx(multi=True, codes=True)
     print("----------资金归集表数据读取完成----------")
     print("符合条件的贷款和转账关系总数：", G.size())
     print("含有贷款和转账的公司数量：", nx.number_of_nodes(G))
-    codes = [list(set(codes[i])) for i in range(2)]
     print("符合条件的贷款交易码类型：", codes[0])
     print("符合条件的转账交易码类型：", codes[1])
-    # 切分子图
-    tmp = nx.to_undirected(G)
-    GList = list()
-    for c in nx.connected_components(tmp):
-        GList.append(G.subgraph(c))
+    # 切分子图, 在边数组上求弱连通分量, 不必把多重图复制为无向图
+    with instrument.stage("moneyCollection.split"):
+        if cached is None:
+            labels = core.componentLabels()
+        GList = graphCache.splitComponents(G, core, labels, codes=True)
+    if cached is None:
+        cache.save(core, labels, {"codes": codes})
     print("----------资金归集子图切分完成----------")
     return GList
 
 
+def netIncomeOfComponents(GList):
+    '''
+    计算各资金归集子图中企业的净资金流入及其标准化值
+    子图来自splitComponents时直接使用建图时的边数组和子图编号: 每条边对终点计入金额、对起点扣除金额,
+    按邻接表的遍历顺序排序后用一次bincount求和, 按子图分组后用reduceat求最值, 只在最后把结果写回节点属性
+    否则逐个遍历子图的多重边展开为同样的数组, 见_flatNetIncome
+    两种方式下每个节点先按前驱顺序累加流入, 再按后继顺序减去流出, 与逐节点遍历的结果逐位相同
+    Params:
+        GList: 资金归集子图列表
+    '''
+    compact = getattr(GList, "core", None)
+    if compact is not None:
+        n = compact.numberOfNodes()
+        if not n:
+            return
+        src, dst = compact.src.astype(np.int64), compact.dst.astype(np.int64)
+        amount = np.asarray(compact.edgeAttrs["txnAmount"], dtype=float)
+        # 邻接表中邻居按两点间第一条边的位置排列, 同一邻居的多重边按边编号排列
+        _, first, inverse = np.unique(src * n + dst, return_index=True, return_inverse=True)
+        edge = np.arange(len(src))
+        pos = np.concatenate([first[inverse], first[inverse]])
+        # 流入在前、流出在后, 与逐节点遍历的累加顺序一致
+        node = np.concatenate([dst, src])
+        part = np.repeat([0, 1], len(src))
+        order = np.lexsort((np.concatenate([edge, edge]), pos, part, node))
+        netIncome = np.bincount(node[order], weights=np.concatenate([amount, -amount])[order], minlength=n)
+        nodePtr, nodeOrder, _, _ = compact.componentSlices(GList.labels)
+        datas = GList.nodeDatas()
+        gids = np.asarray(GList.labels, dtype=np.int64)
+        starts = nodePtr[:-1]
+    else:
+        datas, netIncome, gids = _flatNetIncome(GList)
+        if not datas:
+            return
+        nodeOrder = np.arange(len(datas))
+        starts = np.flatnonzero(np.r_[True, gids[1:] != gids[:-1]])
+    # 标准化净资金流入, 用于可视化时的size, 范围为[5, 14]
+    d = np.abs(netIncome)
+    maxNetIncome = np.maximum.reduceat(d[nodeOrder], starts)[gids]
+    minNetIncome = np.minimum.reduceat(d[nodeOrder], starts)[gids]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = 5 + 9 / (maxNetIncome - minNetIncome) * (d - minNetIncome)
+    same = (maxNetIncome == minNetIncome).tolist()
+    for data, x, y, flat in zip(datas, netIncome.tolist(), std.tolist(), same):
+        data["netIncome"] = x
+        data["std"] = 9 if flat else y
+
+
+def _flatNetIncome(GList):
+    '''
+    逐个遍历子图的多重边求净资金流入, 用于没有紧凑图的子图列表, 邻居须属于同一子图
+    Returns:
+        datas: 节点属性字典的列表, 同一子图的节点相邻
+        netIncome: 各节点的净资金流入
+        gids: 各节点所属子图的编号
+    '''
+    datas, index, gids = list(), dict(), list()
+    for Gid, G in enumerate(GList):
+        for n in G.nodes:
+            index[n] = len(datas)
+            datas.append(G.nodes[n])
+            gids.append(Gid)
+    node, amount = list(), list()
+    base = graphCore.baseGraph(GList)
+    for sign, which in ((1, "pred"), (-1, "succ")):
+        for Gid, G in enumerate(GList):
+            adj = getattr(G if base is None else base, which)
+            for n in G.nodes:
+                i = index[n]
+                for w, keys in adj[n].items():
+                    j = index.get(w)
+                    if j is None or gids[j] != Gid:
+                        continue
+                    for d in keys.values():
+                        node.append(i)
+                        amount.append(sign * d["txnAmount"])
+    netIncome = np.bincount(node, weights=amount, minlength=len(datas))
+    return datas, netIncome, np.asarray(gids, dtype=np.int64)
+
+
+def netIncomeOfComponent(subG):
+    '''
+    计算单个资金归集子图中各企业的净资金流入
+    Params:
+        subG: 资金归集子图
+    '''
+    netIncomeOfComponents([subG])
+
+
+@instrument.timed("moneyCollection.netIncome", counts=instrument.ofInput)
 def getNetIncome(Glist):
     '''
     计算各个企业的净资金流入
@@ -124,121 +352,228 @@ def getNetIncome(Glist):
     Outputs:
         GList: 在原图中加入点的权重
     '''
-    for subG in Glist:
-        for n in subG.nodes():
-            children = list(subG.neighbors(n))
-            father = list(subG.predecessors(n))
-            netIncome = 0
-            # 贷款流入
-            for f in father:
-                for k1 in subG[f][n]:
-                    netIncome += subG[f][n][k1]["txnAmount"]
-            # 转账流出
-            for c in children:
-                for k2 in subG[n][c]:
-                    netIncome -= subG[n][c][k2]["txnAmount"]
-            subG.nodes[n]["netIncome"] = netIncome
-        # 标准化净资金流入, 用于可视化时的size, 范围为[5, 14]
-        d = [abs(x) 
-            for x in nx.get_node_attributes(subG, "netIncome").values()
-        ]
-        maxNetIncome, minNetIncome = max(d), min(d)
-        if maxNetIncome == minNetIncome:
-            for n in subG.nodes():
-                subG.nodes[n]["std"] = 9
-        else:
-            k = 9/(maxNetIncome - minNetIncome)
-            for n in subG.nodes():
-                subG.nodes[n]["std"] = 5 + k * (
-                        abs(subG.nodes[n]["netIncome"]) - minNetIncome
-                    )
+    netIncomeOfComponents(Glist)
     print("----------净资金流入计算完成----------")
 
 
-def findShellEnterprise(GList):
+def _transferIndex(subG, n):
+    '''
+    节点的转账出边索引, 按日期稳定排序以便二分查找日期窗口
+    Returns:
+        index: (out, dates, amounts, order), out为按原遍历顺序的(下游企业, 边键, 日期, 金额),
+            dates、amounts为排序后的日期和金额, order[i]为排序后第i条边在out中的位置; 没有转账出边时为None
+    '''
+    out = [
+        (c, k2, d["txnDateTime"], d["txnAmount"])
+        for c, edges in subG.succ[n].items()
+        for k2, d in edges.items()
+        if d["isLoan"] != loan["isLoan"]
+    ]
+    if not out:
+        return None
+    dates = np.array([x[2] for x in out], dtype=np.int64)
+    order = np.argsort(dates, kind="stable")
+    amounts = np.array([x[3] for x in out], dtype=np.float64)[order]
+    return out, dates[order], amounts, order
+
+
+def _searchPath(transfers, start, n, loanDate, loanAmount, window, minRate, maxHops, maxVisits):
+    '''
+    从一笔贷款的收款企业出发, 深度优先搜索时间递增的转账路径
+    每一跳的转账不早于上一笔交易、不晚于贷款日期后window天, 金额与上一笔之比在minRate-1.0之间,
+    继续向下转账的中间企业不重复, 也不回到贷款企业; 末跳的接收企业不受限制
+    Params:
+        transfers: 节点 -> _transferIndex的返回值
+        start, n: 提供贷款和收到贷款的企业
+        loanDate, loanAmount: 贷款日期和金额
+        window, minRate, maxHops, maxVisits: 同matchShellOfComponent
+    Returns:
+        best: 跳数最多的路径中末跳金额与贷款金额之比最大者, 比例相同时取各跳在原遍历顺序中靠后的,
+            为((跳数, 比例, 各跳位置), [(转出企业, 转账在out中的位置), ...]); 没有路径时为None
+    '''
+    deadline = loanDate + window
+    best, hops, onPath = None, list(), {start, n}
+    visits = 0
+
+    def extend(u, date, amount):
+        nonlocal best, visits
+        index = transfers(u)
+        if index is None:
+            return
+        out, dates, amounts, order = index
+        i = int(dates.searchsorted(date, side="left"))
+        j = int(dates.searchsorted(deadline, side="right"))
+        if i == j:
+            return
+        rate = amounts[i:j] / amount
+        mask = (rate >= minRate) & (rate <= 1)
+        if not mask.any():
+            return
+        positions, kept = order[i:j][mask], amounts[i:j][mask]
+        visits += len(positions)
+        # 在本跳结束的路径中取比例最大者, 比例相同时取原遍历顺序中靠后的
+        totals = kept / loanAmount
+        top = totals.max()
+        prefix = tuple(p for _, p in hops)
+        key = (len(hops) + 1, float(top), prefix + (int(positions[totals == top].max()),))
+        if best is None or key > best[0]:
+            best = (key, hops + [(u, key[2][-1])])
+        if len(hops) + 1 >= maxHops:
+            return
+        for pos, a in zip(positions.tolist(), kept.tolist()):
+            c, _, d, _ = out[pos]
+            if c in onPath or visits >= maxVisits or transfers(c) is None:
+                continue
+            # 金额逐跳不增, 已有maxHops跳且比例更高的路径时, 由此延长不会更优
+            if best[0][0] == maxHops and a / loanAmount < best[0][1]:
+                continue
+            hops.append((u, pos))
+            onPath.add(c)
+            extend(c, d, a)
+            onPath.discard(c)
+            hops.pop()
+
+    extend(n, loanDate, loanAmount)
+    return best
+
+
+def matchShellOfComponent(subG, window=5, minRate=0.9, maxHops=1, maxVisits=10000):
+    '''
+    在单个资金归集子图中寻找贷款后经一个或多个中间企业转出的资金归集路径
+    每个节点的转账出边只在第一次经过时建立按日期排序的索引, 每一跳用二分查找定位日期窗口内的候选转账,
+    再在数组上按金额比例筛选; maxHops为1时即原来的贷款-转账三元组, 总体复杂度约为O(E log E),
+    多跳时每笔贷款的搜索范围受日期窗口、逐跳金额比例和maxVisits限制
+    Params:
+        subG: 资金归集子图
+        window: 最后一笔转账与贷款日期相差的最大天数
+        minRate: 每一跳转账金额与上一笔交易金额之比的下限
+        maxHops: 贷款之后转账的最大跳数, 即中间企业数的上限
+        maxVisits: 每笔贷款最多检查的候选转账数, 超出后不再延长路径, 避免枢纽账户处的组合爆炸
+    Returns:
+        matches: 路径列表, 每项为(企业, 边属性, 金额比例), 企业依次为上游企业、各中间企业和下游企业的账户号,
+            边属性依次为贷款边和各跳转账边, 金额比例为最后一笔转账与贷款金额之比
+    '''
+    account = graphCore.idOf(subG)
+    index = dict()
+
+    def transfers(u):
+        if u not in index:
+            index[u] = _transferIndex(subG, u)
+        return index[u]
+
+    matches = list()
+    for n in subG.nodes():
+        if transfers(n) is None:
+            continue
+        for f, edges in subG.pred[n].items():
+            for k1, d in edges.items():
+                if d["isLoan"] == txn["isLoan"]:
+                    continue
+                best = _searchPath(
+                    transfers, f, n, d["txnDateTime"], d["txnAmount"], window, minRate, maxHops, maxVisits
+                )
+                if best is None:
+                    continue
+                (_, rate, _), hops = best
+                accounts, links = [account(f), account(n)], [dict(d)]
+                for u, pos in hops:
+                    c, k2 = index[u][0][pos][:2]
+                    accounts.append(account(c))
+                    links.append(dict(subG[u][c][k2]))
+                matches.append((tuple(accounts), tuple(links), float(rate)))
+    return matches
+
+
+@instrument.timed("moneyCollection.findShell", counts=instrument.ofInput)
+def findShellEnterprise(GList, workers=1, maxHops=1):
     '''
     根据资金归集关系找到空壳企业
     Params:
         GList: 资金归集子图列表
+        workers: 并行处理子图的进程数
+        maxHops: 贷款之后转账的最大跳数, 为1时只寻找三元组
     Returns:
-        se: 企业资金归集图
+        se: 企业资金归集图, se.graph["matches"]为按Gid排列的各子图路径, 节点属性role为roleBits组合的角色位掩码
         seNodes: 资金归集企业列表
     '''
-    se = nx.MultiDiGraph()
+    match = functools.partial(matchShellOfComponent, maxHops=maxHops)
+    return shellFromMatches(parallel.mapComponents(match, GList, workers))
+
+
+def roleNames(mask):
+    '''
+    将角色位掩码还原为角色名列表
+    '''
+    return [name for name, bit in roleBits.items() if mask & bit]
+
+
+def shellRoles(results):
+    '''
+    汇总各企业在资金归集路径中的角色
+    Params:
+        results: 各子图matchShellOfComponent的返回值列表
+    Returns:
+        roles: 企业 -> 角色位掩码
+    '''
+    roles = dict()
+    for matches in results:
+        for accounts, *_ in matches:
+            roles[accounts[0]] = roles.get(accounts[0], 0) | roleBits["start"]
+            for n in accounts[1:-1]:
+                roles[n] = roles.get(n, 0) | roleBits["mid"]
+            roles[accounts[-1]] = roles.get(accounts[-1], 0) | roleBits["end"]
+    return roles
+
+
+def shellFromMatches(results):
+    '''
+    由各子图的资金归集路径汇总出资金归集图和企业列表
+    Params:
+        results: 各子图matchShellOfComponent的返回值列表
+    Returns:
+        se, seNodes: 同findShellEnterprise
+    '''
+    se = nx.MultiDiGraph(matches=results)
     seNodes = [[] for i in range(3)]
     codes = [[], []]
-    for subG in GList:
-        for n in subG.nodes():
-            children = list(subG.neighbors(n))
-            father = list(subG.predecessors(n))
-            if not father or not children:
-                continue
-            # 上游企业
-            for f in father:
-                for k1 in subG[f][n]:
-                    # 若入边非贷款, 直接跳过
-                    if subG[f][n][k1]["isLoan"] == txn["isLoan"]:
-                        continue
-                    # 寻找最匹配的贷款和转账
-                    bestMatchF, bestMatchRate, bestMatchC, bestMatchLoan, bestMatchTxn, bestMatchDate = "", 0.9, "", -1, -1, 0
-                    # 下游企业
-                    for c in children:
-                        for k2 in subG[n][c]:
-                            # 若出边非转账或三元组上任意两个节点相同, 直接跳过
-                            if subG[n][c][k2]["isLoan"] == loan["isLoan"]:
-                                continue
-                            # 日期相差五天, 且金额变化在0.9-1.0范围内
-                            rate = subG[n][c][k2]["txnAmount"] / subG[f][n][k1]["txnAmount"]
-                            if (
-                                subG[n][c][k2]["txnDateTime"] - subG[f][n][k1]["txnDateTime"] <= 5 
-                                and subG[n][c][k2]["txnDateTime"] >= subG[f][n][k1]["txnDateTime"]
-                                and rate >= bestMatchRate
-                                and rate <= 1
-                            ):
-                                bestMatchC, bestMatchRate, bestMatchF = c, rate, f
-                                bestMatchLoan, bestMatchTxn = subG[f][n][k1]["txnAmount"], subG[n][c][k2]["txnAmount"]
-                                bestMatchDate = (subG[f][n][k1]["txnDateTime"], subG[n][c][k2]["txnDateTime"])
-                        # 如果找到了匹配到的贷款和转账, 则修改节点属性, 将其记录到se中
-                    if bestMatchC:
-                        print(
-                            "father: ", bestMatchF, 
-                            "node: ", n, 
-                            "child: ", bestMatchC, "\n"
-                            "贷款交易码：", subG[bestMatchF][n][k1]["txnCode"], 
-                            "转账交易码：", subG[n][bestMatchC][k2]["txnCode"]
-                        )
-                        print(
-                            "rate: ", bestMatchRate, 
-                            "贷款金额: ", bestMatchLoan, 
-                            "转账金额: ", bestMatchTxn, 
-                            "贷款和转账日期: ", bestMatchDate
-                        )
-                        codes[0].append(subG[bestMatchF][n][k1]["txnCode"])
-                        codes[1].append(subG[n][bestMatchC][k2]["txnCode"])
-                        se.add_edge(
-                            bestMatchF, 
-                            n, 
-                            txnAmount=bestMatchLoan, 
-                            isLoan=0, 
-                            txnDateTime=bestMatchDate[0], 
-                            txnCode=subG[bestMatchF][n][k1]["txnCode"], 
-                            width=subG[bestMatchF][n][k1]["width"]
-                        )
-                        se.add_edge(
-                            n, 
-                            bestMatchC, 
-                            txnAmount=bestMatchTxn, 
-                            isLoan=1, 
-                            txnDateTime=bestMatchDate[1], 
-                            txnCode=subG[n][bestMatchC][k2]["txnCode"], 
-                            width=subG[n][bestMatchC][k2]["width"]
-                        )
-                        seNodes[0].append(bestMatchF)
-                        seNodes[1].append(n)
-                        seNodes[2].append(bestMatchC)
+    paths = 0
+    for matches in results:
+        for accounts, links, rate in matches:
+            loanEdge, txnEdges = links[0], links[1:]
+            print(
+                "father: ", accounts[0], 
+                "node: ", *accounts[1:-1], 
+                "child: ", accounts[-1], "\n"
+                "贷款交易码：", loanEdge["txnCode"], 
+                "转账交易码：", *[e["txnCode"] for e in txnEdges]
+            )
+            print(
+                "rate: ", rate, 
+                "贷款金额: ", loanEdge["txnAmount"], 
+                "转账金额: ", *[e["txnAmount"] for e in txnEdges], 
+                "贷款和转账日期: ", tuple(e["txnDateTime"] for e in links)
+            )
+            codes[0].append(loanEdge["txnCode"])
+            codes[1].extend(e["txnCode"] for e in txnEdges)
+            # 贷款边isLoan为0, 各跳转账边为1
+            for i, e in enumerate(links):
+                se.add_edge(
+                    accounts[i], 
+                    accounts[i + 1], 
+                    txnAmount=e["txnAmount"], 
+                    isLoan=int(i > 0), 
+                    txnDateTime=e["txnDateTime"], 
+                    txnCode=e["txnCode"], 
+                    width=e["width"]
+                )
+            seNodes[0].append(accounts[0])
+            seNodes[1].extend(accounts[1:-1])
+            seNodes[2].append(accounts[-1])
+            paths += 1
+    nx.set_node_attributes(se, shellRoles(results), "role")
     if (nx.number_of_nodes(se)):
-        print("资金归集三元组关系数量：", se.size() / 2)
-        print("所有处于资金归集三元组中的企业总数", nx.number_of_nodes(se))
+        print("资金归集路径数量：", paths)
+        print("所有处于资金归集路径中的企业总数", nx.number_of_nodes(se))
         seNodes = [list(set(seNodes[i])) for i in range(3)]
         codes = [list(set(codes[i])) for i in range(2)]
         print("筛选后贷款的交易码含有：", codes[0])
@@ -251,80 +586,112 @@ def findShellEnterprise(GList):
     return se, seNodes
 
 
-def graphs2json(GList, se, seNodes):
+def componentJson(item, Gid):
     '''
-    将资金归集的识别结果导出为json
+    将一个资金往来子图转化为前端可视化用的点和边
     Params:
-        se: 按中心企业切分的资金归集识别列表
-        seNodes: 中心企业列表
+        item: 资金往来子图
+        Gid: 子图编号
+    Returns:
+        nodes, links: 点和边的字典列表
     '''
-    collectionList = {"nodes": [], "links": []}
-    allList = {"nodes": [], "links": []}
-    tmp = {"nodes": [], "links": []}
-    i = 0
-    Gid = 0  # 子图编号
-    allCount = 0
-    for item in GList:
-        tmp["nodes"], tmp["links"] = [], []
-        # 初始化子图数据, 先后加点和边
-        for n in item.nodes():
-            if item.nodes[n]["netIncome"] >= 0:
-                group, c = 3, "pos"
-            else:
-                group, c = 4, "neg"
-            tmp["nodes"].append(
-                {"group": group, "class": c, "size": item.nodes[n]["std"], "Gid": Gid, "id": n}
-            )
-        for u in item.nodes():
-            for v in list(item.neighbors(u)):
-                for k in item[u][v]:
-                    dateTmp = '2020-09-' + str(item[u][v][k]["txnDateTime"])[-2:] 
-                    tmp["links"].append(
-                        {"source": u, "target": v, "date": dateTmp, "width": item[u][v][k]["width"]}
-                    )
-        allCount += len(tmp["nodes"])
-        # 每个json存储的点不超过1500个
-        if allCount >= 1500:
-            print("第", i, "个json的节点数量：", len(allList["nodes"]))
-            path = "./frontend/public/res/json/moneyCollection/" + "all_" + str(i) + ".json"
-            with open(path, "w") as f:
-                json.dump(allList, f)
-            i += 1
-            allCount = 0
-            allList["nodes"], allList["links"] = [], []
-            allList["nodes"] += tmp["nodes"]
-            allList["links"] += tmp["links"]
+    account = graphCore.idOf(item)
+    nodes, links = list(), list()
+    for n in item.nodes():
+        if item.nodes[n]["netIncome"] >= 0:
+            group, c = 3, "pos"
         else:
-            allList["nodes"] += tmp["nodes"]
-            allList["links"] += tmp["links"]
-        Gid += 1
-    # 清空还未存储的点
-    if allList["nodes"]:
-        print("第", i, "个json的节点数量：", len(allList["nodes"]))
-        path = "./frontend/public/res/json/moneyCollection/" + "all_" + str(i) + ".json"
-        with open(path, "w") as f:
-            json.dump(allList, f)
-    # 存储具有资金归集行为的点
-    for n in se.nodes():
-        group, c = 2, "end"
-        if n in seNodes[1]:
-            group, c = 1, "mid"
-        elif n in seNodes[0]:
-            group, c = 0, "start"
-        collectionList["nodes"].append({"group": group, "class": c, "size": 9, "Gid": Gid, "id": n})
-        Gid += 1
-    for u in se.nodes():
-        for v in list(se.neighbors(u)):
-            for k in se[u][v]:
-                collectionList["links"].append(
-                    {"source": u, "target": v, "width": se[u][v][k]["width"]}
+            group, c = 4, "neg"
+        nodes.append(
+            {"group": group, "class": c, "size": item.nodes[n]["std"], "Gid": Gid, "id": account(n)}
+        )
+    for u in item.nodes():
+        for v in list(item.neighbors(u)):
+            for k in item[u][v]:
+                dateTmp = '2020-09-' + str(item[u][v][k]["txnDateTime"])[-2:] 
+                links.append(
+                    {"source": account(u), "target": account(v), "date": dateTmp, "width": item[u][v][k]["width"]}
                 )
-    print("存储具有资金归集行为企业信息的json的节点数量：", len(collectionList["nodes"]))
-    with open(r"./frontend/public/res/json/moneyCollection/moneyCollection.json", "w") as f:
-        json.dump(collectionList, f)
+    return nodes, links
+
+
+# 前端json文件: 类别 -> 文件名模板, 按jsonWriter.shardBudget分片
+jsonPath = "./frontend/public/res/json/moneyCollection/"
+jsonKeys = ("nodes", "links")
+jsonFiles = {
+    "all": "all_%d.json",
+}
+# 具有资金归集行为的企业图, 按其弱连通分量分片, 与jsonFiles共用一个分片清单
+collectionFiles = {
+    "collection": "moneyCollection_%d.json",
+}
+
+
+def jsonCategories(item, Gid):
+    '''
+    将一个子图转化为点和边, 并确定其所属的前端json类别
+    Params:
+        item: 资金往来子图
+        Gid: 子图编号
+    Returns:
+        nodes, links: 点和边的字典列表
+        categories: jsonFiles中的类别列表
+    '''
+    nodes, links = componentJson(item, Gid)
+    return nodes, links, ["all"]
+
+
+def collectionJson(se, Gid, writer):
+    '''
+    导出具有资金归集行为的企业, 每个弱连通分量作为collection类别的一个子图写入, 节点编号接在子图编号之后
+    兼有多个角色的企业按中间企业、提供贷款企业、接收转账企业的优先级归类
+    Params:
+        se: findShellEnterprise返回的企业资金归集图
+        Gid: 第一个节点的编号
+        writer: 打开的jsonWriter.LayoutWriter, 含有collectionFiles中的类别
+    '''
+    rank = {n: i for i, n in enumerate(se.nodes)}
+    for k, part in enumerate(nx.weakly_connected_components(se)):
+        part = sorted(part, key=rank.get)
+        nodes = list()
+        for n in part:
+            role = se.nodes[n].get("role", 0)
+            if role & roleBits["mid"]:
+                group, c = 1, "mid"
+            elif role & roleBits["start"]:
+                group, c = 0, "start"
+            else:
+                group, c = 2, "end"
+            nodes.append({"group": group, "class": c, "size": 9, "Gid": Gid + rank[n], "id": n})
+        links = [{"source": u, "target": v, "width": w} for u, v, w in se.edges(part, data="width")]
+        writer.write(k, nodes, links, ["collection"])
+    print("存储具有资金归集行为企业信息的json的节点数量：", sum(entry[2] for entry in writer.layout["collection"]))
+
+
+@instrument.timed("moneyCollection.export", counts=instrument.ofInput)
+def graphs2json(GList, se, seNodes, backend="auto", formats=()):
+    '''
+    将资金归集的识别结果导出为json, 每个子图处理完后直接写入打开的文件
+    Params:
+        se: 按中心企业切分的资金归集识别列表, 企业的角色取自节点属性role
+        seNodes: 中心企业列表, 保留以兼容原接口
+        backend: json序列化后端, 见jsonWriter.dumps
+        formats: 额外生成的列式或预压缩格式, 见columnar.writePayloads
+    Returns:
+        layout: 各json文件包含的子图编号, 见jsonWriter.LayoutWriter
+    '''
+    with jsonWriter.LayoutWriter(jsonPath, dict(jsonFiles, **collectionFiles), jsonKeys, backend, formats) as writer:
+        for Gid, item in enumerate(GList):
+            writer.write(Gid, *jsonCategories(item, Gid))
+        # 存储具有资金归集行为的点
+        collectionJson(se, len(GList), writer)
+    for i, (_, _, nodeCount, _) in enumerate(writer.layout["all"]):
+        print("第", i, "个json的节点数量：", nodeCount)
     print("----------资金归集json数据导出完成----------")
+    return writer.layout
 
 
+@instrument.timed("moneyCollection.answer")
 def ansJson(seNodes):
     '''
     将资金归集的识别结果导出为json
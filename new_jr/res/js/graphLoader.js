@@ -0,0 +1,171 @@
+/*
+ * 图数据加载: 优先读取与json同名的.bin列式文件, 不存在或无法解析时回退到d3.json
+ * .bin文件由后端columnar.py生成, 格式说明见该文件
+ * 用法与d3.json相同: loadGraph(url, function (error, data) {...})
+ * 分片加载: 后端按规模上限把各类别的子图装箱到多个json文件, 并在目录下写出manifest.json,
+ * loadShard只加载当前需要的一个分片, 页面地址中的?shard=N指定分片序号:
+ *     var shard = shardIndex(0);
+ *     shardNav(dir, "double", shard);
+ *     loadShard(dir, "double", shard, function (error, data) {...})
+ */
+(function (global) {
+    var ARRAY_TYPES = {
+        uint8: Uint8Array, int8: Int8Array,
+        uint16: Uint16Array, int16: Int16Array,
+        uint32: Uint32Array, int32: Int32Array,
+        float32: Float32Array, float64: Float64Array
+    };
+
+    function decodeGraph(buffer) {
+        var view = new DataView(buffer);
+        var magic = String.fromCharCode(view.getUint8(0), view.getUint8(1), view.getUint8(2), view.getUint8(3));
+        if (magic !== "GCOL" || view.getUint32(4, true) !== 1) {
+            throw new Error("unsupported graph payload");
+        }
+        var headerLen = view.getUint32(8, true);
+        var header = JSON.parse(new TextDecoder("utf-8").decode(new Uint8Array(buffer, 16, headerLen)));
+        var body = 16 + headerLen;
+        var graph = {}, resolved = {};
+        // 引用列依赖nodes表, 先解码nodes
+        var tables = header.tables.slice().sort(function (a, b) {
+            return (a !== "nodes") - (b !== "nodes");
+        });
+        tables.forEach(function (table) {
+            var length = header[table].length;
+            var rows = new Array(length);
+            for (var i = 0; i < length; i++) {
+                rows[i] = {};
+            }
+            header[table].columns.forEach(function (col) {
+                var values = col.values;
+                if (!values) {
+                    var codes = new ARRAY_TYPES[col.dtype](buffer, body + col.offset, col.length);
+                    var lookup = col.dict || (col.ref ? resolved[col.ref] : null);
+                    values = new Array(col.length);
+                    for (var j = 0; j < col.length; j++) {
+                        values[j] = lookup ? lookup[codes[j]] : codes[j];
+                    }
+                }
+                if (table === "nodes") {
+                    resolved[col.name] = values;
+                }
+                for (var k = 0; k < length; k++) {
+                    rows[k][col.name] = values[k];
+                }
+            });
+            graph[table] = rows;
+        });
+        var ordered = {};
+        header.tables.forEach(function (table) {
+            ordered[table] = graph[table];
+        });
+        return ordered;
+    }
+
+    function loadGraph(url, callback) {
+        var xhr = new XMLHttpRequest();
+        xhr.open("GET", url.replace(/\.json$/, ".bin"));
+        xhr.responseType = "arraybuffer";
+        xhr.onload = function () {
+            var ok = (xhr.status >= 200 && xhr.status < 300) || (xhr.status === 0 && xhr.response);
+            var data = null;
+            if (ok) {
+                try {
+                    data = decodeGraph(xhr.response);
+                } catch (e) {
+                    data = null;
+                }
+            }
+            if (data) {
+                callback(null, data);
+            } else {
+                d3.json(url, callback);
+            }
+        };
+        xhr.onerror = function () {
+            d3.json(url, callback);
+        };
+        xhr.send();
+    }
+
+    var manifests = {};  // 目录 -> {data: 清单, waiting: 等待清单的回调}
+
+    function loadManifest(dir, callback) {
+        var entry = manifests[dir];
+        if (entry && entry.data) {
+            callback(null, entry.data);
+            return;
+        }
+        if (entry) {
+            entry.waiting.push(callback);
+            return;
+        }
+        // 同一目录的清单只请求一次
+        entry = manifests[dir] = {data: null, waiting: [callback]};
+        d3.json(dir + "manifest.json", function (error, data) {
+            if (error) {
+                delete manifests[dir];
+            } else {
+                entry.data = data;
+            }
+            entry.waiting.forEach(function (cb) {
+                cb(error, data);
+            });
+        });
+    }
+
+    function loadShard(dir, category, index, callback) {
+        loadManifest(dir, function (error, manifest) {
+            if (error) {
+                callback(error);
+                return;
+            }
+            var shards = manifest.categories[category] || [];
+            // 类别没有该分片时返回空图
+            if (index >= shards.length) {
+                var empty = {};
+                manifest.keys.forEach(function (key) {
+                    empty[key] = [];
+                });
+                callback(null, empty);
+                return;
+            }
+            loadGraph(dir + shards[index].file, callback);
+        });
+    }
+
+    function shardIndex(defaultIndex) {
+        var match = /[?&]shard=(\d+)/.exec(global.location ? global.location.search : "");
+        return match ? parseInt(match[1], 10) : defaultIndex;
+    }
+
+    function shardNav(dir, category, current) {
+        loadManifest(dir, function (error, manifest) {
+            var shards = error ? [] : manifest.categories[category] || [];
+            if (shards.length < 2) {
+                return;
+            }
+            // 在页面右上角列出全部分片, 点击后在当前页面加载对应分片
+            var nav = document.createElement("div");
+            nav.className = "shard-nav";
+            nav.style.cssText = "position: fixed; top: 10px; right: 20px; z-index: 10; font-size: 14px;";
+            shards.forEach(function (shard, i) {
+                var a = document.createElement("a");
+                a.href = "?shard=" + i;
+                a.target = "_self";
+                a.textContent = i;
+                a.title = shard.nodes + " nodes, " + shard.links + " links, " + shard.components + " components";
+                a.style.cssText = "margin: 0 4px; color: " + (i === current ? "#ffffff" : "#afaaaa") + ";";
+                nav.appendChild(a);
+            });
+            document.body.appendChild(nav);
+        });
+    }
+
+    global.decodeGraph = decodeGraph;
+    global.loadGraph = loadGraph;
+    global.loadManifest = loadManifest;
+    global.loadShard = loadShard;
+    global.shardIndex = shardIndex;
+    global.shardNav = shardNav;
+})(this);
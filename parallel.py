@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import os
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# 子进程中的子图列表, 由进程池初始化函数设置
+_GList = None
+
+
+def _initWorker(GList):
+    """
+    进程池初始化函数, 进程池总是以fork方式启动, 子图列表直接继承自父进程, 无需序列化
+    """
+    global _GList
+    _GList = GList
+
+
+def _runBatch(func, batch, attrs):
+    """
+    在子进程中处理一批子图
+    Params:
+        func: 处理单个子图的函数
+        batch: 子图编号列表
+        attrs: 需要回传给父进程的节点属性名
+    Returns:
+        每个子图的(func返回值, [(节点, 属性值元组), ...])列表
+    """
+    results = list()
+    for Gid in batch:
+        G = _GList[Gid]
+        ret = func(G)
+        nodeData = [(n, tuple(d[a] for a in attrs)) for n, d in G.nodes(data=True)] if attrs else []
+        results.append((ret, nodeData))
+    return results
+
+
+def makeBatches(GList, batchNodes):
+    """
+    按子图规模划分任务: 大量的小子图按节点数打包成一批, 节点数不少于batchNodes的子图单独成批
+    Params:
+        GList: 子图列表
+        batchNodes: 每批的节点数目标
+    Returns:
+        batches: 子图编号列表的列表, 批与批、批内子图均保持Gid顺序
+    """
+    batches = list()
+    batch, count = list(), 0
+    for Gid, G in enumerate(GList):
+        n = G.number_of_nodes()
+        if n >= batchNodes:
+            if batch:
+                batches.append(batch)
+                batch, count = list(), 0
+            batches.append([Gid])
+            continue
+        batch.append(Gid)
+        count += n
+        if count >= batchNodes:
+            batches.append(batch)
+            batch, count = list(), 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def forkContext():
+    """
+    fork方式的进程启动上下文, 平台不支持fork(如Windows)时为None
+    spawn和forkserver方式会把整个子图列表序列化后传给每个子进程, 代价往往超过并行带来的收益
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+
+def mapComponents(func, GList, workers=1, attrs=(), batchNodes=5000):
+    """
+    对每个子图调用func, workers大于1时用fork方式启动的进程池并行处理, 并将子进程中修改的节点属性写回原子图
+    不支持fork的平台上总是串行处理
+    Params:
+        func: 处理单个子图的模块级函数, 原地修改节点属性, 返回值需可序列化
+        GList: 子图列表
+        workers: 进程数, 为0时使用全部CPU核数
+        attrs: func会修改的节点属性名
+        batchNodes: 每批任务的节点数目标
+    Returns:
+        results: 按Gid顺序排列的func返回值列表
+    """
+    workers = workers or os.cpu_count()
+    context = forkContext()
+    if workers <= 1 or len(GList) < 2 or context is None:
+        return [func(G) for G in GList]
+    batches = makeBatches(GList, batchNodes)
+    results = [None] * len(GList)
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_initWorker, initargs=(GList,)) as pool:
+        # 同时在途的任务数有限, 控制回传结果占用的内存; 按提交顺序合并, 保证Gid顺序稳定
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, pool.submit(_runBatch, func, batch, attrs)))
+            if len(pending) >= 4 * workers:
+                _merge(GList, results, attrs, *pending.popleft())
+        while pending:
+            _merge(GList, results, attrs, *pending.popleft())
+    return results
+
+
+def _merge(GList, results, attrs, batch, future):
+    """
+    将一批子图的处理结果写回父进程
+    """
+    for Gid, (ret, nodeData) in zip(batch, future.result()):
+        results[Gid] = ret
+        nodes = GList[Gid].nodes
+        for n, values in nodeData:
+            nodes[n].update(zip(attrs, values))
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+"""
+分析结果查询服务: 一次性载入增量模式保存的控制人、担保关系、资金归集分析结果, 建立企业ID -> 子图编号的索引,
+按企业ID返回其所在子图、k跳邻域或风险标记, 点和边的字段与前端json文件相同, 页面可直接用d3.json或loadGraph请求
+用法:
+    python main.py --state-dir ./backend/state
+    python server.py --state-dir ./backend/state --port 8765
+接口:
+    GET /api/tables                                 已载入的表及其规模
+    GET /api/<table>/component?id=<企业ID>           企业所在的整个子图
+    GET /api/<table>/neighborhood?id=<企业ID>&k=2    企业k跳以内(不区分边的方向)的邻域, 节点数超过limit时截断
+    GET /api/<table>/risk?id=<企业ID>                企业的节点属性、所在子图的前端类别, 资金归集表另有资金归集路径中的角色
+<table>为control、guarantee或moneyCollection, 企业ID不存在时返回404
+"""
+import os
+import argparse
+import threading
+import collections
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+import graphCore
+import jsonWriter
+import incremental
+import moneyCollection
+
+
+class QueryError(Exception):
+    """
+    请求无法完成, status为返回的HTTP状态码
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class GraphIndex:
+    """
+    一张表的分析结果及企业ID索引, 整个子图的查询结果按子图编号缓存
+    """
+
+    def __init__(self, table, state, cacheSize=256):
+        """
+        Params:
+            table: "control"、"guarantee"或"moneyCollection"
+            state: incremental.loadState的返回值
+            cacheSize: 缓存的子图数
+        """
+        self.table = table
+        self.module = incremental.modules[table]
+        self.G = state["G"]
+        self.components = state["components"]
+        self.nodeGid = {n: Gid for Gid, nodes in self.components.items() for n in nodes}
+        # 资金归集图以账户号的整数编号为节点
+        self.ids = self.G.graph.get("ids")
+        self.idOf = graphCore.idOf(self.G)
+        # 资金归集路径中的角色: 企业ID -> 角色位掩码
+        self.roles = moneyCollection.shellRoles(state.get("matches", {}).values())
+        self._cache = collections.OrderedDict()
+        self._cacheSize = cacheSize
+        self._lock = threading.Lock()
+
+    def summary(self):
+        return {
+            "nodes": self.G.number_of_nodes(),
+            "edges": self.G.number_of_edges(),
+            "components": len(self.components),
+        }
+
+    def resolve(self, raw):
+        """
+        将请求中的企业ID转为图中的节点: 资金归集表的账户号规范化后查找编号, csv中为纯数字的ID读入后是整数
+        """
+        if self.ids is not None:
+            code = int(self.ids.find([raw])[0])
+            if code in self.nodeGid:
+                return code
+        elif raw in self.nodeGid:
+            return raw
+        elif raw.lstrip("-").isdigit() and int(raw) in self.nodeGid:
+            return int(raw)
+        raise QueryError(404, "%s中不存在企业%s" % (self.table, raw))
+
+    def _payload(self, nodes, links, **extra):
+        data = {"nodes": nodes, "links": links}
+        # 键的顺序与该表的前端json文件一致
+        payload = {key: data[key] for key in self.module.jsonKeys}
+        payload.update(extra)
+        return payload
+
+    def _component(self, Gid):
+        """
+        整个子图的前端类别和序列化后的响应
+        """
+        with self._lock:
+            if Gid in self._cache:
+                self._cache.move_to_end(Gid)
+                return self._cache[Gid]
+        nodes, links, categories = self.module.jsonCategories(self.G.subgraph(self.components[Gid]), Gid)
+        entry = (categories, jsonWriter.dumps(self._payload(nodes, links, Gid=Gid, categories=categories)))
+        with self._lock:
+            self._cache[Gid] = entry
+            while len(self._cache) > self._cacheSize:
+                self._cache.popitem(last=False)
+        return entry
+
+    def component(self, raw):
+        return self._component(self.nodeGid[self.resolve(raw)])[1]
+
+    def neighborhood(self, raw, k=1, limit=2000):
+        """
+        从企业出发沿入边和出边广度优先搜索k跳, 子图是弱连通分量, 因此邻域不会越出所在子图
+        """
+        source = self.resolve(raw)
+        Gid = self.nodeGid[source]
+        seen, frontier, truncated = {source}, [source], False
+        for _ in range(k):
+            nextFrontier = list()
+            for u in frontier:
+                for v in (*self.G.pred[u], *self.G.succ[u]):
+                    if v in seen:
+                        continue
+                    if len(seen) >= limit:
+                        truncated = True
+                        break
+                    seen.add(v)
+                    nextFrontier.append(v)
+            frontier = nextFrontier
+            if truncated or not frontier:
+                break
+        nodes, links, categories = self.module.jsonCategories(self.G.subgraph(seen), Gid)
+        return jsonWriter.dumps(self._payload(
+            nodes, links, Gid=Gid, center=self.idOf(source), k=k, truncated=truncated, categories=categories
+        ))
+
+    def risk(self, raw):
+        n = self.resolve(raw)
+        Gid = self.nodeGid[n]
+        result = {
+            "id": self.idOf(n),
+            "Gid": Gid,
+            "componentSize": len(self.components[Gid]),
+            "categories": self._component(Gid)[0],
+            "attributes": dict(self.G.nodes[n]),
+        }
+        if self.table == "moneyCollection":
+            result["roles"] = moneyCollection.roleNames(self.roles.get(self.idOf(n), 0))
+        return jsonWriter.dumps(result)
+
+
+def load(stateDir, tables=None):
+    """
+    载入状态目录下已保存的各表分析结果
+    Params:
+        stateDir: main.py --state-dir指定的目录
+        tables: 需要载入的表, 为None时载入全部已保存的表
+    Returns:
+        indexes: 表名 -> GraphIndex
+    """
+    indexes = dict()
+    for table in tables or incremental.modules:
+        if not os.path.exists(incremental.statePath(stateDir, table)):
+            if tables:
+                raise FileNotFoundError("未找到%s的分析结果, 请先运行python main.py --state-dir %s" % (table, stateDir))
+            continue
+        indexes[table] = GraphIndex(table, incremental.loadState(stateDir, table))
+    return indexes
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """
+    处理查询请求, indexes由makeServer设置
+    """
+    indexes = dict()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            status, body = 200, self.route(parts, query)
+        except QueryError as e:
+            status, body = e.status, jsonWriter.dumps({"error": str(e)})
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        # 允许本地打开的前端页面跨域请求
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def route(self, parts, query):
+        if parts == ["api", "tables"]:
+            return jsonWriter.dumps({table: index.summary() for table, index in self.indexes.items()})
+        if len(parts) != 3 or parts[0] != "api":
+            raise QueryError(404, "未知的接口: /" + "/".join(parts))
+        table, action = parts[1], parts[2]
+        if table not in self.indexes:
+            raise QueryError(404, "未载入的表: %s" % table)
+        if "id" not in query:
+            raise QueryError(400, "缺少参数id")
+        index = self.indexes[table]
+        if action == "component":
+            return index.component(query["id"])
+        if action == "risk":
+            return index.risk(query["id"])
+        if action == "neighborhood":
+            try:
+                k, limit = int(query.get("k", 1)), int(query.get("limit", 2000))
+            except ValueError:
+                raise QueryError(400, "k和limit需为整数")
+            if k < 0 or limit < 1:
+                raise QueryError(400, "k需不小于0, limit需不小于1")
+            return index.neighborhood(query["id"], k, limit)
+        raise QueryError(404, "未知的查询: %s" % action)
+
+
+def makeServer(indexes, host="127.0.0.1", port=8765):
+    """
+    创建查询服务, 每个请求在单独的线程中处理
+    Params:
+        indexes: load的返回值
+        host, port: 监听地址
+    """
+    handler = type("Handler", (QueryHandler,), {"indexes": indexes})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="按企业ID查询分析结果的HTTP服务")
+    parser.add_argument("--state-dir", default="./backend/state", help="main.py --state-dir保存分析结果的目录")
+    parser.add_argument("--tables", nargs="*", choices=list(incremental.modules), default=None, help="需要载入的表")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口")
+    args = parser.parse_args()
+    indexes = load(args.state_dir, args.tables)
+    if not indexes:
+        parser.error("%s下没有已保存的分析结果, 请先运行python main.py --state-dir %s" % (args.state_dir, args.state_dir))
+    for table, index in indexes.items():
+        print("已载入%s: %s" % (table, index.summary()))
+    server = makeServer(indexes, args.host, args.port)
+    print("查询服务已启动: http://%s:%d/api/tables" % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+多关系企业图: 把控制人、担保关系、资金归集三张表合并为一张图, 三张表的公司ID共用一个驻留表,
+边带有关系类型: ownership(持股/控制)、guarantee(担保)、loan(贷款)、transfer(转账)
+在合并图上做跨表分析:
+    风险传播: 以担保关系的风险值m等为初值, 沿持股、担保和资金往来关系做稀疏矩阵-向量迭代, 可一次传播多组初值
+    共同控制人: 找出担保圈中被同一控制人(沿持股关系向上可达)控制的成员
+用法:
+    python unified.py
+    python unified.py --damping 0.8 --top 500 --out ./answers/unified
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+import graphCore
+import instrument
+import jsonWriter
+import control
+import guarantee
+import moneyCollection
+
+# 关系类型, 顺序即边的relation列的类别编码
+relations = ["ownership", "guarantee", "loan", "transfer"]
+# 节点出现在哪些表中的位掩码
+tableBits = {"control": 1, "guarantee": 2, "moneyCollection": 4}
+# 各关系传播风险的系数和方向: forward为沿边的方向(src -> dst), reverse为逆着边, both为双向
+# 担保的边由担保人指向被担保人, 被担保人的风险由担保人承担; 贷款的边由放款方指向借款方, 借款方的风险由放款方承担
+defaultChannels = {
+    "ownership": (0.5, "both"),
+    "guarantee": (1.0, "reverse"),
+    "loan": (0.5, "reverse"),
+    "transfer": (0.25, "both"),
+}
+# 稀疏矩阵-向量乘法每次处理的边数, 限制临时数组的内存
+edgeChunk = 1 << 22
+jsonPath = "./answers/unified/"
+
+
+def _tableEdges(control=None, guarantee=None, moneyCollection=None):
+    """
+    三张表的紧凑图中的边, 按关系类型拆分
+    Returns:
+        列表, 每项为(表名, 紧凑图, 关系编号, 边的布尔掩码或None, 边的权重)
+    """
+    items = list()
+    if control is not None:
+        items.append(("control", control, 0, None, np.asarray(control.edgeAttrs["rate"], dtype=float) / 100))
+    if guarantee is not None:
+        items.append(("guarantee", guarantee, 1, None, np.asarray(guarantee.edgeAttrs["amount"], dtype=float)))
+    if moneyCollection is not None:
+        isLoan = np.asarray(moneyCollection.edgeAttrs["isLoan"]) == 1
+        amount = np.asarray(moneyCollection.edgeAttrs["txnAmount"], dtype=float)
+        items.append(("moneyCollection", moneyCollection, 2, isLoan, amount[isLoan]))
+        items.append(("moneyCollection", moneyCollection, 3, ~isLoan, amount[~isLoan]))
+    return items
+
+
+def buildUnifiedCore(control=None, guarantee=None, moneyCollection=None):
+    """
+    合并三张表的紧凑图
+    各表的ID统一转为字符串后驻留到同一个IdIndex中, 不同表里相同的ID即为同一个节点
+    Params:
+        control, guarantee, moneyCollection: 各表的CompactGraph, 见各模块compact=True时的读取函数, 可缺省
+    Returns:
+        core: CompactGraph, 节点属性tables为节点所在表的位掩码,
+            边属性relation为关系类型(类别为relations), weight为持股比例或金额
+    """
+    ids = graphCore.IdIndex()
+    src, dst, rel, weight, seen = list(), list(), list(), list(), list()
+    codes = dict()
+    for table, core, code, mask, w in _tableEdges(control, guarantee, moneyCollection):
+        if table not in codes:
+            codes[table] = ids.internMany([str(k) for k in core.ids.ids])
+            seen.append((table, codes[table]))
+        s, d = core.src, core.dst
+        if mask is not None:
+            s, d = s[mask], d[mask]
+        src.append(codes[table][s])
+        dst.append(codes[table][d])
+        rel.append(np.full(len(s), code, dtype=np.int8))
+        weight.append(w)
+    n = len(ids)
+    tables = np.zeros(n, dtype=np.uint8)
+    for table, c in seen:
+        tables[c] |= tableBits[table]
+    concat = lambda parts, dtype: np.concatenate(parts) if parts else np.zeros(0, dtype=dtype)
+    return graphCore.CompactGraph(
+        ids,
+        concat(src, np.int64),
+        concat(dst, np.int64),
+        nodeAttrs={"tables": tables},
+        edgeAttrs={
+            "relation": pd.Categorical.from_codes(concat(rel, np.int8), relations),
+            "weight": concat(weight, float),
+        },
+    )
+
+
+@instrument.timed("unified.ingest", counts=instrument.ofResult)
+def getUnifiedG(controlPath=None, guaranteePath=None, moneyCollectionPath=None, cores=None):
+    """
+    读取三张表的csv并合并为多关系图, 路径为None的表不读取
+    Params:
+        cores: 传入字典时, 读取的各表紧凑图按表名存入其中, 供单表的分析复用, 不必再次读取csv
+    Returns:
+        core: buildUnifiedCore的返回值
+    """
+    cores = dict() if cores is None else cores
+    if controlPath:
+        cores["control"] = control.getInitControlG(controlPath, compact=True)
+    if guaranteePath:
+        cores["guarantee"] = guarantee.getInitGuaranteeG(guaranteePath, compact=True)
+    if moneyCollectionPath:
+        cores["moneyCollection"] = moneyCollection.getInitmoneyCollectionG(moneyCollectionPath, compact=True)
+    core = buildUnifiedCore(**cores)
+    print("----------多关系图合并完成----------")
+    print("节点总数:", core.numberOfNodes())
+    for name, count in zip(relations, np.bincount(core.edgeAttrs["relation"].codes, minlength=len(relations))):
+        print("%s关系数:" % name, count)
+    return core
+
+
+def propagationEdges(core, channels=None):
+    """
+    风险传播所用的带权边, 即传播矩阵的坐标形式
+    每种关系先在接收方按权重归一化, 消除持股比例与金额之间量纲的差异,
+    再按关系的系数加权, 并按接收方所涉及关系的系数之和归一化, 使每个接收方的入边权重之和为1
+    Params:
+        core: buildUnifiedCore的返回值
+        channels: 关系名 -> (系数, 方向), 缺省的关系不传播, 为None时使用defaultChannels
+    Returns:
+        send, recv: 风险的来源和接收节点
+        weight: 边的权重
+    """
+    channels = defaultChannels if channels is None else channels
+    n = core.numberOfNodes()
+    rel = np.asarray(core.edgeAttrs["relation"].codes)
+    w = np.asarray(core.edgeAttrs["weight"], dtype=float)
+    sends, recvs, weights = list(), list(), list()
+    coefTotal = np.zeros(n)
+    for name, (coef, direction) in channels.items():
+        if coef <= 0:
+            continue
+        if direction not in ("forward", "reverse", "both"):
+            raise ValueError("未知的传播方向: %s" % direction)
+        mask = (rel == relations.index(name)) & (w > 0)
+        s, d, ww = core.src[mask], core.dst[mask], w[mask]
+        pairs = list()
+        if direction != "reverse":
+            pairs.append((s, d))
+        if direction != "forward":
+            pairs.append((d, s))
+        for a, b in pairs:
+            total = np.bincount(b, weights=ww, minlength=n)
+            sends.append(a)
+            recvs.append(b)
+            weights.append(coef * ww / total[b])
+            coefTotal[total > 0] += coef
+    if not sends:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    send, recv = np.concatenate(sends), np.concatenate(recvs)
+    return send, recv, np.concatenate(weights) / coefTotal[recv]
+
+
+def spmv(send, recv, weight, X, n):
+    """
+    稀疏矩阵乘以稠密矩阵: out[j] = sum(weight[e] * X[send[e]], recv[e] == j), 按边分块用bincount累加
+    Params:
+        send, recv, weight: propagationEdges的返回值
+        X: n行k列的矩阵
+        n: 节点总数
+    Returns:
+        out: n行k列的矩阵, 按列存储
+    """
+    out = np.zeros((n, X.shape[1]), order="F")
+    for start in range(0, len(send), edgeChunk):
+        s, r, w = send[start:start + edgeChunk], recv[start:start + edgeChunk], weight[start:start + edgeChunk]
+        for j in range(X.shape[1]):
+            out[:, j] += np.bincount(r, weights=w * X[s, j], minlength=n)
+    return out
+
+
+@instrument.timed("unified.propagate")
+def propagate(core, seeds, channels=None, damping=0.85, maxIter=200, tol=1e-6, edges=None):
+    """
+    沿多关系图迭代传播风险值, 直至收敛
+    每个节点的风险为其初值与各关系上邻居风险的加权平均的混合: s = (1 - damping) * s0 + damping * W s,
+    没有入边的节点保持初值; W每行之和为1, 因此每轮迭代的变化量至少缩小为damping倍
+    Params:
+        core: buildUnifiedCore的返回值
+        seeds: 初值, 长度为节点数的向量, 或n行k列的矩阵(k组初值一起传播)
+        channels: 同propagationEdges
+        damping: 邻居风险所占的比例, 需小于1
+        maxIter: 最多迭代的轮数
+        tol: 相邻两轮的最大变化量不超过tol乘以初值的最大绝对值时停止
+        edges: 预先计算的propagationEdges返回值, 多次传播时可复用
+    Returns:
+        scores: 与seeds形状相同的风险值
+        iterations: 实际迭代的轮数
+    """
+    if not 0 <= damping < 1:
+        raise ValueError("damping需在[0, 1)内")
+    n = core.numberOfNodes()
+    seeds = np.asarray(seeds, dtype=float)
+    S0 = np.asfortranarray(seeds.reshape(n, -1))
+    send, recv, weight = propagationEdges(core, channels) if edges is None else edges
+    isolated = np.bincount(recv, minlength=n) == 0
+    scale = max(np.abs(S0).max(initial=0.0), 1e-300)
+    S, iterations = S0.copy(order="F"), 0
+    for iterations in range(1, maxIter + 1):
+        nextS = (1 - damping) * S0 + damping * spmv(send, recv, weight, S, n)
+        nextS[isolated] = S0[isolated]
+        delta = np.abs(nextS - S).max(initial=0.0)
+        S = nextS
+        if delta <= tol * scale:
+            break
+    return S.reshape(seeds.shape), iterations
+
+
+def nodeValues(core, items):
+    """
+    把(公司ID, 值)对写入长度为节点数的向量, 不在图中的ID忽略
+    Params:
+        core: buildUnifiedCore的返回值
+        items: 可迭代的(公司ID, 值)对, 如担保关系图的G.nodes(data="m")
+    Returns:
+        values: float数组
+    """
+    values = np.zeros(core.numberOfNodes())
+    index = core.ids.index
+    for k, v in items:
+        i = index.get(str(k))
+        if i is not None and v is not None:
+            values[i] = v
+    return values
+
+
+def sharedControllers(core, groups, maxDepth=None, minMembers=2):
+    """
+    找出同一组企业(如一个担保圈)中被同一控制人控制的成员
+    从各成员出发沿持股关系逆向(由被持股方到持股方)做多源广度优先搜索, 记录每个上游企业可达的成员
+    Params:
+        core: buildUnifiedCore的返回值
+        groups: 企业ID集合的列表
+        maxDepth: 向上追溯的最大层数, 为None时不限
+        minMembers: 至少控制的成员数
+    Returns:
+        列表, 每项为{"group": 组的下标, "controller": 控制人ID, "members": 被其控制的成员ID列表}
+    """
+    n = core.numberOfNodes()
+    owned = np.asarray(core.edgeAttrs["relation"].codes) == relations.index("ownership")
+    holders, held = core.src[owned], core.dst[owned]
+    ptr, order = graphCore.buildCsr(held, n)
+    holders = holders[order]
+    index, ids = core.ids.index, core.ids.ids
+    found = list()
+    for g, group in enumerate(groups):
+        members = np.asarray([index[k] for k in map(str, group) if k in index], dtype=np.int64)
+        if len(members) < minMembers:
+            continue
+        # (上游节点, 成员下标)对, 编码为node * m + member
+        m = len(members)
+        visited = members * m + np.arange(m)
+        frontier = visited
+        depth = 0
+        while len(frontier) and (maxDepth is None or depth < maxDepth):
+            nodes, who = frontier // m, frontier % m
+            pos = graphCore.csrRanges(ptr, nodes)
+            counts = ptr[nodes + 1] - ptr[nodes]
+            frontier = np.unique(holders[pos] * m + np.repeat(who, counts))
+            frontier = frontier[~np.isin(frontier, visited)]
+            visited = np.union1d(visited, frontier)
+            depth += 1
+        nodes, who = visited // m, visited % m
+        # 成员自身不计入, 成员之间的持股关系仍会被找到
+        upstream = nodes != members[who]
+        nodes, who = nodes[upstream], who[upstream]
+        controllers, counts = np.unique(nodes, return_counts=True)
+        for c in controllers[counts >= minMembers].tolist():
+            found.append({
+                "group": g,
+                "controller": ids[c],
+                "members": [ids[i] for i in members[who[nodes == c]].tolist()],
+            })
+    return found
+
+
+def tableNames(mask):
+    """
+    将tables位掩码还原为表名列表
+    """
+    return [name for name, bit in tableBits.items() if mask & bit]
+
+
+def ansJson(core, seeds, scores, controllers, top=1000):
+    """
+    输出跨表分析的结果
+    Params:
+        core: buildUnifiedCore的返回值
+        seeds, scores: 风险的初值和传播后的值
+        controllers: sharedControllers的返回值
+        top: 输出风险值最高的节点数
+    Outputs:
+        jsonPath下的riskPropagation.json和circleControllers.json
+    """
+    os.makedirs(jsonPath, exist_ok=True)
+    order = np.argsort(-scores, kind="stable")[:top]
+    tables = core.nodeAttrs["tables"]
+    nodes = [
+        {"id": core.ids[i], "seed": seeds[i], "risk": scores[i], "tables": tableNames(tables[i])}
+        for i in order.tolist()
+    ]
+    with open(jsonPath + "riskPropagation.json", "w", encoding="utf-8") as f:
+        f.write(jsonWriter.dumps({"nodes": nodes}))
+    with open(jsonPath + "circleControllers.json", "w", encoding="utf-8") as f:
+        f.write(jsonWriter.dumps({"circles": controllers}))
+    print("存储风险传播结果的节点数量:", len(nodes))
+    print("存在共同控制人的担保圈数量:", len({item["group"] for item in controllers}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="合并三张表的多关系图上的风险传播和共同控制人识别")
+    parser.add_argument("--control", default="./backend/res/control.csv", help="控制人表")
+    parser.add_argument("--guarantee", default="./backend/res/guarantee.csv", help="担保关系表")
+    parser.add_argument("--money-collection", default="./backend/res/moneyCollection.csv", help="资金归集表")
+    parser.add_argument("--damping", type=float, default=0.85, help="邻居风险所占的比例")
+    parser.add_argument("--max-depth", type=int, default=None, help="追溯控制人的最大层数")
+    parser.add_argument("--top", type=int, default=1000, help="输出风险值最高的节点数")
+    parser.add_argument("--out", default=jsonPath, help="输出目录")
+    parser.add_argument("--report", default=None, help="输出各阶段耗时和内存的报告, 见main.py")
+    args = parser.parse_args()
+    jsonPath = os.path.join(args.out, "")
+    if args.report:
+        instrument.enable()
+
+    cores = dict()
+    core = getUnifiedG(args.control, args.guarantee, args.money_collection, cores)
+    # 担保关系的风险值m作为传播的初值, 担保圈作为寻找共同控制人的分组, 均在已读入的紧凑图上计算
+    guaranteeCore = cores["guarantee"]
+    m = guarantee.quantifyCore(guaranteeCore, guaranteeCore.componentLabels())
+    seeds = nodeValues(core, zip(guaranteeCore.ids.ids, m.tolist()))
+    circles = guarantee.coreCircles(guaranteeCore)
+    scores, iterations = propagate(core, seeds, damping=args.damping)
+    print("风险传播迭代轮数:", iterations)
+    controllers = sharedControllers(core, circles, args.max_depth)
+    ansJson(core, seeds, scores, controllers, args.top)
+
+    if args.report:
+        instrument.summary()
+        instrument.writeReport(args.report)